@@ -1,19 +1,75 @@
 import streamlit as st
-from PIL import Image
-import os
-import sys
-from io import StringIO
 import contextlib
+import logging
+import threading
+import time
 
-# Ajoute le répertoire courant au path Python
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Le pipeline (et le SDK Mistral) n'est importé qu'au premier mème, dans load_pipeline :
+# streamlit run ajoute déjà ce répertoire au path et chaque relance du script reste légère.
 
-# Capture des prints pour les logs
+# Profils d'encodage : le premier est affiché, "archive" est proposé au téléchargement
+PROFILES = ("chat", "archive")
+
+
+class SessionLogHandler(logging.Handler):
+    """
+    Journaux d'une seule session.
+
+    Streamlit exécute le script de chaque session dans son propre thread : seuls
+    les enregistrements émis par ce thread sont gardés, les générations
+    simultanées d'autres utilisateurs n'apparaissent pas.
+    """
+
+    def __init__(self, level: int = logging.INFO):
+        super().__init__(level)
+        self.thread_id = threading.get_ident()
+        self.start = time.time()
+        self.records = []
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.thread == self.thread_id and super().filter(record)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append({
+            "t (s)": round(record.created - self.start, 3),
+            "niveau": record.levelname,
+            "module": record.name,
+            "message": record.getMessage(),
+        })
+
+
+# Capture des journaux du générateur (loggers "src.*") émis par cette session
 @contextlib.contextmanager
 def capture_logs():
-    log_output = StringIO()
-    with contextlib.redirect_stdout(log_output):
-        yield log_output
+    handler = SessionLogHandler()
+    logger = logging.getLogger("src")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    try:
+        yield handler.records
+    finally:
+        logger.removeHandler(handler)
+
+
+@st.cache_resource(show_spinner="Chargement du générateur...")
+def load_pipeline():
+    """Pipeline partagé par toutes les sessions, préchauffé une seule fois par processus."""
+    from src.pipeline import get_pipeline
+    return get_pipeline().warm_up()
+
+
+def show_result(result, caption=None, key=None):
+    """Affiche l'encodage déjà prêt (sans réencoder l'image) et propose l'archive au téléchargement."""
+    download = result.encodings["archive"]
+    st.image(result.data.tobytes(), caption=caption, use_container_width=True)
+    st.download_button(
+        label="Télécharger",
+        data=download.data.tobytes(),
+        file_name=f"{result.filename}.{download.extension}",
+        mime=download.mime_type,
+        key=key,
+    )
+
 
 # Configuration de la page
 st.set_page_config(
@@ -33,44 +89,68 @@ prompt = st.text_input(
     key="prompt_input"
 )
 
+# Nouvelle blague : ignore les réponses déjà en cache pour ce prompt
+fresh = st.checkbox("Nouvelle blague (ignorer le cache)", key="fresh_input")
+
+# Plusieurs captions pour le même template, au choix
+variants = st.slider("Nombre de propositions", min_value=1, max_value=5, value=1, key="variants_input")
+
 # Bouton de génération
 if st.button("Générer le mème", type="primary"):
     if prompt:
-        with st.spinner("Génération du mème en cours..."):
-            try:
-                # Import ici pour éviter les problèmes de path
-                from src.meme_finalizer import MemeFinalizer
-                
-                # Capture des logs
-                with capture_logs() as logs:
-                    # Génération du mème
-                    finalizer = MemeFinalizer()
-                    meme_path = finalizer.create_meme(prompt)
-                
-                # Charger et afficher l'image
-                meme_image = Image.open(meme_path)
-                st.image(meme_image, caption="Votre mème généré", use_container_width=True)
-                
-                # Message de succès et bouton de téléchargement après l'image
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    st.success("Mème généré avec succès !")
-                with col2:
-                    with open(meme_path, "rb") as file:
-                        st.download_button(
-                            label="Télécharger",
-                            data=file,
-                            file_name=os.path.basename(meme_path),
-                            mime="image/jpeg"
-                        )
-                
-                # Logs dans un expander en bas
-                with st.expander("Voir les détails de génération", expanded=False):
-                    st.code(logs.getvalue())
-                    
-            except Exception as e:
-                st.error(f"Erreur lors de la génération du mème : {str(e)}")
-                with st.expander("Voir les détails de l'erreur", expanded=True):
-                    st.code(str(e))
+        pipeline = load_pipeline()
+        status = st.status("Choix du mème...", expanded=True)
+        # Emplacements remplis au fil des étapes : aperçu du template, captions, puis image finale
+        preview = status.empty()
+        captions = status.empty()
+        images = st.empty()
+        written = []
+
+        def progress(stage, data):
+            """Affiche chaque étape dès qu'elle est terminée."""
+            if stage == "template":
+                preview.image(data["path"], caption=f"Template : {data['meme_id']}", width=240)
+                status.update(label="Écriture des captions...")
+            elif stage == "caption":
+                # Chaque caption s'affiche dès qu'elle est écrite, pendant que le LLM continue
+                written.append(data["text"])
+                captions.markdown(f"- {' / '.join(written)} ✍️")
+            elif stage == "captions_reset":
+                # Réponse invalide : les captions déjà affichées sont retirées
+                written.clear()
+                captions.empty()
+            elif stage == "captions":
+                texts = data.get("variants") or [data["texts"]]
+                captions.markdown("\n".join(f"- {' / '.join(proposal)}" for proposal in texts))
+                status.update(label="Rendu de l'image...")
+
+        try:
+            with capture_logs() as logs:
+                # Génération en mémoire avec le pipeline partagé
+                if variants > 1:
+                    results = pipeline.render_variants(prompt, n=variants, fresh=fresh, profiles=PROFILES, progress=progress)
+                else:
+                    results = [pipeline.render_meme(prompt, fresh=fresh, profiles=PROFILES, progress=progress)]
+            status.update(label="Mème généré avec succès !", state="complete", expanded=False)
+
+            with images.container():
+                if len(results) == 1:
+                    show_result(results[0], caption="Votre mème généré")
+                else:
+                    # Une colonne par proposition, chacune téléchargeable
+                    st.success(f"{len(results)} propositions générées !")
+                    for column, result in zip(st.columns(len(results)), results):
+                        with column:
+                            show_result(result, key=f"download_{result.filename}")
+
+            # Logs dans un expander en bas
+            with st.expander("Voir les détails de génération", expanded=False):
+                st.dataframe(logs, use_container_width=True, hide_index=True)
+
+        except Exception as e:
+            status.update(label="Échec de la génération", state="error")
+            st.error(f"Erreur lors de la génération du mème : {str(e)}")
+            with st.expander("Voir les détails de l'erreur", expanded=True):
+                st.code(str(e))
     else:
-        st.warning("Veuillez entrer une description pour générer un mème.")
\ No newline at end of file
+        st.warning("Veuillez entrer une description pour générer un mème.")
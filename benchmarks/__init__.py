@@ -0,0 +1,3 @@
+"""
+Benchmarks du générateur de mèmes.
+"""
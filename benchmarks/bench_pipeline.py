@@ -0,0 +1,374 @@
+"""
+Benchmark hors ligne du pipeline complet, avec un faux client Mistral.
+
+Mesure la durée d'import des points d'entrée dans un interpréteur neuf (démarrage
+à froid d'un worker), le débit et les percentiles de latence de `create_meme` à plusieurs
+niveaux de concurrence (latence de l'API simulée, aucun appel payant), puis
+des micro-benchmarks du calcul de la taille de police, de l'ajout du texte et
+de l'encodage suivi du stockage sur chaque template de data/img. Les résultats sont écrits en
+JSON et deux fichiers peuvent être comparés.
+
+Usage :
+    MEME_FONT_PATH=/chemin/police.ttf python -m benchmarks.bench_pipeline --output avant.json
+    MEME_FONT_PATH=/chemin/police.ttf python -m benchmarks.bench_pipeline --output apres.json --compare avant.json
+    python -m benchmarks.bench_pipeline --compare avant.json apres.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.fake_mistral import FakeMistral
+from src.caption_generator import CaptionGenerator
+from src.llm import CallPolicy
+from src.meme_finalizer import MemeFinalizer
+from src.catalog import load_memes
+from src.meme_selector import MemeSelector
+from src.metrics import LLM_QUEUE_WAIT, STAGE_SECONDS
+from src.output_store import OutputStore, render_key
+from src.rate_limiter import LANES, RateLimiter, RateLimits, set_limiter
+from utils.image_utils import encode_image
+
+CAPTION = "When you push to prod on Friday"
+PROMPTS = (
+    "quand tu pushes en prod un vendredi",
+    "when the build is green on the first try",
+    "moi qui relis mon code de l'an dernier",
+    "when the meeting could have been an email",
+    "quand le café de la machine est gratuit",
+    "when the tests pass locally but not in CI",
+    "le lundi matin après un long week-end",
+    "when someone says it works on my machine",
+)
+# Écart relatif au-delà duquel une mesure est signalée comme régression
+DEFAULT_THRESHOLD = 0.10
+# Modules dont l'import est mesuré à froid (un module absent de l'environnement est ignoré)
+IMPORT_MODULES = ("src.pipeline", "src.meme_finalizer", "src.batch", "endpoint")
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def _summary(samples_ms: List[float]) -> Dict[str, float]:
+    """Percentiles et moyenne d'une série de durées en millisecondes."""
+    samples = np.asarray(samples_ms)
+    return {
+        "count": int(samples.size),
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p90_ms": round(float(np.percentile(samples, 90)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "max_ms": round(float(samples.max()), 3),
+    }
+
+
+def _time(func: Callable, repeat: int) -> List[float]:
+    """Durées de repeat appels, en millisecondes."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _git_revision() -> Optional[str]:
+    """Le commit courant, pour situer les résultats."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_imports(modules: Sequence[str], repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Durée d'import de chaque module, chacune dans un nouvel interpréteur.
+
+    Args:
+        modules (Sequence[str]): Les modules à importer
+        repeat (int): Mesures par module
+
+    Returns:
+        Dict[str, Dict[str, float]]: Les percentiles par module
+    """
+    results = {}
+    for module in modules:
+        samples = []
+        for _ in range(repeat):
+            completed = subprocess.run(
+                [sys.executable, "-c", IMPORT_SCRIPT.format(module=module)], capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                break
+            samples.append(float(completed.stdout.strip().splitlines()[-1]) * 1000)
+        if not samples:
+            print(f"import {module:24} ignoré ({completed.stderr.strip().splitlines()[-1]})")
+            continue
+        results[module] = _summary(samples)
+        print(f"import {module:24} {results[module]['p50_ms']:8.1f}ms")
+    return results
+
+
+def build_finalizer(
+    latency: float, jitter: float, seed: int = 0, limits: Optional[RateLimits] = None
+) -> MemeFinalizer:
+    """
+    Construit un finaliseur branché sur le faux client, sans cache de réponses.
+
+    Args:
+        latency (float): Latence simulée de chaque appel, en secondes
+        jitter (float): Variation maximale de la latence, en secondes
+        seed (int): Graine de la variation
+        limits (RateLimits, optional): Quota du limiteur d'appels (aucune limite si absent,
+            pour que les mesures ne dépendent pas de MISTRAL_RPS)
+
+    Returns:
+        MemeFinalizer: Le finaliseur
+    """
+    set_limiter(RateLimiter(limits))
+    client = FakeMistral(latency=latency, jitter=jitter, seed=seed)
+    policy = CallPolicy(deadline=max(30.0, latency * 10), max_retries=0)
+    return MemeFinalizer(
+        selector=MemeSelector(client=client, memes=load_memes(), policy=policy),
+        caption_generator=CaptionGenerator(client=client, policy=policy),
+    )
+
+
+def bench_end_to_end(
+    finalizer: MemeFinalizer, concurrency_levels: List[int], requests: int, mode: str, working: bool
+) -> Dict[str, Dict]:
+    """
+    Débit et latence de create_meme à chaque niveau de concurrence.
+
+    Args:
+        finalizer (MemeFinalizer): Le finaliseur branché sur le faux client
+        concurrency_levels (List[int]): Les nombres d'appels simultanés à mesurer
+        requests (int): Le nombre de mèmes par niveau
+        mode (str): "separate" ou "combined"
+        working (bool): Partir des copies réduites des templates
+
+    Returns:
+        Dict[str, Dict]: Par niveau ("c1", "c4"...), percentiles et débit
+    """
+    # Premier passage hors mesure : décodage des templates et préparation des polices
+    finalizer.preload(finalizer.selector.memes.keys())
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for concurrency in concurrency_levels:
+            prompts = [PROMPTS[i % len(PROMPTS)] for i in range(requests)]
+
+            def run(prompt: str) -> float:
+                start = time.perf_counter()
+                finalizer.create_meme(prompt, output_dir=output_dir, mode=mode, working=working)
+                return (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                latencies = list(pool.map(run, prompts))
+            elapsed = time.perf_counter() - start
+            level = results[f"c{concurrency}"] = {
+                "concurrency": concurrency,
+                **_summary(latencies),
+                "throughput_per_s": round(requests / elapsed, 3),
+            }
+            print(f"concurrence {concurrency:>3} : {level['throughput_per_s']:7.2f} mèmes/s, "
+                  f"p50 {level['p50_ms']:8.1f}ms, p99 {level['p99_ms']:8.1f}ms", file=sys.stderr)
+    return results
+
+
+def bench_templates(finalizer: MemeFinalizer, repeat: int) -> Dict[str, Dict[str, Dict]]:
+    """
+    Micro-benchmarks du rendu sur chaque template de data/img.
+
+    Args:
+        finalizer (MemeFinalizer): Le finaliseur (seuls la police et le rendu servent)
+        repeat (int): Le nombre de mesures par template
+
+    Returns:
+        Dict[str, Dict[str, Dict]]: Par opération, les percentiles de chaque template
+            et un total sur l'ensemble des templates
+    """
+    operations = {"font_size": {}, "add_text": {}, "save": {}}
+    totals = {name: [] for name in operations}
+    with tempfile.TemporaryDirectory() as output_dir:
+        store = OutputStore(output_dir)
+        for path in sorted(glob.glob(os.path.join(finalizer.meme_dir, "*"))):
+            try:
+                with Image.open(path) as source:
+                    template = source.convert("RGB")
+            except OSError:
+                continue
+            name = os.path.basename(path)
+            # Le calcul de taille est mémorisé : seul le premier appel mesure la recherche
+            samples = {
+                "font_size": _time(lambda: finalizer._calculate_optimal_font_size(template, CAPTION), repeat),
+                "add_text": _time(lambda: finalizer._add_text_to_image(template.copy(), CAPTION), repeat),
+                "save": _time(lambda: store.put(render_key({"template": name}), encode_image(template).getbuffer()), repeat),
+            }
+            for operation, values in samples.items():
+                operations[operation][name] = _summary(values)
+                totals[operation].append(float(np.median(values)))
+            print(f"{name:32} police {operations['font_size'][name]['p50_ms']:7.2f}ms  "
+                  f"texte {operations['add_text'][name]['p50_ms']:7.1f}ms  "
+                  f"sauvegarde {operations['save'][name]['p50_ms']:7.1f}ms", file=sys.stderr)
+    for operation, medians in totals.items():
+        if medians:
+            operations[operation]["total"] = {"sum_of_p50_ms": round(sum(medians), 3)}
+    return operations
+
+
+def _stage_means() -> Dict[str, float]:
+    """Durée moyenne de chaque étape relevée par src.metrics pendant les mesures."""
+    stages = {}
+    for _, labels, _ in STAGE_SECONDS.samples():
+        stage = labels["stage"]
+        if stage not in stages:
+            stages[stage] = round(STAGE_SECONDS.summary(stage=stage)["mean"] * 1000, 3)
+    return stages
+
+
+def _queue_wait_means() -> Dict[str, float]:
+    """Attente moyenne d'un créneau du limiteur, par file."""
+    return {
+        lane: round(LLM_QUEUE_WAIT.summary(lane=lane)["mean"] * 1000, 3)
+        for lane in LANES
+        if LLM_QUEUE_WAIT.summary(lane=lane)["count"]
+    }
+
+
+def _flatten(data: Dict, prefix: str = "") -> Dict[str, float]:
+    """Mesures numériques à plat ("end_to_end.c4.p50_ms": ...), hors métadonnées."""
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in ("count", "concurrency"):
+            flat[path] = value
+    return flat
+
+
+def compare(before: Dict, after: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    Compare deux résultats et affiche l'écart de chaque mesure.
+
+    Pour le débit, plus haut est mieux ; pour les durées, plus bas est mieux.
+
+    Args:
+        before (Dict): Les résultats de référence
+        after (Dict): Les nouveaux résultats
+        threshold (float): L'écart relatif signalé comme régression
+
+    Returns:
+        List[str]: Les mesures en régression
+    """
+    before_flat = _flatten({k: v for k, v in before.items() if k != "meta"})
+    after_flat = _flatten({k: v for k, v in after.items() if k != "meta"})
+    regressions = []
+    print(f"{'mesure':60} {'avant':>10} {'après':>10} {'écart':>8}")
+    for key in sorted(before_flat.keys() & after_flat.keys()):
+        old, new = before_flat[key], after_flat[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if key.endswith("throughput_per_s") else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(key)
+            flag = "  régression"
+        elif worse < -threshold:
+            flag = "  gain"
+        print(f"{key:60} {old:10.2f} {new:10.2f} {change:+7.1%}{flag}")
+    return regressions
+
+
+def run(args: argparse.Namespace) -> Dict:
+    """Lance toutes les mesures et renvoie les résultats."""
+    limits = RateLimits(args.rps, args.tpm, args.llm_concurrency)
+    finalizer = build_finalizer(args.latency, args.jitter, limits=limits)
+    results = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "latency_s": args.latency,
+            "jitter_s": args.jitter,
+            "requests": args.requests,
+            "repeat": args.repeat,
+            "mode": args.mode,
+            "working": args.working,
+            "rate_limits": vars(limits),
+        },
+    }
+    if not args.skip_imports:
+        results["import_ms"] = bench_imports(IMPORT_MODULES, args.repeat)
+    if not args.skip_end_to_end:
+        results["end_to_end"] = bench_end_to_end(
+            finalizer, args.concurrency, args.requests, args.mode, args.working
+        )
+        results["stages_mean_ms"] = _stage_means()
+        results["llm_queue_wait_mean_ms"] = _queue_wait_means()
+    if not args.skip_templates:
+        results["templates"] = bench_templates(finalizer, args.repeat)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée en ligne de commande."""
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne du générateur de mèmes (faux client Mistral).")
+    parser.add_argument("--output", help="Fichier JSON des résultats (benchmarks/results/<date>.json par défaut)")
+    parser.add_argument("--compare", nargs="+", metavar="JSON",
+                        help="Référence à comparer aux nouveaux résultats, ou deux fichiers à comparer sans mesurer")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Écart relatif signalé (0.10 = 10 %%)")
+    parser.add_argument("--latency", type=float, default=0.3, help="Latence simulée de l'API, en secondes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variation de la latence, en secondes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Niveaux de concurrence")
+    parser.add_argument("--requests", type=int, default=32, help="Mèmes générés par niveau de concurrence")
+    parser.add_argument("--repeat", type=int, default=5, help="Mesures par template pour les micro-benchmarks")
+    parser.add_argument("--mode", choices=("separate", "combined"), default="separate")
+    parser.add_argument("--working", action="store_true", help="Partir des copies réduites des templates")
+    parser.add_argument("--rps", type=float, help="Requêtes par seconde du limiteur d'appels (sans limite par défaut)")
+    parser.add_argument("--tpm", type=int, help="Tokens par minute du limiteur d'appels")
+    parser.add_argument("--llm-concurrency", type=int, help="Appels simultanés du limiteur d'appels")
+    parser.add_argument("--skip-imports", action="store_true", help="Sans la mesure des imports")
+    parser.add_argument("--skip-end-to-end", action="store_true", help="Seulement les micro-benchmarks")
+    parser.add_argument("--skip-templates", action="store_true", help="Seulement le pipeline complet")
+    args = parser.parse_args(argv)
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0], encoding="utf-8") as f:
+            before = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            after = json.load(f)
+        return 1 if compare(before, after, args.threshold) else 0
+
+    results = run(args)
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Résultats : {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            return 1 if compare(json.load(f), results, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Benchmark du rendu des captions : boucles draw.text historiques contre le
+rendu en une passe de utils.text_renderer, sur chaque template de data/img.
+
+Usage :
+    MEME_FONT_PATH=/chemin/police.ttf python -m benchmarks.bench_text_render
+"""
+import glob
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from src.meme_finalizer import MemeFinalizer
+from utils.text_renderer import draw_caption, outline_size_for, shadow_offset_for
+
+CAPTION = "When you push to prod on Friday"
+
+
+def legacy_draw_caption(image, position, text, font, font_size):
+    """Rendu historique : un draw.text par décalage de l'ombre et du contour."""
+    draw = ImageDraw.Draw(image)
+    x, y = position
+    shadow_offset = shadow_offset_for(font_size)
+    for offset_x in range(shadow_offset, shadow_offset * 2):
+        for offset_y in range(shadow_offset, shadow_offset * 2):
+            draw.text((x + offset_x, y + offset_y), text, font=font, fill=(0, 0, 0, 180))
+    outline_size = outline_size_for(font_size)
+    for offset_x in range(-outline_size, outline_size + 1):
+        for offset_y in range(-outline_size, outline_size + 1):
+            if abs(offset_x) + abs(offset_y) <= outline_size + 1:
+                draw.text((x + offset_x, y + offset_y), text, font=font, fill="black")
+    draw.text((x, y), text, font=font, fill="white")
+    return image
+
+
+def _time(func, repeat):
+    """Durée médiane d'un appel, en millisecondes."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main(repeat: int = 5):
+    finalizer = MemeFinalizer()
+    print(f"{'template':32} {'taille':>11} {'police':>6} {'avant':>9} {'après':>9} {'gain':>6} {'écart max':>9}")
+    for path in sorted(glob.glob(os.path.join(finalizer.meme_dir, "*"))):
+        template = Image.open(path).convert("RGB")
+        font_size = finalizer._calculate_optimal_font_size(template, CAPTION)
+        font = finalizer._load_font(font_size)
+        position = finalizer._get_text_position(template, CAPTION, font)
+
+        legacy_ms = _time(lambda: legacy_draw_caption(template.copy(), position, CAPTION, font, font_size), repeat)
+        fast_ms = _time(lambda: draw_caption(
+            template.copy(), position, CAPTION, font,
+            outline_size_for(font_size), shadow_offset_for(font_size),
+        ), repeat)
+
+        reference = np.asarray(legacy_draw_caption(template.copy(), position, CAPTION, font, font_size), dtype=np.int16)
+        rendered = np.asarray(draw_caption(
+            template.copy(), position, CAPTION, font,
+            outline_size_for(font_size), shadow_offset_for(font_size),
+        ), dtype=np.int16)
+        max_diff = int(np.abs(reference - rendered).max())
+
+        size = f"{template.width}x{template.height}"
+        print(f"{os.path.basename(path):32} {size:>11} {font_size:>6} {legacy_ms:8.1f}ms {fast_ms:8.1f}ms "
+              f"{legacy_ms / fast_ms:5.1f}x {max_diff:>9}")
+
+
+if __name__ == "__main__":
+    main()
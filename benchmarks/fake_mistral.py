@@ -0,0 +1,194 @@
+"""
+Faux client Mistral pour les benchmarks : aucune requête réseau, réponses déterministes.
+
+Il expose `chat.complete`, `chat.complete_async`, `chat.stream` et
+`chat.stream_async` comme le vrai client et
+reconnaît les requêtes du sélecteur et du générateur de captions d'après leur
+prompt (sélection, captions, variantes, mode combiné). Le mème choisi et les
+textes ne dépendent que du prompt utilisateur : deux exécutions produisent
+exactement les mêmes mèmes.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import types
+from typing import Dict, List, Optional
+
+from src.caption_generator import CAPTION_COUNTS
+
+# Lignes "- id: description (format: xxx)" des prompts de sélection
+_CANDIDATE = re.compile(r"^- ([^\s:]+): .*\(format: (\w+)\)$", re.MULTILINE)
+_USER_PROMPT = re.compile(r'(?:Prompt utilisateur|User prompt): "(.*)"')
+_FORMAT = re.compile(r"^- Format: (\w+)$", re.MULTILINE)
+_VARIANTS = re.compile(r"Generate EXACTLY (\d+) different alternatives")
+# Réponses en flux : part de la latence avant le premier morceau, et taille des morceaux (≈ un token)
+FIRST_CHUNK_SHARE = 0.4
+CHUNK_CHARS = 4
+
+
+def _digest(text: str) -> int:
+    """Empreinte stable d'un texte (hash() varie d'un processus à l'autre)."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _response(content: str, request: Dict) -> types.SimpleNamespace:
+    """Réponse au format de chat.complete, avec un décompte approximatif des tokens."""
+    prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+    return types.SimpleNamespace(
+        model=request.get("model"),
+        choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))],
+        usage=types.SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=max(1, len(content) // 4),
+            total_tokens=prompt_tokens + max(1, len(content) // 4),
+        ),
+    )
+
+
+def _stream_events(response: types.SimpleNamespace) -> List[types.SimpleNamespace]:
+    """Découpe une réponse en événements de chat.stream ; le dernier porte l'usage."""
+    content = response.choices[0].message.content
+    pieces = [content[i:i + CHUNK_CHARS] for i in range(0, len(content), CHUNK_CHARS)] or [""]
+    events = []
+    for i, piece in enumerate(pieces):
+        last = i == len(pieces) - 1
+        choice = types.SimpleNamespace(delta=types.SimpleNamespace(content=piece), finish_reason="stop" if last else None)
+        events.append(types.SimpleNamespace(data=types.SimpleNamespace(
+            model=response.model, choices=[choice], usage=response.usage if last else None,
+        )))
+    return events
+
+
+class _FakeStream:
+    """Flux de chat.stream : itérable (sync ou async) et gestionnaire de contexte, comme EventStream."""
+
+    def __init__(self, response: types.SimpleNamespace, delay: float):
+        self._events = _stream_events(response)
+        rest = delay * (1 - FIRST_CHUNK_SHARE) / max(1, len(self._events) - 1)
+        self._waits = [delay * FIRST_CHUNK_SHARE] + [rest] * (len(self._events) - 1)
+        self._index = 0
+
+    def __enter__(self) -> "_FakeStream":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._index = len(self._events)
+
+    def __iter__(self) -> "_FakeStream":
+        return self
+
+    def __next__(self) -> types.SimpleNamespace:
+        if self._index >= len(self._events):
+            raise StopIteration
+        time.sleep(self._waits[self._index])
+        self._index += 1
+        return self._events[self._index - 1]
+
+    async def __aenter__(self) -> "_FakeStream":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._index = len(self._events)
+
+    def __aiter__(self) -> "_FakeStream":
+        return self
+
+    async def __anext__(self) -> types.SimpleNamespace:
+        if self._index >= len(self._events):
+            raise StopAsyncIteration
+        await asyncio.sleep(self._waits[self._index])
+        self._index += 1
+        return self._events[self._index - 1]
+
+
+class _FakeChat:
+    def __init__(self, client: "FakeMistral"):
+        self._client = client
+
+    def complete(self, timeout_ms: Optional[int] = None, **request) -> types.SimpleNamespace:
+        """Version synchrone : attend la latence simulée puis répond."""
+        time.sleep(self._client.delay())
+        return self._client.answer(request)
+
+    async def complete_async(self, timeout_ms: Optional[int] = None, **request) -> types.SimpleNamespace:
+        """Version asynchrone : attend sans bloquer la boucle puis répond."""
+        await asyncio.sleep(self._client.delay())
+        return self._client.answer(request)
+
+    def stream(self, timeout_ms: Optional[int] = None, **request) -> _FakeStream:
+        """Version en flux : la même latence totale, répartie sur les morceaux de la réponse."""
+        return _FakeStream(self._client.answer(request), self._client.delay())
+
+    async def stream_async(self, timeout_ms: Optional[int] = None, **request) -> _FakeStream:
+        """Version en flux asynchrone (le flux se lit avec async for)."""
+        return _FakeStream(self._client.answer(request), self._client.delay())
+
+
+class FakeMistral:
+    def __init__(self, latency: float = 0.3, jitter: float = 0.0, seed: int = 0):
+        """
+        Initialise le faux client.
+
+        Args:
+            latency (float): Latence simulée de chaque appel, en secondes
+            jitter (float): Variation maximale autour de la latence, en secondes
+            seed (int): Graine du tirage de la variation (reproductible)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.chat = _FakeChat(self)
+
+    def delay(self) -> float:
+        """Latence du prochain appel."""
+        with self._lock:
+            self.calls += 1
+            if not self.jitter:
+                return self.latency
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    @staticmethod
+    def _texts(user_prompt: str, meme_format: str, salt: int = 0) -> List[str]:
+        """Captions déterministes, autant que le format en attend."""
+        words = user_prompt.split()[:5] or ["nothing"]
+        count = CAPTION_COUNTS.get(meme_format, 1)
+        return [f"When {' '.join(words)} #{salt * count + i + 1}" for i in range(count)]
+
+    def answer(self, request: Dict) -> types.SimpleNamespace:
+        """
+        Construit la réponse à une requête du sélecteur ou du générateur.
+
+        Args:
+            request (Dict): Les paramètres passés à chat.complete
+
+        Returns:
+            SimpleNamespace: Une réponse avec choices[0].message.content et usage
+        """
+        content = request["messages"][-1]["content"]
+        match = _USER_PROMPT.search(content)
+        user_prompt = match.group(1) if match else content[:80]
+        candidates = _CANDIDATE.findall(content)
+
+        if candidates:
+            meme_id, meme_format = candidates[_digest(user_prompt) % len(candidates)]
+            if request.get("response_format"):
+                # Mode combiné : le mème et ses textes en JSON
+                answer = json.dumps({"meme_id": meme_id, "texts": self._texts(user_prompt, meme_format)})
+            else:
+                answer = meme_id
+            return _response(answer, request)
+
+        format_match = _FORMAT.search(content)
+        meme_format = format_match.group(1) if format_match else "single_caption"
+        variants = _VARIANTS.search(content)
+        if variants:
+            answer = {"variants": [self._texts(user_prompt, meme_format, i) for i in range(int(variants.group(1)))]}
+        else:
+            answer = {"texts": self._texts(user_prompt, meme_format)}
+        return _response(json.dumps(answer), request)
@@ -1,66 +1,171 @@
 from fastapi import FastAPI, Form
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
-from src.main import generate_meme
+from fastapi.responses import PlainTextResponse
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Optional
+from src.pipeline import get_pipeline
+from src.job_queue import JobQueue, MemeJob, QueueFullError
+from src.llm import load_env
+from src.metrics import register_callback, render_metrics, timed
+import asyncio
+import httpx
+import logging
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+if TYPE_CHECKING:
+    from slack_sdk import WebClient
 
-app = FastAPI()
-SLACK_BOT_TOKEN = os.environ["SLACK_BOT_TOKEN"]
-slack_client = WebClient(token=SLACK_BOT_TOKEN)
+load_env()
+logging.basicConfig(level=os.environ.get("MEME_LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
 
-@app.post("/")
-async def meme_slash_command(
-    text: str = Form(...),
-    response_url: str = Form(...),
-    channel_id: str = Form(...)
-):
+# Profil d'encodage des mèmes envoyés (voir utils.image_utils.PROFILES) : "webp" ou "avif" allègent encore l'envoi
+MEME_SLACK_PROFILE = os.environ.get("MEME_SLACK_PROFILE", "chat")
+_http_client: Optional[httpx.AsyncClient] = None
+_slack_client: Optional["WebClient"] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Client HTTP des réponses à Slack, construit au premier usage : un worker forké ne reprend pas celui du parent."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=10)
+    return _http_client
+
+
+def get_slack_client() -> "WebClient":
+    """Client Slack, construit au premier envoi : SLACK_BOT_TOKEN n'est requis qu'à ce moment."""
+    global _slack_client
+    if _slack_client is None:
+        from slack_sdk import WebClient
+        _slack_client = WebClient(token=os.environ["SLACK_BOT_TOKEN"])
+    return _slack_client
+
+
+async def reply(job: MemeJob, text: str) -> None:
+    """Répond à l'utilisateur via la response_url de la commande (message éphémère)."""
     try:
-        # Réponse immédiate à Slack
-        slack_client.chat_postMessage(
-            channel=channel_id,
-            text="🎭 Génération du mème en cours..."
-        )
+        await get_http_client().post(job.response_url, json={"response_type": "ephemeral", "text": text})
+    except httpx.HTTPError as e:
+        logger.error(f"Erreur lors de la réponse à Slack: {str(e)}")
+
+
+async def process_job(job: MemeJob) -> None:
+    """Génère le mème d'un job puis l'envoie dans le canal."""
+    from slack_sdk.errors import SlackApiError
+
+    updates = []
+    chosen = {}
+
+    def progress(stage: str, data: dict) -> None:
+        # Le mème choisi puis ses captions, annoncés sans attendre le rendu (depuis la boucle, sans bloquer)
+        if stage == "template":
+            chosen["meme_id"] = data["meme_id"]
+            updates.append(asyncio.ensure_future(reply(job, f"🖼️ Template choisi : *{data['meme_id']}*, écriture des captions...")))
+        elif stage == "captions":
+            texts = " / ".join(data["texts"])
+            updates.append(asyncio.ensure_future(reply(job, f"✍️ « {texts} » — rendu de *{chosen.get('meme_id', '?')}* en cours...")))
 
-        # Génération du mème
-        meme_path = generate_meme(text)
+    try:
+        # Appels Mistral asynchrones, rendu dans le pool de la file
+        # Copie réduite du template et profil "chat" : suffisants pour Slack et plus rapides à envoyer
+        result = await get_pipeline().render_meme_async(
+            job.text, working=True, executor=queue.executor, fresh=job.fresh, profiles=(MEME_SLACK_PROFILE,),
+            progress=progress,
+        )
+        # Les messages de progression partent avant la réponse finale
+        await asyncio.gather(*updates)
 
-        # Upload du fichier via Slack SDK v2
+        # Upload du tampon en mémoire via Slack SDK v2, hors de la boucle d'événements
         try:
-            slack_client.files_upload_v2(
-                channel=channel_id,
-                initial_comment=f"🎭 Mème généré pour: *{text}*",
-                file=meme_path
-            )
+            with timed("slack_upload"):
+                await asyncio.to_thread(
+                    get_slack_client().files_upload_v2,
+                    channel=job.channel_id,
+                    initial_comment=f"🎭 Mème généré pour: *{job.text}*",
+                    file=result.buffer,
+                    filename=f"{result.filename}.{result.extension}"
+                )
         except SlackApiError as e:
             error = e.response["error"]
-            print(f"Erreur Slack API: {e.response}")
+            logger.error(f"Erreur Slack API: {e.response}")
             if error == "not_in_channel":
-                slack_client.chat_postEphemeral(
-                    channel=channel_id,
-                    text="❌ Je ne suis pas dans ce canal. Utilisez `/invite @MemeMachine` pour m'y ajouter.",
-                    user=os.environ.get("SLACK_USER_ID", "")
-                )
+                await reply(job, "❌ Je ne suis pas dans ce canal. Utilisez `/invite @MemeMachine` pour m'y ajouter.")
             else:
-                slack_client.chat_postMessage(
-                    channel=channel_id,
-                    text=f"❌ Erreur lors de l'envoi du mème: {error}"
-                )
-            return {"text": ""}
+                await reply(job, f"❌ Erreur lors de l'envoi du mème: {error}")
+            return
 
         # Confirmation
-        slack_client.chat_postMessage(
-            channel=channel_id,
-            text="✅ Mème généré avec succès !"
-        )
-        return {"text": ""}
+        await reply(job, "✅ Mème généré avec succès !")
 
     except Exception as e:
-        print(f"Erreur générale: {str(e)}")
-        slack_client.chat_postMessage(
-            channel=channel_id,
-            text=f"❌ Erreur lors de la génération du mème: {str(e)}"
+        logger.exception(f"Erreur générale: {str(e)}")
+        await asyncio.gather(*updates)
+        await reply(job, f"❌ Erreur lors de la génération du mème: {str(e)}")
+
+
+queue = JobQueue(process_job)
+register_callback(
+    "meme_queue_jobs", "Jobs en attente et en cours de traitement", "gauge",
+    ("state",), lambda: {("waiting",): queue.depth, ("in_flight",): queue.in_flight},
+)
+FRESH_FLAG = "--fresh"
+
+
+def parse_command(text: str) -> tuple:
+    """Sépare le drapeau --fresh (nouvelle blague, sans cache) du texte de la commande."""
+    words = text.split()
+    fresh = FRESH_FLAG in words
+    return " ".join(word for word in words if word != FRESH_FLAG), fresh
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if "SLACK_BOT_TOKEN" not in os.environ:
+        logger.warning("SLACK_BOT_TOKEN absent : les mèmes ne pourront pas être envoyés")
+    # Préchauffe le pipeline avant de servir la première commande Slack
+    await asyncio.to_thread(get_pipeline().warm_up)
+    await queue.start()
+    yield
+    await queue.stop()
+    if _http_client is not None:
+        await _http_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.post("/")
+async def meme_slash_command(
+    text: str = Form(...),
+    response_url: str = Form(...),
+    channel_id: str = Form(...),
+    user_id: str = Form("")
+):
+    # Acquittement immédiat : la génération se fait en arrière-plan
+    text, fresh = parse_command(text)
+    try:
+        position = queue.submit(
+            MemeJob(text=text, channel_id=channel_id, response_url=response_url, user_id=user_id, fresh=fresh)
         )
-        return {"text": ""}
+    except QueueFullError:
+        return {
+            "response_type": "ephemeral",
+            "text": "⏳ Trop de mèmes en cours de génération, réessayez dans un instant."
+        }
+    return {
+        "response_type": "ephemeral",
+        "text": f"🎭 Génération du mème en cours... (position {position} dans la file)"
+    }
+
+
+@app.get("/queue")
+async def queue_status():
+    # Profondeur de la file, activité des workers et efficacité du cache
+    cache = get_pipeline().cache
+    return {**queue.stats(), "cache": cache.stats() if cache is not None else None}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Durées par étape, appels et tokens du LLM, caches et file, au format Prometheus
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
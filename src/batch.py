@@ -0,0 +1,319 @@
+"""
+Génération de mèmes en lot.
+
+Les prompts sont lus au fil de l'eau dans un fichier JSONL (ou sur l'entrée
+standard), un objet par ligne : {"id": ..., "prompt": ..., "mode": ...}. Une
+ligne qui n'est pas du JSON est prise comme prompt brut. Les appels au LLM
+tournent en parallèle (nombre borné) sur la boucle d'événements, le rendu part
+dans un pool de processus. Chaque résultat est ajouté au manifeste JSONL dès
+qu'il est prêt ; relancer la commande saute les éléments déjà réussis.
+
+Usage :
+    python -m src.batch prompts.jsonl --output-dir output/batch --concurrency 16
+    cat prompts.txt | python -m src.batch -
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Set, TextIO
+
+from src.meme_finalizer import DEFAULT_PROFILES, LLM_MODES, MemeFinalizer
+from src.rate_limiter import use_lane
+from utils.image_utils import PROFILES
+
+MANIFEST_NAME = "manifest.jsonl"
+
+# Finaliseur de rendu seul, un par processus du pool (aucun client Mistral)
+_render_finalizer: Optional[MemeFinalizer] = None
+
+
+def _render_context() -> multiprocessing.context.BaseContext:
+    """Contexte des workers de rendu : "forkserver" s'il existe, sinon celui par défaut."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context()
+
+
+@dataclass
+class BatchItem:
+    """Un prompt à traiter."""
+    id: str
+    prompt: str
+    mode: Optional[str] = None
+
+
+def read_items(stream: TextIO) -> Iterator[BatchItem]:
+    """
+    Lit les prompts ligne à ligne, sans charger tout le fichier.
+
+    Args:
+        stream (TextIO): Le fichier JSONL ou l'entrée standard
+
+    Yields:
+        BatchItem: Les prompts, identifiés par leur champ "id" ou leur numéro de ligne
+    """
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Ligne {number} ignorée : JSON invalide", file=sys.stderr)
+                continue
+            prompt = data.get("prompt") or data.get("text")
+            if not prompt:
+                print(f"Ligne {number} ignorée : pas de prompt", file=sys.stderr)
+                continue
+            yield BatchItem(id=str(data.get("id", number)), prompt=prompt, mode=data.get("mode"))
+        else:
+            yield BatchItem(id=str(number), prompt=line)
+
+
+def load_completed(manifest_path: str) -> Set[str]:
+    """
+    Relit le manifeste d'une exécution précédente.
+
+    Args:
+        manifest_path (str): Le chemin du manifeste
+
+    Returns:
+        Set[str]: Les identifiants déjà générés avec succès
+    """
+    completed = set()
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Dernière ligne tronquée par une interruption
+                continue
+            if entry.get("status") == "ok":
+                completed.add(str(entry["id"]))
+    return completed
+
+
+def _configure_logging(quiet: bool) -> None:
+    """Journalisation sur la sortie d'erreur : avertissements seuls, ou détails de chaque génération."""
+    level = logging.WARNING if quiet else logging.INFO
+    logging.basicConfig(level=level, format="%(message)s")
+    logging.getLogger().setLevel(level)
+
+
+def _init_render_worker(quiet: bool) -> None:
+    """Initialise un processus de rendu : finaliseur sans client, détails coupés si demandé."""
+    global _render_finalizer
+    _configure_logging(quiet)
+    _render_finalizer = MemeFinalizer()
+
+
+def _render(
+    item_id: str,
+    prompt: str,
+    meme_id: str,
+    meme_info: Dict,
+    texts: List[str],
+    working: bool,
+    images_dir: str,
+    profiles: Sequence[str] = DEFAULT_PROFILES,
+) -> Dict:
+    """
+    Rend un mème dans un processus du pool et le range dans le stockage du lot.
+
+    Un rendu identique déjà stocké (même template, mêmes captions) est resservi.
+
+    Returns:
+        Dict: Le chemin et la taille du fichier principal, puis le fichier de chaque profil
+            (l'image ne repasse pas par le processus parent)
+    """
+    result = _render_finalizer.compose(prompt, meme_id, texts, working, images_dir, meme_info, profiles)
+    return {
+        "path": result.path,
+        "bytes": result.data.nbytes,
+        "files": {profile: encoded.path for profile, encoded in result.encodings.items()},
+    }
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        finalizer: MemeFinalizer,
+        output_dir: str,
+        manifest_path: Optional[str] = None,
+        concurrency: int = 8,
+        render_workers: Optional[int] = None,
+        mode: str = "separate",
+        working: bool = False,
+        fresh: bool = False,
+        quiet: bool = True,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+    ):
+        """
+        Initialise l'exécution d'un lot.
+
+        Args:
+            finalizer (MemeFinalizer): Le finaliseur dont le sélecteur et le générateur font les appels au LLM
+            output_dir (str): Le répertoire des images
+            manifest_path (str, optional): Le manifeste JSONL (output_dir/manifest.jsonl par défaut)
+            concurrency (int): Nombre maximal d'appels au LLM simultanés
+            render_workers (int, optional): Processus de rendu (autant que de cœurs par défaut)
+            mode (str): Mode par défaut, "separate" ou "combined"
+            working (bool): Partir des copies réduites des templates
+            fresh (bool): Ignorer les réponses en cache
+            quiet (bool): Couper les détails de génération, seule la progression est affichée
+            profiles (Sequence[str]): Les profils d'encodage de chaque mème, le principal en premier
+        """
+        if mode not in LLM_MODES:
+            raise ValueError(f"Mode inconnu: {mode} (attendu: {', '.join(LLM_MODES)})")
+        self.finalizer = finalizer
+        self.output_dir = output_dir
+        self.manifest_path = manifest_path or os.path.join(output_dir, MANIFEST_NAME)
+        self.concurrency = concurrency
+        self.render_workers = render_workers or os.cpu_count() or 1
+        self.mode = mode
+        self.working = working
+        self.fresh = fresh
+        self.quiet = quiet
+        self.profiles = tuple(profiles)
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+
+    async def _process(
+        self, item: BatchItem, llm_slots: asyncio.Semaphore, pool: ProcessPoolExecutor, manifest: TextIO
+    ) -> None:
+        """Appels au LLM, rendu dans le pool, puis ajout au manifeste."""
+        start = time.perf_counter()
+        entry = {"id": item.id, "prompt": item.prompt}
+        try:
+            # Le créneau LLM est rendu avant le rendu : l'image suivante peut déjà être demandée
+            # File "batch" du limiteur : les demandes Slack et Streamlit du processus passent avant
+            async with llm_slots:
+                with use_lane("batch"):
+                    meme_id, meme_info, texts = await self.finalizer.select_and_caption_async(
+                        item.prompt, item.mode or self.mode, self.fresh
+                    )
+            entry.update(meme_id=meme_id, captions=texts)
+            loop = asyncio.get_running_loop()
+            rendered = await loop.run_in_executor(
+                pool, _render, item.id, item.prompt, meme_id, meme_info, texts, self.working, self.output_dir,
+                self.profiles,
+            )
+            entry.update(status="ok", **rendered)
+            self.succeeded += 1
+        except Exception as e:
+            entry.update(status="error", error=f"{type(e).__name__}: {str(e)}")
+            self.failed += 1
+        entry["seconds"] = round(time.perf_counter() - start, 3)
+
+        # Une ligne complète par résultat, écrite depuis la boucle : pas de verrou nécessaire
+        manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        manifest.flush()
+        status = "ok" if entry["status"] == "ok" else f"erreur ({entry['error']})"
+        print(f"[{self.succeeded + self.failed}] {item.id}: {status}", file=sys.stderr)
+
+    async def run(self, items: Iterator[BatchItem]) -> Dict[str, int]:
+        """
+        Traite les prompts au fil de la lecture.
+
+        Args:
+            items (Iterator[BatchItem]): Les prompts, lus à la demande
+
+        Returns:
+            Dict[str, int]: Le nombre d'éléments réussis, en échec et sautés
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        completed = load_completed(self.manifest_path)
+        llm_slots = asyncio.Semaphore(self.concurrency)
+        # Borne le nombre d'éléments en vol (appel au LLM ou rendu en attente) : la lecture suit le débit
+        in_flight = asyncio.Semaphore(self.concurrency + 2 * self.render_workers)
+        tasks = set()
+
+        # Workers lancés par un serveur de fork : ils n'héritent ni des threads du parent (surveillance
+        # du catalogue, appels au LLM) ni de la connexion SQLite du cache
+        with ProcessPoolExecutor(
+            max_workers=self.render_workers,
+            mp_context=_render_context(),
+            initializer=_init_render_worker,
+            initargs=(self.quiet,),
+        ) as pool, open(self.manifest_path, "a", encoding="utf-8") as manifest:
+            # Les workers ne démarrent qu'à la première soumission : un appel trivial les lance
+            # avant la lecture, et une erreur d'initialisation apparaît tout de suite
+            await asyncio.wrap_future(pool.submit(os.getpid))
+            while True:
+                # Lecture hors de la boucle : l'entrée standard peut bloquer
+                item = await asyncio.to_thread(next, items, None)
+                if item is None:
+                    break
+                if item.id in completed:
+                    self.skipped += 1
+                    continue
+                await in_flight.acquire()
+                task = asyncio.create_task(self._process(item, llm_slots, pool, manifest))
+                tasks.add(task)
+                task.add_done_callback(lambda t: (tasks.discard(t), in_flight.release()))
+            if tasks:
+                await asyncio.gather(*tasks)
+
+        return {"ok": self.succeeded, "error": self.failed, "skipped": self.skipped}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée en ligne de commande."""
+    parser = argparse.ArgumentParser(description="Génère des mèmes en lot à partir d'un fichier JSONL.")
+    parser.add_argument("input", help="Fichier JSONL de prompts, ou - pour l'entrée standard")
+    parser.add_argument("--output-dir", default="output/batch", help="Répertoire des images")
+    parser.add_argument("--manifest", help=f"Manifeste JSONL (OUTPUT_DIR/{MANIFEST_NAME} par défaut)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Appels au LLM simultanés")
+    parser.add_argument("--render-workers", type=int, help="Processus de rendu (nombre de cœurs par défaut)")
+    parser.add_argument("--mode", choices=LLM_MODES, default="separate")
+    parser.add_argument("--working", action="store_true", help="Partir des copies réduites des templates")
+    parser.add_argument("--fresh", action="store_true", help="Ignorer les réponses en cache")
+    parser.add_argument(
+        "--profile", dest="profiles", action="append", choices=sorted(PROFILES),
+        help="Profil d'encodage, répétable ; le premier est le fichier principal (archive par défaut)",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Afficher les détails de chaque génération")
+    args = parser.parse_args(argv)
+    _configure_logging(quiet=not args.verbose)
+
+    from src.pipeline import get_pipeline
+
+    runner = BatchRunner(
+        get_pipeline().finalizer,
+        output_dir=args.output_dir,
+        manifest_path=args.manifest,
+        concurrency=args.concurrency,
+        render_workers=args.render_workers,
+        mode=args.mode,
+        working=args.working,
+        fresh=args.fresh,
+        quiet=not args.verbose,
+        profiles=args.profiles or DEFAULT_PROFILES,
+    )
+    stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        summary = asyncio.run(runner.run(read_items(stream)))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(
+        f"Terminé : {summary['ok']} réussis, {summary['error']} en échec, "
+        f"{summary['skipped']} déjà faits (manifeste : {runner.manifest_path})",
+        file=sys.stderr,
+    )
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Démarrage préchauffé des workers du bot Slack.
+
+Le processus parent importe l'application, construit le pipeline et charge
+tout ce qui coûte au démarrage (catalogue, index, polices, templates décodés),
+fige ces objets pour le ramasse-miettes (gc.freeze) puis forke les workers.
+Chaque worker sert l'application sur la même socket d'écoute et partage la
+mémoire du parent en copie sur écriture : un nouveau worker est prêt tout de
+suite et ne paie ni les imports ni le décodage des templates.
+
+Le quota des appels à Mistral (MISTRAL_RPS, MISTRAL_TPM, MISTRAL_CONCURRENCY)
+est réparti entre les workers. Un worker qui s'arrête est relancé.
+
+Usage :
+    python -m src.bootstrap --workers 4 --port 8000
+    python -m src.bootstrap --app endpoint:app --host 0.0.0.0 --port 8000
+"""
+import argparse
+import gc
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from src.pipeline import MemePipeline, get_pipeline
+from src.rate_limiter import RateLimiter, RateLimits, set_limiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_APP = "endpoint:app"
+# Modules que le rendu n'importe qu'à la première utilisation : chargés une fois dans le parent
+PRELOAD_MODULES = ("cv2", "slack_sdk", "slack_sdk.errors")
+# Délai laissé aux workers pour finir leurs jobs avant d'être tués
+SHUTDOWN_TIMEOUT = 30.0
+
+
+def load_app(target: str) -> Any:
+    """
+    Importe l'application ASGI désignée par "module:attribut".
+
+    Args:
+        target (str): L'application, par exemple "endpoint:app"
+
+    Returns:
+        Any: L'application
+    """
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+def preload(target: str) -> Any:
+    """
+    Importe l'application et préchauffe le pipeline dans le processus parent.
+
+    Le ramasse-miettes est suspendu pendant le chargement puis les objets
+    créés sont figés : les workers ne réécrivent pas leurs en-têtes et les
+    pages restent partagées.
+
+    Args:
+        target (str): L'application ("module:attribut")
+
+    Returns:
+        Any: L'application
+    """
+    gc.disable()
+    start = time.perf_counter()
+    app = load_app(target)
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+    imported = time.perf_counter()
+    pipeline = get_pipeline().warm_up()
+    pipeline.before_fork()
+    gc.freeze()
+    logger.info(
+        f"Préchargement terminé: imports {imported - start:.2f}s, pipeline {time.perf_counter() - imported:.2f}s, "
+        f"{gc.get_freeze_count()} objets figés"
+    )
+    return app
+
+
+def bind(host: str, port: int) -> socket.socket:
+    """Ouvre la socket d'écoute partagée par tous les workers."""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(app: Any, sock: socket.socket, pipeline: MemePipeline, limits: RateLimits) -> None:
+    """Corps d'un worker forké : relance ce que le parent a arrêté, puis sert l'application."""
+    import uvicorn
+
+    gc.enable()
+    set_limiter(RateLimiter(limits))
+    pipeline.after_fork()
+    config = uvicorn.Config(app, log_config=None, lifespan="on", timeout_graceful_shutdown=SHUTDOWN_TIMEOUT)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(app: Any, sock: socket.socket, limits: RateLimits) -> int:
+    """
+    Forke un worker.
+
+    Returns:
+        int: Le PID du worker
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+    # Dans le worker : les signaux reprennent leur comportement par défaut, uvicorn installe les siens
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    status = 0
+    try:
+        _serve(app, sock, get_pipeline(), limits)
+    except BaseException:
+        logger.exception("Arrêt du worker sur erreur")
+        status = 1
+    finally:
+        logging.shutdown()
+        os._exit(status)
+
+
+def run(target: str, host: str, port: int, workers: int) -> int:
+    """
+    Précharge l'application, forke les workers et les relance s'ils s'arrêtent.
+
+    Args:
+        target (str): L'application ("module:attribut")
+        host (str): L'adresse d'écoute
+        port (int): Le port d'écoute
+        workers (int): Le nombre de workers
+
+    Returns:
+        int: Le code de sortie
+    """
+    sock = bind(host, port)
+    app = preload(target)
+    limits = RateLimits.from_env().divided(workers)
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        children[spawn(app, sock, limits)] = time.monotonic()
+    logger.info(f"{workers} worker(s) en écoute sur {host}:{port}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        logger.warning(f"Worker {pid} arrêté (code {os.waitstatus_to_exitcode(status)}), relance")
+        if time.monotonic() - started < 1.0:
+            # Un worker qui tombe dès son démarrage ne doit pas être relancé en boucle serrée
+            time.sleep(1.0)
+        children[spawn(app, sock, limits)] = time.monotonic()
+    sock.close()
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée en ligne de commande."""
+    parser = argparse.ArgumentParser(description="Précharge le générateur puis forke les workers du bot Slack.")
+    parser.add_argument("--app", default=DEFAULT_APP, help=f"Application ASGI ({DEFAULT_APP} par défaut)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ.get("MEME_PROCESSES", os.cpu_count() or 1)),
+        help="Processus servant l'application (MEME_PROCESSES, nombre de cœurs par défaut)",
+    )
+    args = parser.parse_args(argv)
+    if not hasattr(os, "fork"):
+        print("Le démarrage préchauffé demande os.fork (Linux, macOS)", file=sys.stderr)
+        return 1
+    logging.basicConfig(level=os.environ.get("MEME_LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return run(args.app, args.host, args.port, max(1, args.workers))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
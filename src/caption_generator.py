@@ -1,37 +1,31 @@
-import os
 import json
-from mistralai import Mistral
-from typing import List, Dict
-from dotenv import load_dotenv
+import os
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterator, List, Dict, Optional
+from src.llm import (
+    CallPolicy, complete, complete_async, finish_stream, finish_stream_async, mistral_client, stream, stream_async,
+)
+from src.response_cache import ResponseCache, content_version, make_key
 
-load_dotenv()
+if TYPE_CHECKING:
+    from mistralai import Mistral
 
-class CaptionGenerator:
-    def __init__(self):
-        """Initialize the caption generator with Mistral API."""
-        self.api_key = os.environ["MISTRAL_API_KEY"]
-        self.client = Mistral(api_key=self.api_key)
-        self.model = "mistral-large-latest"
-        
-    def _create_caption_prompt(self, prompt: str, meme_info: Dict) -> str:
-        """Create the prompt for caption generation."""
-        format_instructions = {
-            "two_panels": """Generate EXACTLY two short and funny texts that contrast well.
+FORMAT_INSTRUCTIONS = {
+    "two_panels": """Generate EXACTLY two short and funny texts that contrast well.
 Example format for two_panels:
 {
     "texts": ["First panel text", "Second panel text"]
 }""",
-            "three_panels": """Generate EXACTLY three short texts that tell a story.
+    "three_panels": """Generate EXACTLY three short texts that tell a story.
 Example format for three_panels:
 {
     "texts": ["First panel text", "Second panel text", "Third panel text"]
 }""",
-            "top_bottom": """Generate EXACTLY two short texts: an attention-grabbing one at the top and a punchline at the bottom.
+    "top_bottom": """Generate EXACTLY two short texts: an attention-grabbing one at the top and a punchline at the bottom.
 Example format for top_bottom:
 {
     "texts": ["Top text", "Bottom text"]
 }""",
-            "single_caption": """Generate EXACTLY one short and funny caption that will be placed at the bottom of the image.
+    "single_caption": """Generate EXACTLY one short and funny caption that will be placed at the bottom of the image.
 The caption MUST:
 - Start with "When"
 - Be short and impactful (max 6-7 words)
@@ -43,8 +37,163 @@ Example format for single_caption:
 {
     "texts": ["When you push to prod on Friday"]
 }"""
-        }
+}
+
+# Number of texts expected for each format
+CAPTION_COUNTS = {
+    "two_panels": 2,
+    "three_panels": 3,
+    "top_bottom": 2,
+    "single_caption": 1,
+}
+
+
+def validate_captions(texts, meme_format: str) -> List[str]:
+    """
+    Check that an LLM answer holds the right number of non-empty captions.
+
+    Args:
+        texts: The "texts" value decoded from the JSON answer
+        meme_format (str): The format of the selected meme
+
+    Returns:
+        List[str]: The validated captions
+
+    Raises:
+        ValueError: If the captions do not match the format
+    """
+    if not isinstance(texts, list) or not all(isinstance(t, str) and t.strip() for t in texts):
+        raise ValueError(f"Invalid captions: {texts!r}")
+    expected = CAPTION_COUNTS.get(meme_format)
+    if expected is not None and len(texts) != expected:
+        raise ValueError(f"Expected {expected} captions for format {meme_format}, got {len(texts)}")
+    return texts
+
+
+# Called with (index, text) as soon as a caption is complete
+CaptionCallback = Callable[[int, str], None]
+
+
+class CaptionStream:
+    """
+    Incremental parser for a streamed {"texts": [...]} answer.
+
+    Each chunk is scanned once; a caption is returned as soon as its closing
+    quote arrives, without waiting for the rest of the JSON document.
+    """
+
+    def __init__(self, key: str = "texts"):
+        self.key = key
+        self.texts: List[str] = []
+        # True once the texts array is closed: nothing more will be returned
+        self.closed = False
+        # False if the texts array holds something other than strings
+        self.valid = True
+        self._chunks: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._literal: List[str] = []
+        self._expect_key = False
+        self._last_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+
+    @property
+    def content(self) -> str:
+        """Everything received so far."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Parse a new chunk of the answer.
+
+        Args:
+            chunk (str): The text received
+
+        Returns:
+            List[str]: The captions completed by this chunk
+
+        Raises:
+            ValueError: If a string holds an invalid escape sequence
+        """
+        self._chunks.append(chunk)
+        found = []
+        for char in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._string_closed(json.loads('"' + "".join(self._literal) + '"'), found)
+                    continue
+                self._literal.append(char)
+                continue
+            if self._in_texts() and char not in ' \t\r\n,"]':
+                self.valid = False
+            if char == '"':
+                self._in_string = True
+                self._literal = []
+            elif char in "{[":
+                if char == "[" and self._array_depth is None and self._stack == ["{"] and self._last_key == self.key:
+                    self._array_depth = len(self._stack) + 1
+                self._stack.append(char)
+                self._expect_key = char == "{"
+            elif char in "}]":
+                if char == "]" and self._array_depth == len(self._stack):
+                    self.closed = True
+                if self._stack:
+                    self._stack.pop()
+                self._expect_key = False
+            elif char == ":":
+                self._expect_key = False
+            elif char == ",":
+                self._expect_key = bool(self._stack) and self._stack[-1] == "{"
+        return found
+
+    def _in_texts(self) -> bool:
+        """True while directly inside the open texts array."""
+        return not self.closed and self._array_depth is not None and len(self._stack) == self._array_depth
+
+    def _string_closed(self, value: str, found: List[str]) -> None:
+        """Record a complete string: an object key, or a caption of the texts array."""
+        if self._expect_key and self._stack and self._stack[-1] == "{":
+            self._last_key = value
+        elif self._in_texts():
+            self.texts.append(value)
+            found.append(value)
+
+
+class CaptionGenerator:
+    def __init__(
+        self,
+        client: Optional["Mistral"] = None,
+        policy: Optional[CallPolicy] = None,
+        cache: Optional[ResponseCache] = None,
+        streaming: Optional[bool] = None,
+    ):
+        """
+        Initialize the caption generator with Mistral API.
+
+        Args:
+            client (Mistral, optional): Shared Mistral client (created if missing)
+            policy (CallPolicy, optional): Deadline/retry/hedging policy (read from the environment if missing)
+            cache (ResponseCache, optional): LLM response cache (no caching if missing)
+            streaming (bool, optional): Stream captions with chat.stream (MEME_CAPTION_STREAM, on by default)
+        """
+        if client is None:
+            client = mistral_client()
+        self.client = client
+        self.policy = policy or CallPolicy.from_env()
+        self.cache = cache
+        self.model = "mistral-large-latest"
+        if streaming is None:
+            streaming = os.environ.get("MEME_CAPTION_STREAM", "1") != "0"
+        self.streaming = streaming
         
+    def _create_caption_prompt(self, prompt: str, meme_info: Dict) -> str:
+        """Create the prompt for caption generation."""
         return f"""You are an expert in creating English memes. Generate a short and funny caption for the following meme.
 
 User prompt: "{prompt}"
@@ -53,7 +202,7 @@ Meme information:
 - Description: {meme_info['description']}
 - Format: {meme_info['format']}
 
-{format_instructions[meme_info['format']]}
+{FORMAT_INSTRUCTIONS[meme_info['format']]}
 
 IMPORTANT:
 - The caption MUST start with "When"
@@ -64,34 +213,315 @@ IMPORTANT:
 - Be impactful and funny
 """
         
-    def generate_captions(self, prompt: str, meme_info: Dict) -> List[str]:
+    def _caption_request(self, prompt: str, meme_info: Dict) -> Dict:
+        """Build the chat.complete parameters for caption generation."""
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": self._create_caption_prompt(prompt, meme_info),
+                },
+            ],
+            "response_format": {"type": "json_object"},
+        }
+
+    @staticmethod
+    def _parse_captions(response, meme_format: str) -> List[str]:
+        """
+        Parse and validate the JSON response of a caption request.
+
+        Raises:
+            ValueError: If the answer is not valid JSON or does not match the format
+        """
+        result = json.loads(response.choices[0].message.content)
+        texts = result.get("texts") if isinstance(result, dict) else None
+        return validate_captions(texts, meme_format)
+
+    def _create_variants_prompt(self, prompt: str, meme_info: Dict, n: int) -> str:
+        """Create the prompt asking for several alternative captions in one call."""
+        expected = CAPTION_COUNTS.get(meme_info['format'], 1)
+        return f"""{self._create_caption_prompt(prompt, meme_info)}
+VARIANTS:
+- Generate EXACTLY {n} different alternatives, each with a different joke
+- Each alternative is a list of {expected} text(s), as in the example above
+- Answer with this JSON format: {{"variants": [["..."], ["..."]]}}
+"""
+
+    def _variants_request(self, prompt: str, meme_info: Dict, n: int) -> Dict:
+        """Build the chat.complete parameters for variant generation."""
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": self._create_variants_prompt(prompt, meme_info, n),
+                },
+            ],
+            "response_format": {"type": "json_object"},
+        }
+
+    @staticmethod
+    def _parse_variants(response, meme_format: str, n: int) -> List[List[str]]:
+        """
+        Parse and validate the JSON response of a variants request.
+
+        Invalid or duplicated alternatives are dropped.
+
+        Raises:
+            ValueError: If no alternative is valid
+        """
+        result = json.loads(response.choices[0].message.content)
+        variants, seen = [], set()
+        for texts in result.get("variants", []) if isinstance(result, dict) else []:
+            try:
+                texts = validate_captions(texts, meme_format)
+            except ValueError:
+                continue
+            if tuple(texts) not in seen:
+                seen.add(tuple(texts))
+                variants.append(texts)
+        if not variants:
+            raise ValueError(f"No valid caption variant in answer: {result!r}")
+        return variants[:n]
+
+    def _cache_key(self, prompt: str, meme_info: Dict, kind: str = "captions") -> str:
+        """Cache key: normalized prompt, model and version of the meme entry."""
+        return make_key(kind, prompt, self.model, content_version(meme_info))
+
+    def generate_captions(self, prompt: str, meme_info: Dict, fresh: bool = False) -> List[str]:
         """
         Generate captions for a meme from a prompt.
         
         Args:
             prompt (str): The prompt describing the situation
             meme_info (Dict): Information about the selected meme
+            fresh (bool): Skip the cached answer and ask for a new joke
             
         Returns:
             List[str]: The generated captions
+
+        Raises:
+            ValueError: If the answer does not match the format (nothing is cached)
         """
-        caption_prompt = self._create_caption_prompt(prompt, meme_info)
-        
-        response = self.client.chat.complete(
-            model=self.model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": caption_prompt,
-                },
-            ],
-            response_format={"type": "json_object"}
-        )
+        def call() -> List[str]:
+            response = complete(self.client, self.policy, **self._caption_request(prompt, meme_info))
+            return self._parse_captions(response, meme_info['format'])
+
+        if self.cache is None:
+            return call()
+        return self.cache.get_or_compute(self._cache_key(prompt, meme_info), call, fresh=fresh)
+
+    async def generate_captions_async(self, prompt: str, meme_info: Dict, fresh: bool = False) -> List[str]:
+        """
+        Generate captions for a meme from a prompt without blocking the event loop.
         
-        # Parse JSON response
-        result = json.loads(response.choices[0].message.content)
-        return result["texts"]
+        Args:
+            prompt (str): The prompt describing the situation
+            meme_info (Dict): Information about the selected meme
+            fresh (bool): Skip the cached answer and ask for a new joke
+            
+        Returns:
+            List[str]: The generated captions
+
+        Raises:
+            ValueError: If the answer does not match the format (nothing is cached)
+        """
+        async def call() -> List[str]:
+            response = await complete_async(self.client, self.policy, **self._caption_request(prompt, meme_info))
+            return self._parse_captions(response, meme_info['format'])
+
+        if self.cache is None:
+            return await call()
+        return await self.cache.get_or_compute_async(self._cache_key(prompt, meme_info), call, fresh=fresh)
     
+    @staticmethod
+    def _emitter(on_caption: Optional[CaptionCallback], meme_format: str) -> tuple:
+        """
+        A callback reporting captions in order, and the list of those already reported.
+
+        Reporting stops at the first caption that cannot belong to a valid answer
+        (empty, or one too many for the format).
+        """
+        expected = CAPTION_COUNTS.get(meme_format)
+        emitted: List[str] = []
+        rejected = []
+
+        def emit(text: str) -> None:
+            if rejected or not text.strip() or (expected is not None and len(emitted) >= expected):
+                rejected.append(text)
+                return
+            emitted.append(text)
+            if on_caption is not None:
+                on_caption(len(emitted) - 1, text)
+
+        return emit, emitted
+
+    @staticmethod
+    def _streamed_captions(parser: CaptionStream, meme_format: str) -> List[str]:
+        """
+        Validate the captions of a streamed answer (the whole JSON if the array never closed).
+
+        Raises:
+            ValueError: If the answer does not match the format
+        """
+        if parser.closed:
+            if not parser.valid:
+                raise ValueError(f"Invalid captions: {parser.content!r}")
+            texts = parser.texts
+        else:
+            result = json.loads(parser.content)
+            texts = result.get("texts") if isinstance(result, dict) else None
+        return validate_captions(texts, meme_format)
+
+    @classmethod
+    def _read_stream(cls, chunks: Iterator[str], emit: Callable[[str], None], meme_format: str) -> List[str]:
+        """Report captions while the answer streams in; return once the texts array is closed."""
+        parser = CaptionStream()
+        for chunk in chunks:
+            for text in parser.feed(chunk):
+                emit(text)
+            if parser.closed:
+                # The captions are known: the end of the answer is read in the background
+                finish_stream(chunks)
+                break
+        return cls._streamed_captions(parser, meme_format)
+
+    @classmethod
+    async def _read_stream_async(cls, chunks: AsyncIterator[str], emit: Callable[[str], None], meme_format: str) -> List[str]:
+        """Async version of _read_stream."""
+        parser = CaptionStream()
+        async for chunk in chunks:
+            for text in parser.feed(chunk):
+                emit(text)
+            if parser.closed:
+                finish_stream_async(chunks)
+                break
+        return cls._streamed_captions(parser, meme_format)
+
+    def stream_captions(
+        self,
+        prompt: str,
+        meme_info: Dict,
+        on_caption: Optional[CaptionCallback] = None,
+        fresh: bool = False,
+        on_reset: Optional[Callable[[], None]] = None,
+    ) -> List[str]:
+        """
+        Generate captions with a streamed answer, reporting each one as soon as it is written.
+
+        The result is the same as generate_captions and shares its cache entry; a
+        cached answer is reported caption by caption right away. Only a validated
+        answer is returned and cached.
+
+        Args:
+            prompt (str): The prompt describing the situation
+            meme_info (Dict): Information about the selected meme
+            on_caption (CaptionCallback, optional): Called with (index, text) for each completed caption
+            fresh (bool): Skip the cached answer and ask for a new joke
+            on_reset (Callable[[], None], optional): Called when captions already reported belong
+                to an answer that turns out to be invalid
+
+        Returns:
+            List[str]: The generated captions
+
+        Raises:
+            ValueError: If the answer does not match the format (nothing is cached)
+        """
+        emit, emitted = self._emitter(on_caption, meme_info['format'])
+
+        def call() -> List[str]:
+            chunks = stream(self.client, self.policy, **self._caption_request(prompt, meme_info))
+            return self._read_stream(chunks, emit, meme_info['format'])
+
+        try:
+            if self.cache is None:
+                texts = call()
+            else:
+                texts = self.cache.get_or_compute(self._cache_key(prompt, meme_info), call, fresh=fresh)
+        except ValueError:
+            if emitted and on_reset is not None:
+                on_reset()
+            raise
+        for text in texts[len(emitted):]:
+            emit(text)
+        return texts
+
+    async def stream_captions_async(
+        self,
+        prompt: str,
+        meme_info: Dict,
+        on_caption: Optional[CaptionCallback] = None,
+        fresh: bool = False,
+        on_reset: Optional[Callable[[], None]] = None,
+    ) -> List[str]:
+        """
+        Async version of stream_captions (callbacks are called from the event loop).
+
+        Returns:
+            List[str]: The generated captions
+
+        Raises:
+            ValueError: If the answer does not match the format (nothing is cached)
+        """
+        emit, emitted = self._emitter(on_caption, meme_info['format'])
+
+        async def call() -> List[str]:
+            chunks = stream_async(self.client, self.policy, **self._caption_request(prompt, meme_info))
+            return await self._read_stream_async(chunks, emit, meme_info['format'])
+
+        try:
+            if self.cache is None:
+                texts = await call()
+            else:
+                texts = await self.cache.get_or_compute_async(self._cache_key(prompt, meme_info), call, fresh=fresh)
+        except ValueError:
+            if emitted and on_reset is not None:
+                on_reset()
+            raise
+        for text in texts[len(emitted):]:
+            emit(text)
+        return texts
+
+    def generate_caption_variants(self, prompt: str, meme_info: Dict, n: int = 3, fresh: bool = False) -> List[List[str]]:
+        """
+        Generate n alternative captions for the same meme in a single API call.
+        
+        Args:
+            prompt (str): The prompt describing the situation
+            meme_info (Dict): Information about the selected meme
+            n (int): Number of alternatives to ask for
+            fresh (bool): Skip the cached answer and ask for new jokes
+            
+        Returns:
+            List[List[str]]: Up to n distinct lists of captions
+
+        Raises:
+            ValueError: If the answer holds no valid alternative
+        """
+        def call() -> List[List[str]]:
+            response = complete(self.client, self.policy, **self._variants_request(prompt, meme_info, n))
+            return self._parse_variants(response, meme_info['format'], n)
+
+        if self.cache is None:
+            return call()
+        return self.cache.get_or_compute(self._cache_key(prompt, meme_info, f"variants:{n}"), call, fresh=fresh)
+
+    async def generate_caption_variants_async(self, prompt: str, meme_info: Dict, n: int = 3, fresh: bool = False) -> List[List[str]]:
+        """
+        Async version of generate_caption_variants.
+
+        Raises:
+            ValueError: If the answer holds no valid alternative
+        """
+        async def call() -> List[List[str]]:
+            response = await complete_async(self.client, self.policy, **self._variants_request(prompt, meme_info, n))
+            return self._parse_variants(response, meme_info['format'], n)
+
+        if self.cache is None:
+            return await call()
+        return await self.cache.get_or_compute_async(self._cache_key(prompt, meme_info, f"variants:{n}"), call, fresh=fresh)
+
 if __name__ == "__main__":
     generator = CaptionGenerator()
     prompt = "when you push to prod on Friday"
@@ -0,0 +1,276 @@
+"""
+Catalogue des templates, rechargeable à chaud.
+
+Un instantané immuable réunit le catalogue (data/memes.json), sa version, les
+fichiers des images (data/img) et l'index de recherche. `Catalog.poll()`
+compare les dates de modification ; si quelque chose a changé, un nouvel
+instantané est construit à côté de l'ancien (seules les entrées modifiées sont
+re-tokenisées) puis mis en place d'une seule affectation. Une requête garde
+l'instantané pris à son début : elle ne voit jamais un catalogue à moitié
+rechargé. Les abonnés (le finaliseur) reçoivent la liste des changements pour
+n'invalider que les entrées touchées.
+"""
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+from src.metrics import timed
+from src.response_cache import content_version
+from src.template_index import INDEX_PATH, TemplateIndex
+from utils.template_cache import index_templates
+
+logger = logging.getLogger(__name__)
+
+MEMES_PATH = "data/memes.json"
+# Intervalle de surveillance par défaut, en secondes (MEME_CATALOG_POLL, 0 pour ne pas surveiller)
+DEFAULT_POLL_INTERVAL = 10.0
+
+# Fichier d'une image : (chemin, taille, date de modification en ns)
+ImageFile = Tuple[str, int, int]
+
+
+def load_memes(path: str = MEMES_PATH) -> dict:
+    """Charge les métadonnées des mèmes depuis le fichier JSON."""
+    with timed("catalog_load"), open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def scan_images(meme_dir: str) -> Dict[str, ImageFile]:
+    """
+    Relève le fichier, la taille et la date de chaque image de template.
+
+    Args:
+        meme_dir (str): Le répertoire des templates
+
+    Returns:
+        Dict[str, ImageFile]: Identifiant normalisé -> (chemin, taille, date en ns)
+    """
+    images = {}
+    for template_id, path in index_templates(meme_dir).items():
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        images[template_id] = (path, stat.st_size, stat.st_mtime_ns)
+    return images
+
+
+def _file_signature(path: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Taille et date de modification d'un fichier (None s'il est absent)."""
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+@dataclass(frozen=True)
+class CatalogChanges:
+    """Différences entre deux instantanés."""
+    added: FrozenSet[str] = frozenset()
+    removed: FrozenSet[str] = frozenset()
+    modified: FrozenSet[str] = frozenset()
+    # Identifiants (normalisés) des images ajoutées, supprimées ou modifiées
+    images: FrozenSet[str] = frozenset()
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.modified or self.images)
+
+
+class CatalogSnapshot:
+    """
+    Un état figé du catalogue : ni les mèmes ni l'index ne changent après construction.
+
+    Les entrées de memes sont des dictionnaires ordinaires, à traiter en lecture seule.
+    """
+
+    def __init__(
+        self,
+        memes: Dict[str, Dict],
+        images: Dict[str, ImageFile],
+        index_path: str = INDEX_PATH,
+        source: Optional[Tuple[int, int]] = None,
+        index: Optional[TemplateIndex] = None,
+    ):
+        self.memes: Mapping[str, Dict] = MappingProxyType(dict(memes))
+        self.version = content_version(memes)
+        self.images: Mapping[str, ImageFile] = MappingProxyType(dict(images))
+        self.index_path = index_path
+        self.source = source
+        self._index = index
+        self._index_lock = threading.Lock()
+
+    @property
+    def index(self) -> TemplateIndex:
+        """Index de recherche de cet instantané, chargé ou construit au premier accès."""
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = TemplateIndex.load_or_build(dict(self.memes), self.index_path)
+        return self._index
+
+    def get(self, meme_id: str) -> Optional[Dict]:
+        """L'entrée d'un mème, ou None s'il n'existe pas dans cet instantané."""
+        return self.memes.get(meme_id)
+
+    def changes_to(self, other: "CatalogSnapshot") -> CatalogChanges:
+        """Ce qui diffère entre cet instantané et un plus récent."""
+        old, new = set(self.memes), set(other.memes)
+        return CatalogChanges(
+            added=frozenset(new - old),
+            removed=frozenset(old - new),
+            modified=frozenset(meme_id for meme_id in old & new if self.memes[meme_id] != other.memes[meme_id]),
+            images=frozenset(
+                template_id for template_id in set(self.images) | set(other.images)
+                if self.images.get(template_id) != other.images.get(template_id)
+            ),
+        )
+
+
+CatalogListener = Callable[[CatalogSnapshot, CatalogSnapshot, CatalogChanges], None]
+
+
+class Catalog:
+    def __init__(
+        self,
+        memes_path: Optional[str] = MEMES_PATH,
+        meme_dir: str = "data/img",
+        index_path: str = INDEX_PATH,
+        memes: Optional[Dict[str, Dict]] = None,
+    ):
+        """
+        Charge le catalogue et relève les images.
+
+        Args:
+            memes_path (str, optional): Le fichier du catalogue (None : pas de fichier à surveiller)
+            meme_dir (str): Le répertoire des templates
+            index_path (str): Le fichier de l'index de recherche
+            memes (dict, optional): Un catalogue déjà chargé, qui n'est alors pas relu depuis memes_path
+        """
+        if memes is not None:
+            memes_path = None
+        self.memes_path = memes_path
+        self.meme_dir = meme_dir
+        self.index_path = index_path
+        self._listeners: List[CatalogListener] = []
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        source = _file_signature(memes_path)
+        if memes is None:
+            memes = load_memes(memes_path)
+        self._snapshot = CatalogSnapshot(memes, scan_images(meme_dir), index_path, source)
+        self.reloads = 0
+
+    @property
+    def current(self) -> CatalogSnapshot:
+        """L'instantané courant ; le garder pour toute la durée d'une requête."""
+        return self._snapshot
+
+    def subscribe(self, listener: CatalogListener) -> None:
+        """
+        Appelle listener(ancien, nouveau, changements) après chaque rechargement.
+
+        Args:
+            listener (CatalogListener): Le rappel (exécuté dans le thread qui recharge)
+        """
+        self._listeners.append(listener)
+
+    def poll(self) -> Optional[CatalogChanges]:
+        """
+        Recharge le catalogue si le fichier ou les images ont changé.
+
+        Returns:
+            Optional[CatalogChanges]: Les changements appliqués, ou None si rien n'a changé
+        """
+        snapshot = self._snapshot
+        if _file_signature(self.memes_path) == snapshot.source and scan_images(self.meme_dir) == dict(snapshot.images):
+            return None
+        return self.reload()
+
+    def reload(self) -> CatalogChanges:
+        """
+        Construit un nouvel instantané et le met en place.
+
+        Un catalogue illisible (fichier en cours d'écriture, JSON invalide) est
+        ignoré : l'instantané courant reste en place jusqu'au prochain essai.
+
+        Returns:
+            CatalogChanges: Les changements appliqués (vides si rien n'a changé)
+        """
+        with self._reload_lock:
+            old = self._snapshot
+            source = _file_signature(self.memes_path)
+            memes = dict(old.memes)
+            if self.memes_path is not None and source != old.source:
+                try:
+                    memes = load_memes(self.memes_path)
+                except (OSError, json.JSONDecodeError) as e:
+                    logger.error(f"Catalogue {self.memes_path} illisible, ancienne version conservée: {str(e)}")
+                    return CatalogChanges()
+            new = CatalogSnapshot(memes, scan_images(self.meme_dir), self.index_path, source)
+            changes = old.changes_to(new)
+            if changes.added or changes.removed or changes.modified:
+                # Mise à jour incrémentale de l'index, s'il a déjà servi ; sinon il sera construit à la demande
+                if old._index is not None:
+                    new._index = old._index.updated(memes)
+                    if new._index is not old._index:
+                        new._index.save()
+            else:
+                new._index = old._index
+            self._snapshot = new
+            self.reloads += 1
+
+        if not changes:
+            return changes
+        logger.info(
+            f"Catalogue rechargé: {len(changes.added)} ajouté(s), {len(changes.removed)} retiré(s), "
+            f"{len(changes.modified)} modifié(s), {len(changes.images)} image(s) changée(s)"
+        )
+        for listener in list(self._listeners):
+            try:
+                listener(old, new, changes)
+            except Exception as e:
+                logger.error(f"Erreur d'un abonné au catalogue: {str(e)}")
+        return changes
+
+    def _watch(self, interval: float) -> None:
+        """Boucle de surveillance (thread d'arrière-plan)."""
+        while not self._stop.wait(interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Erreur de surveillance du catalogue: {str(e)}")
+
+    def start(self, interval: Optional[float] = None) -> "Catalog":
+        """
+        Surveille le catalogue et les images dans un thread d'arrière-plan.
+
+        Args:
+            interval (float, optional): Secondes entre deux vérifications
+                (MEME_CATALOG_POLL, 10 par défaut ; 0 pour ne pas surveiller)
+
+        Returns:
+            Catalog: Le catalogue lui-même
+        """
+        if interval is None:
+            interval = float(os.environ.get("MEME_CATALOG_POLL", DEFAULT_POLL_INTERVAL))
+        if interval <= 0 or self._thread is not None:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, args=(interval,), name="catalog-watch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Arrête la surveillance."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,148 @@
+"""
+File d'attente en mémoire des générations de mèmes.
+
+Les requêtes sont acquittées tout de suite puis placées dans une file bornée ;
+un nombre fixe de workers asyncio la vide. Le rendu (CPU) part dans un pool de
+threads pour ne jamais bloquer la boucle d'événements.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from src.metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """La file a atteint sa taille maximale : la requête doit être refusée."""
+
+
+@dataclass
+class MemeJob:
+    """Une demande de mème venue de Slack."""
+    text: str
+    channel_id: str
+    response_url: str
+    user_id: str = ""
+    fresh: bool = False
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class JobQueue:
+    def __init__(
+        self,
+        handler: Callable[[MemeJob], Awaitable[Any]],
+        workers: Optional[int] = None,
+        max_size: Optional[int] = None,
+        render_threads: Optional[int] = None,
+    ):
+        """
+        Initialise la file sans démarrer les workers.
+
+        Args:
+            handler (Callable[[MemeJob], Awaitable]): Coroutine qui traite un job
+            workers (int, optional): Nombre de workers (MEME_WORKERS, 4 par défaut)
+            max_size (int, optional): Taille maximale de la file (MEME_QUEUE_SIZE, 100 par défaut)
+            render_threads (int, optional): Threads du pool de rendu (MEME_RENDER_THREADS,
+                autant que de workers par défaut)
+        """
+        self.handler = handler
+        self.workers = workers or int(os.environ.get("MEME_WORKERS", 4))
+        self.max_size = max_size or int(os.environ.get("MEME_QUEUE_SIZE", 100))
+        self.render_threads = render_threads or int(os.environ.get("MEME_RENDER_THREADS", self.workers))
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        """Crée la file, le pool de rendu et lance les workers."""
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.render_threads, thread_name_prefix="meme-render")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Arrête les workers et le pool de rendu (les jobs en attente sont abandonnés)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def submit(self, job: MemeJob) -> int:
+        """
+        Ajoute un job à la file sans attendre.
+
+        Args:
+            job (MemeJob): Le job à traiter
+
+        Returns:
+            int: La position du job dans la file
+
+        Raises:
+            QueueFullError: Si la file est pleine
+        """
+        if self._queue is None:
+            raise RuntimeError("La file n'est pas démarrée")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"File pleine ({self.max_size} jobs en attente)")
+        return self._queue.qsize()
+
+    async def run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Exécute une fonction bloquante (rendu, appels synchrones) dans le pool de rendu.
+
+        Args:
+            func (Callable): La fonction à exécuter
+
+        Returns:
+            Any: Le résultat de la fonction
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    async def _worker(self, number: int) -> None:
+        """Boucle d'un worker : prend un job, le traite, recommence."""
+        while True:
+            job = await self._queue.get()
+            STAGE_SECONDS.observe(time.monotonic() - job.enqueued_at, stage="queue_wait")
+            self.in_flight += 1
+            try:
+                await self.handler(job)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Worker {number}: erreur sur '{job.text}': {str(e)}")
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    @property
+    def depth(self) -> int:
+        """Nombre de jobs en attente."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, int]:
+        """État de la file, pour la supervision."""
+        return {
+            "depth": self.depth,
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
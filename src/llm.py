@@ -0,0 +1,469 @@
+"""
+Appels à l'API Mistral avec délai maximal, nouvelles tentatives et requêtes doublées.
+
+Chaque appel dispose d'un budget de temps global. Les erreurs transitoires
+(délai dépassé, coupure réseau, 429, 5xx) sont retentées avec un backoff
+exponentiel borné ; si une tentative tarde au-delà d'un seuil, une seconde
+requête identique peut être lancée et la première réponse l'emporte. Chaque
+requête envoyée attend d'abord son créneau auprès du limiteur du processus
+(voir src.rate_limiter) ; un 429 le met en pause.
+
+stream et stream_async renvoient la réponse morceau par morceau (chat.stream) :
+une nouvelle tentative n'est possible qu'avant le premier morceau reçu, et une
+requête en flux n'est jamais doublée.
+
+Le SDK mistralai (un long arbre de modèles pydantic) et python-dotenv ne sont
+importés qu'à la construction du premier client : importer le générateur reste
+rapide pour les workers et les relances de Streamlit.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator, Optional, Set
+
+import httpx
+
+from src.metrics import LLM_CALLS, record_usage
+from src.rate_limiter import QueueTimeout, current_lane, estimate_tokens, get_limiter, usage_tokens
+
+if TYPE_CHECKING:
+    from mistralai import Mistral
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+# Pool partagé par les requêtes doublées du chemin synchrone
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="mistral-hedge")
+# Pool et tâches qui lisent la fin des flux abandonnés par l'appelant
+_drain_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mistral-drain")
+_drain_tasks: Set[asyncio.Task] = set()
+
+_env_loaded = False
+
+
+def load_env() -> None:
+    """Charge le fichier .env dans l'environnement, une seule fois par processus."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def mistral_client() -> "Mistral":
+    """
+    Construit un client Mistral avec la clé MISTRAL_API_KEY.
+
+    Le SDK n'est importé qu'ici, au premier client construit.
+
+    Returns:
+        Mistral: Le client
+    """
+    load_env()
+    from mistralai import Mistral
+    return Mistral(api_key=os.environ["MISTRAL_API_KEY"])
+
+
+@dataclass
+class CallPolicy:
+    """Politique d'un appel : délai total, nouvelles tentatives et doublement."""
+    deadline: float = 30.0
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    hedge_after: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "CallPolicy":
+        """
+        Lit la politique dans l'environnement.
+
+        MISTRAL_DEADLINE (secondes), MISTRAL_MAX_RETRIES et MISTRAL_HEDGE_AFTER
+        (secondes, désactivé si absent).
+        """
+        load_env()
+        hedge_after = os.environ.get("MISTRAL_HEDGE_AFTER")
+        return cls(
+            deadline=float(os.environ.get("MISTRAL_DEADLINE", cls.deadline)),
+            max_retries=int(os.environ.get("MISTRAL_MAX_RETRIES", cls.max_retries)),
+            hedge_after=float(hedge_after) if hedge_after else None,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Attente avant la tentative suivante (backoff exponentiel avec gigue)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Le budget de temps de l'appel est épuisé."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Indique si une erreur est transitoire et mérite une nouvelle tentative.
+
+    Args:
+        error (BaseException): L'erreur levée par l'appel
+
+    Returns:
+        bool: True pour les délais dépassés, erreurs réseau, 408, 429 et 5xx
+    """
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Délai demandé par l'en-tête Retry-After d'une réponse 429, s'il existe."""
+    response = getattr(error, "raw_response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _next_delay(policy: CallPolicy, attempt: int, error: BaseException, remaining: float) -> Optional[float]:
+    """Attente avant de retenter, ou None s'il ne faut plus réessayer."""
+    if isinstance(error, QueueTimeout) or attempt >= policy.max_retries or not is_retryable(error):
+        return None
+    delay = _retry_after(error)
+    if delay is None:
+        delay = policy.backoff(attempt)
+    if getattr(error, "status_code", None) == 429:
+        # Quota dépassé : les autres appels du processus attendent aussi
+        get_limiter().penalize(delay)
+    if delay >= remaining:
+        return None
+    return delay
+
+
+def complete(client: Any, policy: CallPolicy, **request) -> Any:
+    """
+    Appelle client.chat.complete en respectant la politique.
+
+    Args:
+        client (Mistral): Le client Mistral
+        policy (CallPolicy): La politique de l'appel
+        **request: Les paramètres de chat.complete (model, messages, ...)
+
+    Returns:
+        ChatCompletionResponse: La réponse de l'API
+
+    Raises:
+        DeadlineExceeded: Si le budget de temps est épuisé
+    """
+    end = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Délai de {policy.deadline}s dépassé pour l'appel Mistral")
+        try:
+            response = _attempt(client, policy, remaining, request)
+        except Exception as e:
+            delay = _next_delay(policy, attempt, e, end - time.monotonic())
+            if delay is None:
+                LLM_CALLS.inc(outcome="error")
+                if isinstance(e, QueueTimeout):
+                    raise DeadlineExceeded(f"Délai de {policy.deadline}s dépassé en attente du limiteur") from e
+                raise
+            LLM_CALLS.inc(outcome="retry")
+            logger.warning(f"Appel Mistral en échec ({type(e).__name__}), nouvelle tentative dans {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        LLM_CALLS.inc(outcome="ok")
+        record_usage(response, request.get("model"))
+        return response
+
+
+def _attempt(client: Any, policy: CallPolicy, remaining: float, request: dict) -> Any:
+    """Une tentative synchrone, doublée par une seconde requête si elle traîne."""
+    end = time.monotonic() + remaining
+    # La file est lue ici : les requêtes doublées partent d'un thread du pool, hors du contexte
+    lane = current_lane()
+    tokens = estimate_tokens(request)
+
+    def call():
+        with get_limiter().slot(tokens, lane, timeout=end - time.monotonic()) as permit:
+            response = client.chat.complete(timeout_ms=int(max(0.001, end - time.monotonic()) * 1000), **request)
+            permit.settle(usage_tokens(response))
+            return response
+
+    if policy.hedge_after is None or policy.hedge_after >= remaining:
+        return call()
+
+    first = _hedge_executor.submit(call)
+    done, _ = wait([first], timeout=policy.hedge_after)
+    if done:
+        return first.result()
+
+    pending = {first, _hedge_executor.submit(call)}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, remaining - policy.hedge_after), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error or DeadlineExceeded("Aucune réponse des requêtes doublées")
+
+
+async def complete_async(client: Any, policy: CallPolicy, **request) -> Any:
+    """
+    Appelle client.chat.complete_async en respectant la politique.
+
+    Args:
+        client (Mistral): Le client Mistral
+        policy (CallPolicy): La politique de l'appel
+        **request: Les paramètres de chat.complete (model, messages, ...)
+
+    Returns:
+        ChatCompletionResponse: La réponse de l'API
+
+    Raises:
+        DeadlineExceeded: Si le budget de temps est épuisé
+    """
+    loop = asyncio.get_running_loop()
+    end = loop.time() + policy.deadline
+    attempt = 0
+    while True:
+        remaining = end - loop.time()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Délai de {policy.deadline}s dépassé pour l'appel Mistral")
+        try:
+            response = await asyncio.wait_for(_attempt_async(client, policy, remaining, request), timeout=remaining)
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) and loop.time() >= end:
+                LLM_CALLS.inc(outcome="error")
+                raise DeadlineExceeded(f"Délai de {policy.deadline}s dépassé pour l'appel Mistral") from e
+            delay = _next_delay(policy, attempt, e, end - loop.time())
+            if delay is None:
+                LLM_CALLS.inc(outcome="error")
+                raise
+            LLM_CALLS.inc(outcome="retry")
+            logger.warning(f"Appel Mistral en échec ({type(e).__name__}), nouvelle tentative dans {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        LLM_CALLS.inc(outcome="ok")
+        record_usage(response, request.get("model"))
+        return response
+
+
+async def _attempt_async(client: Any, policy: CallPolicy, remaining: float, request: dict) -> Any:
+    """Une tentative asynchrone, doublée par une seconde requête si elle traîne."""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + remaining
+    tokens = estimate_tokens(request)
+
+    async def limited():
+        # L'attente du créneau est bornée par le wait_for de complete_async
+        async with get_limiter().slot_async(tokens) as permit:
+            timeout_ms = int(max(0.001, end - loop.time()) * 1000)
+            response = await client.chat.complete_async(timeout_ms=timeout_ms, **request)
+            permit.settle(usage_tokens(response))
+            return response
+
+    def call():
+        return asyncio.ensure_future(limited())
+
+    if policy.hedge_after is None or policy.hedge_after >= remaining:
+        return await call()
+
+    tasks = {call()}
+    error = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=policy.hedge_after)
+        if not done:
+            tasks.add(call())
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _delta_text(chunk: Any) -> str:
+    """Le texte apporté par un morceau de chat.stream (chaîne ou liste de parties)."""
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return ""
+    content = choices[0].delta.content
+    if isinstance(content, str):
+        return content
+    if isinstance(content, (list, tuple)):
+        return "".join(getattr(part, "text", "") or "" for part in content)
+    return ""
+
+
+def stream(client: Any, policy: CallPolicy, **request) -> Iterator[str]:
+    """
+    Appelle client.chat.stream en respectant la politique et renvoie le texte au fil de l'eau.
+
+    Les erreurs transitoires sont retentées tant qu'aucun morceau n'a été
+    renvoyé ; ensuite, une coupure remonte à l'appelant. Le créneau du limiteur
+    est gardé jusqu'à la fin du flux, l'usage est compté sur le dernier morceau.
+
+    Args:
+        client (Mistral): Le client Mistral
+        policy (CallPolicy): La politique de l'appel
+        **request: Les paramètres de chat.stream (model, messages, ...)
+
+    Yields:
+        str: Les morceaux de texte de la réponse
+
+    Raises:
+        DeadlineExceeded: Si le budget de temps est épuisé
+    """
+    end = time.monotonic() + policy.deadline
+    lane = current_lane()
+    tokens = estimate_tokens(request)
+    attempt = 0
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Délai de {policy.deadline}s dépassé pour l'appel Mistral")
+        started, last = False, None
+        try:
+            with get_limiter().slot(tokens, lane, timeout=remaining) as permit:
+                timeout_ms = int(max(0.001, end - time.monotonic()) * 1000)
+                with client.chat.stream(timeout_ms=timeout_ms, **request) as events:
+                    for event in events:
+                        last = event.data
+                        text = _delta_text(last)
+                        if text:
+                            started = True
+                            yield text
+                        if time.monotonic() >= end:
+                            raise DeadlineExceeded(f"Délai de {policy.deadline}s dépassé pendant le flux Mistral")
+                permit.settle(usage_tokens(last))
+        except Exception as e:
+            delay = None if started else _next_delay(policy, attempt, e, end - time.monotonic())
+            if delay is None:
+                LLM_CALLS.inc(outcome="error")
+                if isinstance(e, QueueTimeout):
+                    raise DeadlineExceeded(f"Délai de {policy.deadline}s dépassé en attente du limiteur") from e
+                raise
+            LLM_CALLS.inc(outcome="retry")
+            logger.warning(f"Flux Mistral en échec ({type(e).__name__}), nouvelle tentative dans {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        LLM_CALLS.inc(outcome="ok")
+        record_usage(last, request.get("model"))
+        return
+
+
+async def stream_async(client: Any, policy: CallPolicy, **request) -> AsyncIterator[str]:
+    """
+    Version asynchrone de stream (client.chat.stream_async).
+
+    Yields:
+        str: Les morceaux de texte de la réponse
+
+    Raises:
+        DeadlineExceeded: Si le budget de temps est épuisé
+    """
+    loop = asyncio.get_running_loop()
+    end = loop.time() + policy.deadline
+    tokens = estimate_tokens(request)
+    attempt = 0
+    while True:
+        remaining = end - loop.time()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Délai de {policy.deadline}s dépassé pour l'appel Mistral")
+        started, last = False, None
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                # L'attente du créneau et de chaque morceau est bornée par le budget restant
+                permit = await asyncio.wait_for(stack.enter_async_context(get_limiter().slot_async(tokens)), remaining)
+                timeout_ms = int(max(0.001, end - loop.time()) * 1000)
+                events = await asyncio.wait_for(
+                    client.chat.stream_async(timeout_ms=timeout_ms, **request), max(0.001, end - loop.time())
+                )
+                await stack.enter_async_context(events)
+                while True:
+                    try:
+                        event = await asyncio.wait_for(events.__anext__(), max(0.001, end - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    last = event.data
+                    text = _delta_text(last)
+                    if text:
+                        started = True
+                        yield text
+                permit.settle(usage_tokens(last))
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) and loop.time() >= end:
+                LLM_CALLS.inc(outcome="error")
+                raise DeadlineExceeded(f"Délai de {policy.deadline}s dépassé pour l'appel Mistral") from e
+            delay = None if started else _next_delay(policy, attempt, e, end - loop.time())
+            if delay is None:
+                LLM_CALLS.inc(outcome="error")
+                raise
+            LLM_CALLS.inc(outcome="retry")
+            logger.warning(f"Flux Mistral en échec ({type(e).__name__}), nouvelle tentative dans {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        LLM_CALLS.inc(outcome="ok")
+        record_usage(last, request.get("model"))
+        return
+
+
+def _drain(chunks: Iterator[str]) -> None:
+    """Lit un flux jusqu'au bout ; une erreur à ce stade est seulement journalisée."""
+    try:
+        for _ in chunks:
+            pass
+    except Exception as e:
+        logger.warning(f"Fin du flux Mistral en échec: {str(e)}")
+
+
+def finish_stream(chunks: Iterator[str]) -> None:
+    """
+    Laisse la fin d'un flux se lire en arrière-plan.
+
+    L'appelant a déjà ce qu'il attendait : le reste de la réponse (fin du JSON,
+    usage) est lu dans un thread, pour compter les tokens et libérer le créneau
+    du limiteur sans retarder la suite.
+
+    Args:
+        chunks (Iterator[str]): Le flux renvoyé par stream
+    """
+    _drain_executor.submit(_drain, chunks)
+
+
+def finish_stream_async(chunks: AsyncIterator[str]) -> None:
+    """
+    Version asynchrone de finish_stream : la fin du flux est lue dans une tâche de la boucle.
+
+    Args:
+        chunks (AsyncIterator[str]): Le flux renvoyé par stream_async
+    """
+    async def drain():
+        try:
+            async for _ in chunks:
+                pass
+        except Exception as e:
+            logger.warning(f"Fin du flux Mistral en échec: {str(e)}")
+
+    task = asyncio.ensure_future(drain())
+    # Référence gardée jusqu'à la fin : la boucle ne garde que des références faibles aux tâches
+    _drain_tasks.add(task)
+    task.add_done_callback(_drain_tasks.discard)
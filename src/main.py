@@ -1,26 +1,28 @@
-from src.meme_selector import MemeSelector
-from src.caption_generator import CaptionGenerator
-from src.meme_finalizer import MemeFinalizer
-from utils.image_utils import save_meme
+import logging
+
+from src.pipeline import get_pipeline
 from PIL import Image
 
-def generate_meme(prompt: str) -> str:
+def generate_meme(prompt: str, mode: str = "separate", working: bool = False, fresh: bool = False) -> str:
     """
     Génère un mème à partir d'un prompt texte.
     
     Args:
         prompt (str): Le prompt décrivant la situation pour le mème
+        mode (str): "separate" (deux appels à l'API) ou "combined" (un seul appel)
+        working (bool): Partir de la copie réduite du template (envoi dans un chat)
+        fresh (bool): Ignorer les réponses en cache et demander une nouvelle blague
         
     Returns:
         str: Le chemin du fichier mème généré
     """
-    # Génération du mème avec le MemeFinalizer
-    finalizer = MemeFinalizer()
-    meme_path = finalizer.create_meme(prompt)
+    # Génération du mème avec le pipeline partagé du processus
+    meme_path = get_pipeline().create_meme(prompt, mode=mode, working=working, fresh=fresh)
     return meme_path
 
 def main():
     """Fonction principale pour tester le générateur de mèmes."""
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     # Exemple d'utilisation
     prompt = input("Entrez votre prompt pour le mème : ")
     
@@ -1,55 +1,218 @@
 from PIL import Image, ImageDraw, ImageFont
 import os
-import sys
+import asyncio
+import io
+import logging
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
-# Ajoute le répertoire parent au path pour pouvoir importer utils
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.animation import CaptionOverlay, encode_animation
+from utils.image_utils import EncodedImage, ensure_meme_directory, encode_image, encode_profiles, get_profile, make_contact_sheet
+from utils.font_cache import get_font, get_font_metrics, fit_font_size
+from utils.template_cache import TemplateCache, DEFAULT_MAX_BYTES, normalize_template_id
+from utils.text_renderer import draw_caption, outline_size_for, shadow_offset_for
+from utils.layout import CaptionLayout, fit_caption, line_positions, regions_for, render_layout
+from src.template_hints import HINTS_PATH, build_hints, load_hints
+from src.catalog import CatalogChanges, CatalogSnapshot
+from src.llm import load_env
+from src.metrics import register_callback, timed
+from src.output_store import OutputStore, render_key
+
+if TYPE_CHECKING:
+    # Importés à la construction du sélecteur et du générateur par défaut
+    from src.meme_selector import MemeSelector
+    from src.caption_generator import CaptionGenerator
+
+logger = logging.getLogger(__name__)
+
+
+def _lru_lookups() -> dict:
+    """Succès et échecs des caches LRU de polices et d'ajustement, pour /metrics."""
+    lookups = {}
+    for name, cached in (("font", get_font), ("font_fit", fit_caption)):
+        info = cached.cache_info()
+        lookups[(name, "hit")] = info.hits
+        lookups[(name, "miss")] = info.misses
+    return lookups
+
+
+register_callback(
+    "meme_lru_cache_requests_total", "Consultations des caches LRU du rendu par résultat", "counter",
+    ("cache", "result"), _lru_lookups,
+)
+
+LLM_MODES = ("separate", "combined")
+DEFAULT_FONT_PATH = "/System/Library/Fonts/Supplemental/Arial.ttf"  # Use system Arial font
+# Nombre de lignes d'une caption simple, sauf "max_lines" dans l'entrée du catalogue ("max_lines": 1 garde une seule ligne)
+DEFAULT_CAPTION_LINES = 2
+# Au-delà de cette luminance sous la caption, le contour est épaissi pour détacher le texte blanc
+BRIGHT_LUMINANCE = 0.75
+# À incrémenter quand le rendu change : les mèmes déjà stockés ne sont plus resservis
+RENDER_VERSION = 2
+# Profils d'encodage par défaut (voir utils.image_utils.PROFILES) : le JPEG pleine qualité historique
+DEFAULT_PROFILES = ("archive",)
+
+# Rappel de progression : (étape, données). Étapes : "template" (meme_id, meme_info, path),
+# "caption" (index, text : chaque caption dès qu'elle est écrite, en flux ; "captions_reset" les
+# retire si la réponse s'avère invalide), "captions" (texts, ou variants pour les variantes) puis
+# "image" (result, une fois par mème rendu)
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
+
+# Décodage du template et préparation de la police pendant l'appel au LLM
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="template-prefetch")
+
+
+def _notify(progress: Optional[ProgressCallback], stage: str, **data: Any) -> None:
+    """Signale une étape terminée ; une erreur de l'appelant n'interrompt pas la génération."""
+    if progress is None:
+        return
+    try:
+        progress(stage, data)
+    except Exception as e:
+        logger.warning(f"Erreur du rappel de progression ({stage}): {str(e)}")
+
+
+@dataclass
+class MemeResult:
+    """
+    Un mème rendu : l'image, ses encodages en mémoire et leurs éventuels fichiers.
+
+    buffer, mime_type, extension et path décrivent le premier profil demandé ;
+    encodings les donne tous, par nom de profil. Pour un template animé, image
+    est la première image avec ses captions.
+    """
+    meme_id: str
+    captions: List[str]
+    image: Image.Image
+    buffer: io.BytesIO
+    filename: str
+    mime_type: str = "image/jpeg"
+    path: Optional[str] = None
+    extension: str = "jpg"
+    encodings: Dict[str, EncodedImage] = field(default_factory=dict)
+
+    @property
+    def data(self) -> memoryview:
+        """Le contenu encodé, sans copie."""
+        return self.buffer.getbuffer()
+
+    @classmethod
+    def from_encodings(cls, meme_id: str, captions: List[str], image: Image.Image, filename: str, encodings: Dict[str, EncodedImage]) -> "MemeResult":
+        """Construit le résultat autour de ses encodages (le premier est le principal)."""
+        primary = next(iter(encodings.values()))
+        return cls(
+            meme_id=meme_id,
+            captions=captions,
+            image=image,
+            buffer=primary.buffer,
+            filename=filename,
+            mime_type=primary.mime_type,
+            path=primary.path,
+            extension=primary.extension,
+            encodings=encodings,
+        )
 
-from utils.image_utils import ensure_meme_directory, save_meme
-from src.meme_selector import MemeSelector
-from src.caption_generator import CaptionGenerator
 
 class MemeFinalizer:
-    def __init__(self):
-        """Initialise le finaliseur de mèmes."""
+    def __init__(
+        self,
+        selector: Optional["MemeSelector"] = None,
+        caption_generator: Optional["CaptionGenerator"] = None,
+        templates: Optional[TemplateCache] = None,
+        hints_path: str = HINTS_PATH,
+    ):
+        """
+        Initialise le finaliseur de mèmes.
+
+        Args:
+            selector (MemeSelector, optional): Sélecteur partagé (créé à la première utilisation si absent)
+            caption_generator (CaptionGenerator, optional): Générateur partagé (créé à la première utilisation si absent)
+            templates (TemplateCache, optional): Cache des templates décodés (budget lu dans
+                MEME_TEMPLATE_CACHE_MB si absent)
+            hints_path (str): Les zones de texte précalculées (python -m src.template_hints)
+        """
+        load_env()
         self.meme_dir = "data/img"
-        self.font_path = "/System/Library/Fonts/Supplemental/Arial.ttf"  # Use system Arial font
+        self.font_path = os.environ.get("MEME_FONT_PATH", DEFAULT_FONT_PATH)
         ensure_meme_directory(self.meme_dir)
-        self.selector = MemeSelector()
-        self.caption_generator = CaptionGenerator()
-        
+        self._selector = selector
+        self._caption_generator = caption_generator
+        if templates is None:
+            max_mb = int(os.environ.get("MEME_TEMPLATE_CACHE_MB", DEFAULT_MAX_BYTES // (1024 * 1024)))
+            templates = TemplateCache(self.meme_dir, max_bytes=max_mb * 1024 * 1024)
+        self.templates = templates
+        # Zones de texte calculées hors ligne ; sans elles, l'ancien placement en bas s'applique
+        self.hints_path = hints_path
+        self.hints = load_hints(hints_path)
+        # Un stockage adressé par contenu par répertoire de sortie
+        self._stores: Dict[str, OutputStore] = {}
+        self._stores_lock = threading.Lock()
+        if selector is not None:
+            selector.catalog.subscribe(self._on_catalog_change)
+
+    @property
+    def selector(self) -> "MemeSelector":
+        """Sélecteur de mèmes, construit à la demande."""
+        if self._selector is None:
+            from src.meme_selector import MemeSelector
+            self._selector = MemeSelector()
+            self._selector.catalog.subscribe(self._on_catalog_change)
+        return self._selector
+
+    def _on_catalog_change(self, old: CatalogSnapshot, new: CatalogSnapshot, changes: CatalogChanges) -> None:
+        """
+        Suit un rechargement du catalogue : seules les images changées quittent le cache.
+
+        Les rendus stockés et les réponses du LLM n'ont rien à invalider : leurs
+        clés contiennent déjà le fichier du template et la version du catalogue.
+        """
+        if not changes.images:
+            return
+        self.templates.refresh_index()
+        for template_id in changes.images:
+            self.templates.invalidate(template_id)
+        if os.path.exists(self.hints_path):
+            # Seules les images nouvelles ou modifiées sont réanalysées
+            self.hints = build_hints(self.meme_dir, self.hints_path)
+        logger.info(f"Templates rechargés: {', '.join(sorted(changes.images))}")
+
+    @property
+    def caption_generator(self) -> "CaptionGenerator":
+        """Générateur de captions, construit à la demande."""
+        if self._caption_generator is None:
+            from src.caption_generator import CaptionGenerator
+            self._caption_generator = CaptionGenerator()
+        return self._caption_generator
+
     def _load_font(self, size: int) -> ImageFont.FreeTypeFont:
-        """Charge la police avec la taille spécifiée."""
+        """Charge la police avec la taille spécifiée (cache LRU partagé par (chemin, taille))."""
+        if not os.path.exists(self.font_path):
+            raise FileNotFoundError(f"Le fichier de police {self.font_path} n'existe pas")
         try:
-            print(f"   Tentative de chargement de la police depuis {self.font_path}")
-            if not os.path.exists(self.font_path):
-                raise FileNotFoundError(f"Le fichier de police {self.font_path} n'existe pas")
-                
-            # Essayer d'abord avec truetype
-            try:
-                return ImageFont.truetype(self.font_path, size)
-            except Exception as e:
-                print(f"   Erreur avec truetype: {str(e)}")
-                
-            # Si ça échoue, essayer avec load_path
-            try:
-                return ImageFont.load_path(self.font_path)
-            except Exception as e:
-                print(f"   Erreur avec load_path: {str(e)}")
-                
-            # Si tout échoue, utiliser une police par défaut
-            print("   Utilisation de la police par défaut...")
+            return get_font(self.font_path, size)
+        except OSError as e:
+            logger.warning(f"Erreur avec truetype ({str(e)}), utilisation de la police par défaut...")
             return ImageFont.load_default()
-        except Exception as e:
-            print(f"   Erreur lors du chargement de la police: {str(e)}")
-            raise
         
-    def _get_text_position(self, image: Image.Image, text: str, font: ImageFont.FreeTypeFont) -> tuple:
-        """Calcule la position du texte en bas de l'image."""
+    def _hint_box(self, image: Image.Image, hint: dict) -> tuple:
+        """La zone de texte recommandée, en pixels."""
+        left, top, right, bottom = hint["box"]
+        return int(left * image.width), int(top * image.height), int(right * image.width), int(bottom * image.height)
+
+    def _get_text_position(self, image: Image.Image, text: str, font: ImageFont.FreeTypeFont, hint: Optional[dict] = None) -> tuple:
+        """Calcule la position du texte : dans la zone recommandée, sinon en bas de l'image."""
         draw = ImageDraw.Draw(image)
         text_bbox = draw.textbbox((0, 0), text, font=font)
         text_width = text_bbox[2] - text_bbox[0]
         text_height = text_bbox[3] - text_bbox[1]
+
+        if hint is not None:
+            left, top, right, bottom = self._hint_box(image, hint)
+            x = left + (right - left - text_width) // 2
+            y = top if hint["valign"] == "top" else bottom - text_height
+            return x, y
         
         # Centre le texte en bas avec une marge proportionnelle à la hauteur de l'image
         margin = max(20, image.height // 15)  # Au moins 30px, ou plus pour les grandes images
@@ -57,172 +220,792 @@ class MemeFinalizer:
         y = image.height - text_height - margin
         return x, y
             
-    def _calculate_optimal_font_size(self, image: Image.Image, text: str, max_width_ratio: float = 0.95, max_height_ratio: float = 0.3) -> int:
+    def _caption_box(self, image: Image.Image, max_width_ratio: float = 0.95, max_height_ratio: float = 0.3, hint: Optional[dict] = None) -> tuple:
         """
-        Calcule la taille de police optimale pour que le texte rentre dans la zone désirée.
+        Zone de la caption simple et taille de départ de la police.
+
+        Returns:
+            tuple: La zone en pixels (gauche, haut, droite, bas), son alignement vertical
+                et la plus grande taille de police essayée
+        """
+        # Calcul de la taille de départ en fonction de la taille de l'image
+        # Plus l'image est grande, plus on commence avec une grande taille
+        start_size = min(image.height // 6, image.width // 8)  # Taille proportionnelle à l'image
+        start_size = max(start_size, 40)  # Au moins 40px
+
+        if hint is not None:
+            start_size = max(min(start_size, int(hint["max_font_ratio"] * image.height)), 22)
+            return self._hint_box(image, hint), hint["valign"], start_size
+
+        # En bas, centrée, avec une marge proportionnelle à la hauteur de l'image
+        max_width = int(image.width * max_width_ratio)
+        margin = max(20, image.height // 15)
+        left = (image.width - max_width) // 2
+        bottom = image.height - margin
+        return (left, bottom - int(image.height * max_height_ratio), left + max_width, bottom), "bottom", start_size
+
+    def _fit_caption(self, image: Image.Image, text: str, hint: Optional[dict] = None, max_lines: int = DEFAULT_CAPTION_LINES) -> CaptionLayout:
+        """
+        Choisit les coupures de ligne et la taille de police de la caption.
+
+        Le résultat est mémorisé par (police, caption, zone) : un template déjà
+        rendu avec la même caption ne refait aucune mesure.
+        """
+        if not os.path.exists(self.font_path):
+            raise FileNotFoundError(f"Le fichier de police {self.font_path} n'existe pas")
+        (left, top, right, bottom), _, start_size = self._caption_box(image, hint=hint)
+        # Recherche guidée par la table des glyphes, de 2 en 2 jusqu'à 20px minimum
+        return fit_caption(self.font_path, text, right - left, bottom - top, start_size, max_lines, min_size=20, step=2)
+
+    def _calculate_optimal_font_size(self, image: Image.Image, text: str, max_width_ratio: float = 0.95, max_height_ratio: float = 0.3, hint: Optional[dict] = None) -> int:
+        """
+        Calcule la taille de police optimale pour que le texte rentre sur une ligne dans la zone désirée.
         
         Args:
             image: L'image sur laquelle le texte sera ajouté
             text: Le texte à ajouter
             max_width_ratio: Ratio maximum de la largeur de l'image que le texte peut occuper
             max_height_ratio: Ratio maximum de la hauteur de l'image que le texte peut occuper
+            hint: Zone recommandée par l'analyse hors ligne (remplace les deux ratios)
             
         Returns:
             int: La taille de police optimale
         """
-        max_width = int(image.width * max_width_ratio)
-        max_height = int(image.height * max_height_ratio)
-        
-        # Calcul de la taille de départ en fonction de la taille de l'image
-        # Plus l'image est grande, plus on commence avec une grande taille
-        start_size = min(image.height // 6, image.width // 8)  # Taille proportionnelle à l'image
-        start_size = max(start_size, 40)  # Au moins 40px
-        font_size = start_size
-        
-        draw = ImageDraw.Draw(image)
-        
         # Vérifie que le fichier de police existe
         if not os.path.exists(self.font_path):
-            print("   Police non trouvée, utilisation de la police par défaut")
+            logger.warning("Police non trouvée, utilisation de la police par défaut")
             return 40  # Taille par défaut
         
-        while font_size > 20:  # Taille minimum de 20px
-            try:
-                font = ImageFont.truetype(self.font_path, font_size)
-                text_bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
-                
-                if text_width <= max_width and text_height <= max_height:
-                    return font_size
-                    
-                font_size -= 2
-            except Exception:
-                font_size -= 2
-                
-        return 20  # Taille minimum si rien d'autre ne fonctionne
+        (left, top, right, bottom), _, start_size = self._caption_box(image, max_width_ratio, max_height_ratio, hint)
+        return fit_font_size(self.font_path, text, right - left, bottom - top, start_size, min_size=20, step=2)
             
-    def _add_text_to_image(self, image: Image.Image, text: str, font_size: int = None) -> Image.Image:
-        """Ajoute du texte en bas de l'image."""
+    def _add_text_to_image(
+        self,
+        image: Image.Image,
+        text: str,
+        font_size: int = None,
+        hint: Optional[dict] = None,
+        max_lines: int = DEFAULT_CAPTION_LINES,
+    ) -> Image.Image:
+        """Ajoute du texte, sur une ou plusieurs lignes, dans la zone recommandée du template ou en bas de l'image."""
         try:
-            print("   Création du contexte de dessin...")
-            draw = ImageDraw.Draw(image)
-            
-            print("   Calcul de la taille de police optimale...")
-            if font_size is None:
-                font_size = self._calculate_optimal_font_size(image, text)
-            print(f"   Taille de police choisie: {font_size}px")
-            
-            print("   Chargement de la police...")
-            font = self._load_font(font_size)
+            logger.debug("Calcul des lignes et de la taille de police...")
+            with timed("font_fit"):
+                if font_size is None:
+                    layout = self._fit_caption(image, text, hint=hint, max_lines=max_lines)
+                else:
+                    layout = CaptionLayout(font_size, (text,))
+            logger.info(f"Taille de police choisie: {layout.size}px, {len(layout.lines)} ligne(s)")
             
-            print("   Calcul de la position du texte...")
-            # Position du texte
-            x, y = self._get_text_position(image, text, font)
+            logger.debug("Chargement de la police...")
+            font = self._load_font(layout.size)
             
-            print("   Ajout de l'ombre...")
-            # Ajout d'une ombre portée
-            shadow_offset = max(2, font_size // 30)  # Offset proportionnel à la taille de police
-            shadow_color = (0, 0, 0, 180)  # Noir semi-transparent
-            for offset_x in range(shadow_offset, shadow_offset * 2):
-                for offset_y in range(shadow_offset, shadow_offset * 2):
-                    draw.text((x + offset_x, y + offset_y), text, font=font, fill=shadow_color)
+            logger.debug("Calcul de la position du texte...")
+            box, valign, _ = self._caption_box(image, hint=hint)
+            positions = line_positions(font, layout.lines, box, valign=valign)
+            outline_size = outline_size_for(layout.size)
+            if hint is not None and hint["luminance"] > BRIGHT_LUMINANCE:
+                outline_size = outline_size * 3 // 2
             
-            print("   Ajout du contour noir...")
-            # Ajout d'un contour noir plus épais pour la lisibilité
-            outline_size = max(2, font_size // 25)  # Contour proportionnel à la taille de police
-            for offset_x in range(-outline_size, outline_size + 1):
-                for offset_y in range(-outline_size, outline_size + 1):
-                    if abs(offset_x) + abs(offset_y) <= outline_size + 1:
-                        draw.text((x + offset_x, y + offset_y), text, font=font, fill="black")
-            
-            print("   Ajout du texte principal...")
-            # Texte principal en blanc
-            draw.text((x, y), text, font=font, fill="white")
+            logger.debug("Ajout du texte avec contour et ombre...")
+            # Chaque ligne est rastérisée une fois ; contour et ombre en sont dérivés
+            with timed("text_render"):
+                for line, position in zip(layout.lines, positions):
+                    draw_caption(
+                        image, position, line, font,
+                        outline_size=outline_size,
+                        shadow_offset=shadow_offset_for(layout.size),
+                    )
             
             return image
         except Exception as e:
-            print(f"   Erreur lors de l'ajout du texte: {str(e)}")
+            logger.error(f"Erreur lors de l'ajout du texte: {str(e)}")
             raise
         
-    def create_meme(self, prompt: str, output_dir: str = "output") -> str:
+    def _load_template(self, meme_id: str, working: bool = False) -> Image.Image:
+        """
+        Renvoie une copie modifiable du template décodé.
+
+        Le décodage n'a lieu qu'une fois par mème tant que le template reste
+        dans le cache : les appels suivants copient l'image gardée en mémoire.
+
+        Args:
+            meme_id (str): L'identifiant du mème
+            working (bool): Utiliser la copie réduite destinée aux chats
+        """
+        logger.debug(f"Chemin de l'image: {self.templates.path_for(meme_id)}")
+        # Décodage au premier appel, simple copie tant que le template reste en cache
+        with timed("template_decode"):
+            image = self.templates.get(meme_id, working=working)
+        logger.debug(f"Dimensions: {image.width}x{image.height}")
+        return image
+
+    def preload(self, meme_ids: Iterable[str]) -> None:
+        """
+        Charge à l'avance la police et les templates des mèmes donnés.
+
+        Args:
+            meme_ids (Iterable[str]): Les identifiants des mèmes à décoder
+        """
+        if os.path.exists(self.font_path):
+            get_font_metrics(self.font_path)
+        for meme_id in meme_ids:
+            try:
+                self.templates.warm(meme_id)
+            except (FileNotFoundError, ValueError) as e:
+                logger.warning(f"Template ignoré: {str(e)}")
+
+    def select_and_caption(
+        self, prompt: str, mode: str, fresh: bool = False, progress: Optional[ProgressCallback] = None
+    ) -> tuple:
+        """
+        Sélectionne le mème et génère ses captions.
+
+        Args:
+            prompt (str): Le prompt décrivant la situation
+            mode (str): "separate" (deux appels) ou "combined" (un seul appel)
+            fresh (bool): Ignorer les réponses en cache (nouvelle blague)
+            progress (ProgressCallback, optional): Rappelé après la sélection puis après les captions
+
+        Returns:
+            tuple: L'ID du mème, ses informations et ses captions
+        """
+        if mode not in LLM_MODES:
+            raise ValueError(f"Mode inconnu: {mode} (attendu: {', '.join(LLM_MODES)})")
+
+        if mode == "combined":
+            logger.info("1-2. Sélection du mème et génération de la caption en un appel...")
+            try:
+                with timed("combined"):
+                    meme_id, meme_info, texts = self.selector.select_meme_with_captions(prompt, fresh=fresh)
+                logger.info(f"ID du mème: {meme_id}")
+                logger.info(f"Format: {meme_info.get('format', 'Non disponible')}")
+                self._notify_template(progress, meme_id, meme_info)
+                _notify(progress, "captions", texts=texts)
+                return meme_id, meme_info, texts
+            except ValueError as e:
+                logger.warning(f"Réponse combinée invalide ({str(e)}), retour aux deux appels")
+
+        # 1. Sélection du mème
+        logger.info("1. Sélection du mème...")
+        with timed("select"):
+            meme_id, meme_info = self.selector.select_meme(prompt, fresh=fresh)
+        logger.info(f"ID du mème: {meme_id}")
+        logger.info(f"Description: {meme_info.get('description', 'Non disponible')}")
+        logger.info(f"Format: {meme_info.get('format', 'Non disponible')}")
+        self._notify_template(progress, meme_id, meme_info)
+        prefetch = self._prefetch(meme_id)
+
+        # 2. Génération de la caption
+        logger.info("2. Génération de la caption...")
+        with timed("caption"):
+            texts = self._generate_captions(prompt, meme_info, fresh, progress)
+        _notify(progress, "captions", texts=texts)
+        prefetch.result()
+        return meme_id, meme_info, texts
+
+    async def select_and_caption_async(
+        self, prompt: str, mode: str, fresh: bool = False, progress: Optional[ProgressCallback] = None
+    ) -> tuple:
+        """Version asynchrone de select_and_caption."""
+        if mode not in LLM_MODES:
+            raise ValueError(f"Mode inconnu: {mode} (attendu: {', '.join(LLM_MODES)})")
+
+        if mode == "combined":
+            logger.info("1-2. Sélection du mème et génération de la caption en un appel...")
+            try:
+                with timed("combined"):
+                    meme_id, meme_info, texts = await self.selector.select_meme_with_captions_async(prompt, fresh=fresh)
+                logger.info(f"ID du mème: {meme_id}")
+                self._notify_template(progress, meme_id, meme_info)
+                _notify(progress, "captions", texts=texts)
+                return meme_id, meme_info, texts
+            except ValueError as e:
+                logger.warning(f"Réponse combinée invalide ({str(e)}), retour aux deux appels")
+
+        logger.info("1. Sélection du mème...")
+        with timed("select"):
+            meme_id, meme_info = await self.selector.select_meme_async(prompt, fresh=fresh)
+        logger.info(f"ID du mème: {meme_id}")
+        self._notify_template(progress, meme_id, meme_info)
+        prefetch = asyncio.wrap_future(self._prefetch(meme_id))
+
+        logger.info("2. Génération de la caption...")
+        with timed("caption"):
+            texts = await self._generate_captions_async(prompt, meme_info, fresh, progress)
+        _notify(progress, "captions", texts=texts)
+        await prefetch
+        return meme_id, meme_info, texts
+
+    def _generate_captions(
+        self, prompt: str, meme_info: dict, fresh: bool, progress: Optional[ProgressCallback] = None
+    ) -> List[str]:
+        """
+        Génère les captions, en flux si le générateur le permet.
+
+        En flux, chaque caption est signalée ("caption") dès que sa chaîne est
+        fermée, et la main revient dès que la liste est complète : le rendu
+        démarre sans attendre la fin de la réponse.
+        """
+        generator = self.caption_generator
+        if not getattr(generator, "streaming", False):
+            return generator.generate_captions(prompt, meme_info, fresh=fresh)
+        return generator.stream_captions(
+            prompt, meme_info, on_caption=lambda index, text: _notify(progress, "caption", index=index, text=text),
+            fresh=fresh, on_reset=lambda: _notify(progress, "captions_reset"),
+        )
+
+    async def _generate_captions_async(
+        self, prompt: str, meme_info: dict, fresh: bool, progress: Optional[ProgressCallback] = None
+    ) -> List[str]:
+        """Version asynchrone de _generate_captions."""
+        generator = self.caption_generator
+        if not getattr(generator, "streaming", False):
+            return await generator.generate_captions_async(prompt, meme_info, fresh=fresh)
+        return await generator.stream_captions_async(
+            prompt, meme_info, on_caption=lambda index, text: _notify(progress, "caption", index=index, text=text),
+            fresh=fresh, on_reset=lambda: _notify(progress, "captions_reset"),
+        )
+
+    def _prefetch_template(self, meme_id: str) -> None:
+        """Décode le template et prépare la police ; une erreur sera levée au rendu."""
+        try:
+            with timed("prefetch"):
+                self.templates.warm(meme_id)
+                if os.path.exists(self.font_path):
+                    get_font_metrics(self.font_path)
+        except Exception as e:
+            logger.warning(f"Préchargement du template {meme_id} impossible: {str(e)}")
+
+    def _prefetch(self, meme_id: str) -> Future:
+        """
+        Lance le décodage du template pendant que le LLM écrit les captions.
+
+        Le rendu attend la fin du préchargement (en général terminé bien avant
+        les captions) pour ne pas décoder deux fois le même template.
+
+        Returns:
+            Future: Terminé quand le template est en cache
+        """
+        return _prefetch_executor.submit(self._prefetch_template, meme_id)
+
+    def _notify_template(self, progress: Optional[ProgressCallback], meme_id: str, meme_info: dict) -> None:
+        """Signale le mème choisi, avec le fichier du template pour un aperçu."""
+        if progress is not None:
+            _notify(progress, "template", meme_id=meme_id, meme_info=meme_info, path=self.templates.path_for(meme_id))
+
+    def _draw_captions(self, image: Image.Image, meme_id: str, texts: List[str], meme_info: Optional[dict] = None) -> Image.Image:
+        """
+        Ajoute les captions sur le template.
+
+        Une caption simple sans zone déclarée est placée dans la zone précalculée
+        du template (ou en bas de l'image) ; les autres sont mises en page dans
+        les zones du mème (voir utils.layout).
+
+        Args:
+            image (Image.Image): Le template à modifier (en place)
+            meme_id (str): L'identifiant du mème
+            texts (List[str]): Les captions
+            meme_info (dict, optional): L'entrée du catalogue (format et zones)
+
+        Raises:
+            ValueError: S'il n'y a aucune caption, ou si les zones ne correspondent pas au nombre de captions
         """
-        Crée un mème complet à partir d'un prompt.
+        regions = regions_for(meme_info, len(texts))
+        if not texts:
+            raise ValueError(f"Aucune caption à dessiner sur le mème {meme_id}")
+        if regions is None:
+            hint = self.hints.get(normalize_template_id(meme_id))
+            max_lines = int((meme_info or {}).get("max_lines", DEFAULT_CAPTION_LINES))
+            return self._add_text_to_image(image, texts[0], hint=hint, max_lines=max_lines)
+        if not os.path.exists(self.font_path):
+            raise FileNotFoundError(f"Le fichier de police {self.font_path} n'existe pas")
+        logger.info(f"Mise en page de {len(texts)} captions...")
+        with timed("text_render"):
+            return render_layout(image, texts, regions, self.font_path)
+
+    def _caption_overlay(
+        self, image: Image.Image, meme_id: str, texts: List[str], meme_info: Optional[dict] = None
+    ) -> Tuple[Image.Image, CaptionOverlay]:
+        """
+        Dessine les captions d'un template animé une seule fois, sur un calque transparent.
+
+        Le calque est composé sur chaque image de l'animation au moment de
+        l'encodage (voir utils.animation) ; le texte n'est jamais re-rastérisé.
+
+        Args:
+            image (Image.Image): La première image du template, à la taille de rendu (modifiée en place)
+            meme_id (str): L'identifiant du mème
+            texts (List[str]): Les captions
+            meme_info (dict, optional): L'entrée du catalogue (format et zones)
+
+        Returns:
+            Tuple[Image.Image, CaptionOverlay]: La première image avec ses captions (aperçu) et le calque
+        """
+        layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
+        overlay = CaptionOverlay(self._draw_captions(layer, meme_id, texts, meme_info))
+        return overlay.apply(image), overlay
+
+    def _draw(
+        self, image: Image.Image, meme_id: str, texts: List[str], meme_info: Optional[dict] = None
+    ) -> Tuple[Image.Image, Optional[CaptionOverlay]]:
+        """Ajoute les captions : directement sur une image fixe, sur un calque pour un template animé."""
+        if self.templates.durations(meme_id) is not None:
+            return self._caption_overlay(image, meme_id, texts, meme_info)
+        return self._draw_captions(image, meme_id, texts, meme_info), None
+
+    def store(self, output_dir: str) -> OutputStore:
+        """
+        Le stockage des rendus d'un répertoire de sortie, ouvert au premier usage.
+
+        Args:
+            output_dir (str): Le répertoire de sortie (budget lu dans MEME_OUTPUT_MB)
+
+        Returns:
+            OutputStore: Le stockage adressé par contenu
+        """
+        with self._stores_lock:
+            store = self._stores.get(output_dir)
+            if store is None:
+                store = self._stores[output_dir] = OutputStore.from_env(output_dir)
+            return store
+
+    def _render_keys(
+        self,
+        meme_id: str,
+        texts: List[str],
+        working: bool,
+        meme_info: Optional[dict] = None,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+    ) -> Dict[str, str]:
+        """
+        Empreinte de chaque encodage d'un rendu : tout ce qui change le fichier produit.
+
+        Le fichier du template (taille et date) en fait partie : remplacer une
+        image dans data/img invalide ses rendus.
+
+        Returns:
+            Dict[str, str]: L'empreinte par profil
+        """
+        path = self.templates.path_for(meme_id)
+        stat = os.stat(path)
+        meme_info = meme_info or {}
+        render = {
+            "version": RENDER_VERSION,
+            "template": [os.path.basename(path), stat.st_size, stat.st_mtime_ns],
+            "captions": list(texts),
+            "working": list(self.templates.working_size) if working and self.templates.working_size else None,
+            "font": self.font_path,
+            "hint": self.hints.get(normalize_template_id(meme_id)),
+            "layout": {name: meme_info.get(name) for name in ("format", "regions", "max_lines")},
+        }
+        return {
+            profile: render_key({**render, "encoding": get_profile(profile).key()})
+            for profile in profiles
+        }
+
+    def _lookup(self, output_dir: str, keys: Dict[str, str]) -> Optional[Dict[str, str]]:
+        """Les fichiers déjà stockés de tous les profils, ou None s'il en manque un."""
+        store = self.store(output_dir)
+        paths = {}
+        for profile, key in keys.items():
+            path = store.get(key)
+            if path is None:
+                return None
+            paths[profile] = path
+        return paths
+
+    def _filename(self, prompt: str, suffix: str = "") -> str:
+        """Nom proposé au téléchargement (le fichier stocké porte l'empreinte du rendu)."""
+        return f"meme_{prompt[:20].replace(' ', '_')}{suffix}"
+
+    def _stored_result(self, prompt: str, meme_id: str, texts: List[str], paths: Dict[str, str], suffix: str = "") -> MemeResult:
+        """Un rendu déjà stocké, relu tel quel : ni dessin ni réencodage."""
+        encodings = {}
+        for profile, path in paths.items():
+            with open(path, "rb") as f:
+                data = f.read()
+            # Décodage paresseux : seul l'en-tête est lu (format et dimensions)
+            image = Image.open(io.BytesIO(data))
+            encodings[profile] = EncodedImage(
+                profile, io.BytesIO(data), image.format, image.size, get_profile(profile).quality, path
+            )
+        logger.info(f"Mème déjà rendu: {', '.join(paths.values())}")
+        primary = next(iter(encodings.values()))
+        return MemeResult.from_encodings(
+            meme_id, texts, Image.open(io.BytesIO(primary.data)), self._filename(prompt, suffix), encodings
+        )
+
+    def _result(
+        self,
+        prompt: str,
+        meme_id: str,
+        texts: List[str],
+        meme: Image.Image,
+        output_dir: Optional[str],
+        suffix: str = "",
+        keys: Optional[Dict[str, str]] = None,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+        overlay: Optional[CaptionOverlay] = None,
+    ) -> MemeResult:
+        """
+        Encode un mème rendu selon chaque profil et range les fichiers si un répertoire est donné.
+
+        Avec un calque (template animé), les images du template sont relues une à
+        une et reçoivent le calque au fil de l'encodage.
+        """
+        # Tous les profils partent de la même image rendue (ou de la même lecture de l'animation), en un passage
+        with timed("encode"):
+            if overlay is not None:
+                path = self.templates.path_for(meme_id)
+                encodings = encode_animation(path, self.templates.durations(meme_id), overlay, profiles)
+            else:
+                encodings = encode_profiles(meme, profiles)
+        for encoded in encodings.values():
+            logger.debug(f"Taille ({encoded.profile}): {encoded.data.nbytes} octets, {encoded.size[0]}x{encoded.size[1]}")
+            if output_dir is not None and keys is not None:
+                encoded.path = self.store(output_dir).put(keys[encoded.profile], encoded.data, encoded.extension)
+                logger.info(f"Mème sauvegardé: {encoded.path}")
+        return MemeResult.from_encodings(meme_id, texts, meme, self._filename(prompt, suffix), encodings)
+
+    def compose(
+        self,
+        prompt: str,
+        meme_id: str,
+        texts: List[str],
+        working: bool,
+        output_dir: Optional[str],
+        meme_info: Optional[dict] = None,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+    ) -> MemeResult:
+        """
+        Partie CPU de la création : chargement du template, texte, encodage, sauvegarde.
+
+        Les captions déjà connues (voir select_and_caption), elle peut tourner
+        seule, dans un autre thread ou processus (rendu d'un lot). Avec un
+        répertoire de sortie, un rendu identique déjà stocké est resservi sans
+        dessin ni encodage.
+
+        Args:
+            prompt (str): Le prompt (pour le nom du fichier)
+            meme_id (str): L'identifiant du mème choisi
+            texts (List[str]): Les captions générées
+            working (bool): Partir de la copie réduite du template
+            output_dir (str, optional): Répertoire où écrire aussi le mème
+            meme_info (dict, optional): L'entrée du catalogue (format et zones de texte)
+            profiles (Sequence[str]): Les profils d'encodage, le principal en premier
+
+        Returns:
+            MemeResult: Le mème rendu
+        """
+        logger.info(f"Captions générées: {texts}")
+        keys = None
+        if output_dir is not None:
+            keys = self._render_keys(meme_id, texts, working, meme_info, profiles)
+            paths = self._lookup(output_dir, keys)
+            if paths is not None:
+                return self._stored_result(prompt, meme_id, texts, paths)
+
+        # 3. Chargement de l'image
+        logger.info("3. Chargement de l'image...")
+        image = self._load_template(meme_id, working=working)
+
+        # 4. Ajout du texte
+        logger.info("4. Ajout du texte...")
+        meme, overlay = self._draw(image, meme_id, texts, meme_info)
+        
+        # 5. Encodage en mémoire, puis sauvegarde optionnelle
+        logger.info("5. Encodage...")
+        return self._result(prompt, meme_id, texts, meme, output_dir, keys=keys, profiles=profiles, overlay=overlay)
+
+    def _compose_variants(
+        self,
+        prompt: str,
+        meme_id: str,
+        variants: List[List[str]],
+        working: bool,
+        output_dir: Optional[str],
+        meme_info: Optional[dict] = None,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+    ) -> List[MemeResult]:
+        """
+        Rend plusieurs jeux de captions sur le même template, en parallèle.
+
+        Le template est décodé une seule fois ; chaque variante dessine sur sa
+        propre copie. Les métriques de police sont préparées avant de lancer les
+        threads pour qu'ils les partagent.
+
+        Returns:
+            List[MemeResult]: Les variantes, dans l'ordre des captions
+        """
+        results: List[Optional[MemeResult]] = [None] * len(variants)
+        keys: List[Optional[Dict[str, str]]] = [None] * len(variants)
+        if output_dir is not None:
+            for i, texts in enumerate(variants):
+                keys[i] = self._render_keys(meme_id, texts, working, meme_info, profiles)
+                paths = self._lookup(output_dir, keys[i])
+                if paths is not None:
+                    results[i] = self._stored_result(prompt, meme_id, texts, paths, suffix=f"_v{i + 1}")
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        logger.info(f"3. Chargement de l'image ({len(missing)} variantes)...")
+        template = self._load_template(meme_id, working=working)
+        if os.path.exists(self.font_path):
+            get_font_metrics(self.font_path)
+
+        def render(i: int) -> MemeResult:
+            meme, overlay = self._draw(template.copy(), meme_id, variants[i], meme_info)
+            return self._result(
+                prompt, meme_id, variants[i], meme, output_dir, suffix=f"_v{i + 1}", keys=keys[i], profiles=profiles,
+                overlay=overlay,
+            )
+
+        logger.info("4. Ajout du texte et encodage...")
+        # Le rendu (OpenCV) et l'encodage (Pillow) relâchent le GIL : les threads suffisent
+        with ThreadPoolExecutor(max_workers=min(len(missing), os.cpu_count() or 1)) as pool:
+            for i, result in zip(missing, pool.map(render, missing)):
+                results[i] = result
+        return results
+
+    def render_meme(
+        self,
+        prompt: str,
+        mode: str = "separate",
+        working: bool = False,
+        output_dir: Optional[str] = None,
+        fresh: bool = False,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+        progress: Optional[ProgressCallback] = None,
+    ) -> MemeResult:
+        """
+        Crée un mème complet en mémoire à partir d'un prompt.
         
         Args:
             prompt (str): Le prompt décrivant la situation
-            output_dir (str): Le répertoire de sortie
+            mode (str): "separate" (sélection puis caption) ou "combined" (un seul appel à l'API)
+            working (bool): Partir de la copie réduite du template (envoi dans un chat)
+            output_dir (str, optional): Répertoire où écrire aussi le mème (rien n'est écrit si None)
+            fresh (bool): Ignorer les réponses en cache et demander une nouvelle blague
+            profiles (Sequence[str]): Les profils d'encodage (voir utils.image_utils.PROFILES), le principal en premier
+            progress (ProgressCallback, optional): Rappelé à chaque étape terminée (mème choisi,
+                captions, image), pour un affichage progressif
             
         Returns:
-            str: Le chemin du mème généré
+            MemeResult: L'image, ses encodages en mémoire et, si demandé, leurs chemins
         """
         try:
-            print("\n=== Détails de la génération du mème ===")
-            print(f"Prompt reçu: '{prompt}'")
-            
-            # 1. Sélection du mème
-            print("\n1. Sélection du mème...")
-            meme_id, meme_info = self.selector.select_meme(prompt)
-            print(f"   ID du mème: {meme_id}")
-            print(f"   Description: {meme_info.get('description', 'Non disponible')}")
-            print(f"   Format: {meme_info.get('format', 'Non disponible')}")
-            
-            # 2. Génération de la caption
-            print("\n2. Génération de la caption...")
-            texts = self.caption_generator.generate_captions(prompt, meme_info)
-            if len(texts) != 1:
-                raise ValueError(f"Ce module ne gère que les mèmes avec une seule caption (reçu {len(texts)} captions)")
-            caption = texts[0]
-            print(f"   Caption générée: '{caption}'")
-            
-            # 3. Chargement de l'image
-            print("\n3. Chargement de l'image...")
-            # Essayer d'abord avec .png, puis .jpg si non trouvé
-            image_path = os.path.join(self.meme_dir, f"{meme_id}.png")
-            if not os.path.exists(image_path):
-                image_path = os.path.join(self.meme_dir, f"{meme_id}.jpg")
-                if not os.path.exists(image_path):
-                    raise FileNotFoundError(f"Image du mème {meme_id} non trouvée (ni en PNG ni en JPG)")
-            
-            print(f"   Chemin de l'image: {image_path}")
+            logger.info("=== Détails de la génération du mème ===")
+            logger.info(f"Prompt reçu: '{prompt}'")
             
-            try:
-                image = Image.open(image_path)
-                print(f"   Dimensions: {image.width}x{image.height}")
-                print(f"   Format: {image.format}")
-                print(f"   Mode: {image.mode}")
-                
-                # Convertir en RGB si nécessaire
-                if image.mode != 'RGB':
-                    print("   Conversion en RGB...")
-                    image = image.convert('RGB')
-            except Exception as e:
-                raise ValueError(f"Erreur lors de l'ouverture de l'image {image_path}: {str(e)}")
-            
-            # 4. Ajout du texte
-            print("\n4. Ajout du texte...")
-            meme = self._add_text_to_image(image, caption)
+            with timed("total"):
+                meme_id, meme_info, texts = self.select_and_caption(prompt, mode, fresh, progress)
+                result = self.compose(prompt, meme_id, texts, working, output_dir, meme_info, profiles)
+            _notify(progress, "image", result=result)
+            return result
+        except Exception as e:
+            logger.error(f"Erreur: {str(e)}")
+            raise
+
+    async def render_meme_async(
+        self,
+        prompt: str,
+        mode: str = "separate",
+        working: bool = False,
+        output_dir: Optional[str] = None,
+        executor: Optional[Executor] = None,
+        fresh: bool = False,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+        progress: Optional[ProgressCallback] = None,
+    ) -> MemeResult:
+        """
+        Version asynchrone de render_meme : appels à l'API non bloquants, rendu dans un pool.
+        
+        Args:
+            prompt (str): Le prompt décrivant la situation
+            mode (str): "separate" ou "combined"
+            working (bool): Partir de la copie réduite du template (envoi dans un chat)
+            output_dir (str, optional): Répertoire où écrire aussi le mème
+            executor (Executor, optional): Pool où faire le rendu (pool par défaut de la boucle si absent)
+            fresh (bool): Ignorer les réponses en cache
+            profiles (Sequence[str]): Les profils d'encodage, le principal en premier
+            progress (ProgressCallback, optional): Rappelé à chaque étape terminée, depuis la boucle
             
-            # 5. Sauvegarde
-            print("\n5. Sauvegarde...")
-            filename = f"meme_{prompt[:20].replace(' ', '_')}"
-            output_path = save_meme(meme, filename, output_dir)
-            print(f"   Mème sauvegardé: {output_path}")
+        Returns:
+            MemeResult: Le mème rendu
+        """
+        try:
+            logger.info("=== Détails de la génération du mème ===")
+            logger.info(f"Prompt reçu: '{prompt}'")
             
-            return output_path
+            with timed("total"):
+                meme_id, meme_info, texts = await self.select_and_caption_async(prompt, mode, fresh, progress)
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(
+                    executor, self.compose, prompt, meme_id, texts, working, output_dir, meme_info, profiles
+                )
+            _notify(progress, "image", result=result)
+            return result
         except Exception as e:
-            print(f"\nErreur: {str(e)}")
+            logger.error(f"Erreur: {str(e)}")
             raise
 
-def main():
-    """Fonction de test."""
-    finalizer = MemeFinalizer()
-    prompt = "quand tu pushes en prod un vendredi"
-    try:
-        meme_path = finalizer.create_meme(prompt)
-        print(f"Mème généré avec succès : {meme_path}")
-    except Exception as e:
-        print(f"Erreur lors de la génération du mème : {str(e)}")
+    def _template_info(self, meme_id: str) -> dict:
+        """Informations d'un mème imposé par l'appelant."""
+        meme_info = self.selector.get_template_info(meme_id)
+        if meme_info is None:
+            raise ValueError(f"Mème {meme_id} non trouvé")
+        return meme_info
+
+    def _variant_captions(
+        self, prompt: str, n: int, meme_id: Optional[str], fresh: bool, progress: Optional[ProgressCallback] = None
+    ) -> tuple:
+        """Sélection (si aucun mème n'est imposé) puis n captions en un seul appel."""
+        if meme_id is None:
+            logger.info("1. Sélection du mème...")
+            with timed("select"):
+                meme_id, meme_info = self.selector.select_meme(prompt, fresh=fresh)
+        else:
+            meme_info = self._template_info(meme_id)
+        logger.info(f"ID du mème: {meme_id}")
+        self._notify_template(progress, meme_id, meme_info)
+        prefetch = self._prefetch(meme_id)
+        logger.info(f"2. Génération de {n} captions...")
+        with timed("variants"):
+            variants = self.caption_generator.generate_caption_variants(prompt, meme_info, n, fresh=fresh)
+        _notify(progress, "captions", variants=variants)
+        prefetch.result()
+        return meme_id, meme_info, variants
+
+    def render_variants(
+        self,
+        prompt: str,
+        n: int = 3,
+        meme_id: Optional[str] = None,
+        working: bool = False,
+        output_dir: Optional[str] = None,
+        fresh: bool = False,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+        progress: Optional[ProgressCallback] = None,
+    ) -> List[MemeResult]:
+        """
+        Propose plusieurs captions pour un même template.
+
+        Une sélection et un seul appel pour les n captions, un seul décodage du
+        template, puis le rendu des variantes en parallèle.
+
+        Args:
+            prompt (str): Le prompt décrivant la situation
+            n (int): Le nombre de variantes demandées
+            meme_id (str, optional): Le mème à utiliser (sélectionné d'après le prompt si absent)
+            working (bool): Partir de la copie réduite du template
+            output_dir (str, optional): Répertoire où écrire aussi les variantes
+            fresh (bool): Ignorer les réponses en cache
+            profiles (Sequence[str]): Les profils d'encodage, le principal en premier
+            progress (ProgressCallback, optional): Rappelé à chaque étape terminée (voir render_meme)
+
+        Returns:
+            List[MemeResult]: Les variantes (parfois moins de n si le LLM en a répété)
+        """
+        try:
+            logger.info("=== Détails de la génération des variantes ===")
+            logger.info(f"Prompt reçu: '{prompt}'")
+            meme_id, meme_info, variants = self._variant_captions(prompt, n, meme_id, fresh, progress)
+            results = self._compose_variants(prompt, meme_id, variants, working, output_dir, meme_info, profiles)
+            for result in results:
+                _notify(progress, "image", result=result)
+            return results
+        except Exception as e:
+            logger.error(f"Erreur: {str(e)}")
+            raise
+
+    async def render_variants_async(
+        self,
+        prompt: str,
+        n: int = 3,
+        meme_id: Optional[str] = None,
+        working: bool = False,
+        output_dir: Optional[str] = None,
+        executor: Optional[Executor] = None,
+        fresh: bool = False,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+        progress: Optional[ProgressCallback] = None,
+    ) -> List[MemeResult]:
+        """
+        Version asynchrone de render_variants.
 
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+        Returns:
+            List[MemeResult]: Les variantes
+        """
+        try:
+            logger.info("=== Détails de la génération des variantes ===")
+            logger.info(f"Prompt reçu: '{prompt}'")
+            if meme_id is None:
+                with timed("select"):
+                    meme_id, meme_info = await self.selector.select_meme_async(prompt, fresh=fresh)
+            else:
+                meme_info = self._template_info(meme_id)
+            logger.info(f"ID du mème: {meme_id}")
+            self._notify_template(progress, meme_id, meme_info)
+            prefetch = asyncio.wrap_future(self._prefetch(meme_id))
+            with timed("variants"):
+                variants = await self.caption_generator.generate_caption_variants_async(prompt, meme_info, n, fresh=fresh)
+            _notify(progress, "captions", variants=variants)
+            await prefetch
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(
+                executor, self._compose_variants, prompt, meme_id, variants, working, output_dir, meme_info, profiles
+            )
+            for result in results:
+                _notify(progress, "image", result=result)
+            return results
+        except Exception as e:
+            logger.error(f"Erreur: {str(e)}")
+            raise
+
+    def contact_sheet(self, results: List[MemeResult], prompt: str = "") -> MemeResult:
+        """
+        Assemble des variantes en une planche unique, encodée en mémoire.
+
+        Args:
+            results (List[MemeResult]): Les variantes rendues
+            prompt (str): Le prompt (pour le nom du fichier)
+
+        Returns:
+            MemeResult: La planche
+        """
+        sheet = make_contact_sheet([result.image for result in results])
+        return MemeResult(
+            meme_id=results[0].meme_id,
+            captions=[caption for result in results for caption in result.captions],
+            image=sheet,
+            buffer=encode_image(sheet, "JPEG", quality=90),
+            filename=self._filename(prompt, "_planche"),
+        )
+
+    def create_meme(self, prompt: str, output_dir: str = "output", mode: str = "separate", working: bool = False, fresh: bool = False) -> str:
+        """
+        Crée un mème complet à partir d'un prompt et l'écrit sur le disque.
+        
+        Args:
+            prompt (str): Le prompt décrivant la situation
+            output_dir (str): Le répertoire de sortie
+            mode (str): "separate" (sélection puis caption) ou "combined" (un seul appel à l'API)
+            working (bool): Partir de la copie réduite du template (envoi dans un chat)
+            fresh (bool): Ignorer les réponses en cache
+            
+        Returns:
+            str: Le chemin du mème généré
+        """
+        return self.render_meme(prompt, mode=mode, working=working, output_dir=output_dir, fresh=fresh).path
+
+    async def create_meme_async(self, prompt: str, output_dir: str = "output", mode: str = "separate", working: bool = False, fresh: bool = False) -> str:
+        """
+        Version asynchrone de create_meme.
+        
+        Returns:
+            str: Le chemin du mème généré
+        """
+        result = await self.render_meme_async(prompt, mode=mode, working=working, output_dir=output_dir, fresh=fresh)
+        return result.path
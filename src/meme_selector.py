@@ -1,31 +1,121 @@
-import os
-from typing import Dict, Tuple
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Tuple
 import json
-from dotenv import load_dotenv
-from mistralai import Mistral
-from src.caption_generator import CaptionGenerator
+import logging
+from src.caption_generator import FORMAT_INSTRUCTIONS, validate_captions
+from src.catalog import MEMES_PATH, Catalog, CatalogSnapshot
+from src.template_index import TemplateIndex, INDEX_PATH
+from src.llm import CallPolicy, complete, complete_async, mistral_client
+from src.response_cache import ResponseCache, make_key
+
+if TYPE_CHECKING:
+    from mistralai import Mistral
+
+logger = logging.getLogger(__name__)
+
+# "llm": tout le catalogue dans le prompt, "shortlist": top-k de l'index local,
+# "offline": l'index local choisit seul, sans appel à l'API
+SELECTION_MODES = ("llm", "shortlist", "offline")
 
-load_dotenv()
 
 class MemeSelector:
-    def __init__(self):
-        """Initialise le sélecteur de mèmes avec l'API Mistral."""
-        self.api_key = os.environ["MISTRAL_API_KEY"]
-        self.client = Mistral(api_key=self.api_key)
+    def __init__(
+        self,
+        client: Optional["Mistral"] = None,
+        memes: Optional[dict] = None,
+        selection_mode: str = "llm",
+        shortlist_size: int = 8,
+        index_path: str = INDEX_PATH,
+        policy: Optional[CallPolicy] = None,
+        cache: Optional[ResponseCache] = None,
+        catalog: Optional[Catalog] = None,
+    ):
+        """
+        Initialise le sélecteur de mèmes avec l'API Mistral.
+
+        Chaque sélection lit l'instantané courant du catalogue au début et s'y
+        tient jusqu'au bout, même si le catalogue est rechargé entre-temps.
+
+        Args:
+            client (Mistral, optional): Client Mistral partagé (créé si absent)
+            memes (dict, optional): Catalogue déjà chargé, figé (lu depuis data/memes.json si absent)
+            selection_mode (str): "llm", "shortlist" ou "offline" (voir SELECTION_MODES)
+            shortlist_size (int): Nombre de candidats envoyés au LLM en mode "shortlist"
+            index_path (str): Le fichier de l'index local des templates
+            policy (CallPolicy, optional): Délai, nouvelles tentatives et doublement des
+                appels (lus dans l'environnement si absent)
+            cache (ResponseCache, optional): Cache des réponses du LLM (aucun cache si absent)
+            catalog (Catalog, optional): Catalogue rechargeable partagé (prioritaire sur memes)
+        """
+        if selection_mode not in SELECTION_MODES:
+            raise ValueError(f"Mode de sélection inconnu: {selection_mode} (attendu: {', '.join(SELECTION_MODES)})")
+        if client is None and selection_mode != "offline":
+            client = mistral_client()
+        self.client = client
         self.model = "mistral-large-latest"
-        self.memes = self._load_memes()
-        self.caption_generator = CaptionGenerator()
+        self.policy = policy or CallPolicy.from_env()
+        if catalog is None:
+            catalog = Catalog(MEMES_PATH, index_path=index_path, memes=memes)
+        self.catalog = catalog
+        self.cache = cache
+        self.selection_mode = selection_mode
+        self.shortlist_size = shortlist_size
+        self.index_path = index_path
+
+    @property
+    def memes(self) -> Mapping[str, Dict]:
+        """Le catalogue de l'instantané courant."""
+        return self.catalog.current.memes
 
-    def _load_memes(self) -> dict:
-        """Charge les métadonnées des mèmes depuis le fichier JSON."""
-        with open("data/memes.json", "r", encoding="utf-8") as f:
-            return json.load(f)
+    @property
+    def catalog_version(self) -> str:
+        """Version de l'instantané courant (clés du cache des réponses)."""
+        return self.catalog.current.version
 
-    def _create_selection_prompt(self, prompt: str) -> str:
+    @property
+    def index(self) -> TemplateIndex:
+        """Index local des templates de l'instantané courant, chargé ou construit au premier accès."""
+        return self.catalog.current.index
+
+    def _candidates(self, prompt: str, snapshot: CatalogSnapshot) -> List[Dict]:
+        """
+        Renvoie les mèmes à proposer au LLM pour ce prompt.
+
+        En mode "llm" c'est tout le catalogue ; en mode "shortlist" ce sont les
+        meilleurs résultats de l'index local (tout le catalogue si rien ne correspond).
+        """
+        if self.selection_mode == "llm":
+            return list(snapshot.memes.values())
+        results = snapshot.index.search(prompt, k=self.shortlist_size)
+        candidates = [snapshot.memes[meme_id] for meme_id, _ in results if meme_id in snapshot.memes]
+        return candidates or list(snapshot.memes.values())
+
+    def _select_locally(self, prompt: str, snapshot: CatalogSnapshot) -> Optional[str]:
+        """
+        Choisit un mème sans LLM si l'index le permet.
+
+        Returns:
+            Optional[str]: L'ID du mème, ou None s'il faut demander au LLM
+        """
+        if self.selection_mode == "llm":
+            return None
+        results = snapshot.index.search(prompt, k=2)
+        if self.selection_mode == "offline":
+            if results:
+                return results[0][0]
+            # Aucun terme commun avec le catalogue : premier mème par défaut
+            logger.warning("Aucun mème ne correspond dans l'index, utilisation du premier du catalogue")
+            return next(iter(snapshot.memes))
+        if TemplateIndex.is_confident(results):
+            return results[0][0]
+        return None
+
+    def _create_selection_prompt(self, prompt: str, candidates: Optional[List[Dict]] = None) -> str:
         """Crée le prompt pour la sélection du mème."""
+        if candidates is None:
+            candidates = list(self.memes.values())
         memes_info = "\n".join([
             f"- {meme['id']}: {meme['description']} (format: {meme['format']})"
-            for meme in self.memes.values()
+            for meme in candidates
         ])
         
         return f"""Tu es un expert en mèmes. Sélectionne le mème le plus approprié pour le prompt suivant.
@@ -40,35 +130,197 @@ exemple:
 "drake_approve"
 """
 
-    def select_meme(self, prompt: str) -> Tuple[str, Dict]:
+    def _selection_request(self, prompt: str, snapshot: CatalogSnapshot) -> Dict:
+        """Paramètres de chat.complete pour la sélection du mème."""
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": self._create_selection_prompt(prompt, self._candidates(prompt, snapshot)),
+                },
+            ],
+        }
+
+    def _parse_selection(self, response, snapshot: CatalogSnapshot) -> Tuple[str, Dict]:
+        """Vérifie l'ID renvoyé par le LLM et renvoie le mème correspondant."""
+        meme_id = response.choices[0].message.content
+        
+        # Vérifie que le mème existe
+        if meme_id not in snapshot.memes:
+            raise ValueError(f"Mème {meme_id} non trouvé")
+            
+        return meme_id, snapshot.memes[meme_id]
+
+    def _cache_key(self, kind: str, prompt: str, snapshot: CatalogSnapshot) -> str:
+        """Clé de cache d'une réponse : prompt normalisé, modèle, version du catalogue et mode."""
+        return make_key(kind, prompt, self.model, f"{snapshot.version}:{self.selection_mode}")
+
+    def select_meme(self, prompt: str, fresh: bool = False) -> Tuple[str, Dict]:
         """
         Sélectionne le mème le plus approprié pour un prompt.
         
         Args:
             prompt (str): Le prompt décrivant la situation
+            fresh (bool): Ignorer la réponse en cache
             
         Returns:
             Tuple[str, Dict]: L'ID du mème sélectionné et ses informations
         """
-        selection_prompt = self._create_selection_prompt(prompt)
+        snapshot = self.catalog.current
+        meme_id = self._select_locally(prompt, snapshot)
+        if meme_id is not None:
+            return meme_id, snapshot.memes[meme_id]
+
+        def call() -> str:
+            response = complete(self.client, self.policy, **self._selection_request(prompt, snapshot))
+            return self._parse_selection(response, snapshot)[0]
+
+        if self.cache is None:
+            meme_id = call()
+        else:
+            meme_id = self.cache.get_or_compute(self._cache_key("select", prompt, snapshot), call, fresh=fresh)
+        return meme_id, snapshot.memes[meme_id]
+
+    async def select_meme_async(self, prompt: str, fresh: bool = False) -> Tuple[str, Dict]:
+        """
+        Sélectionne le mème le plus approprié pour un prompt, sans bloquer la boucle d'événements.
         
-        response = self.client.chat.complete(
-            model=self.model,
-            messages=[
+        Args:
+            prompt (str): Le prompt décrivant la situation
+            fresh (bool): Ignorer la réponse en cache
+            
+        Returns:
+            Tuple[str, Dict]: L'ID du mème sélectionné et ses informations
+        """
+        snapshot = self.catalog.current
+        meme_id = self._select_locally(prompt, snapshot)
+        if meme_id is not None:
+            return meme_id, snapshot.memes[meme_id]
+
+        async def call() -> str:
+            response = await complete_async(self.client, self.policy, **self._selection_request(prompt, snapshot))
+            return self._parse_selection(response, snapshot)[0]
+
+        if self.cache is None:
+            meme_id = await call()
+        else:
+            meme_id = await self.cache.get_or_compute_async(self._cache_key("select", prompt, snapshot), call, fresh=fresh)
+        return meme_id, snapshot.memes[meme_id]
+
+    def _create_combined_prompt(self, prompt: str, candidates: Optional[List[Dict]] = None) -> str:
+        """Crée le prompt qui demande le mème et ses captions en une seule réponse."""
+        if candidates is None:
+            candidates = list(self.memes.values())
+        memes_info = "\n".join([
+            f"- {meme['id']}: {meme['description']} (format: {meme['format']})"
+            for meme in candidates
+        ])
+        formats = sorted({meme["format"] for meme in candidates})
+        format_rules = "\n\n".join(
+            f"Format {fmt}:\n{FORMAT_INSTRUCTIONS[fmt]}" for fmt in formats if fmt in FORMAT_INSTRUCTIONS
+        )
+
+        return f"""Tu es un expert en mèmes. Sélectionne le mème le plus approprié pour le prompt suivant, puis écris ses textes.
+
+Prompt utilisateur: "{prompt}"
+
+Mèmes disponibles:
+{memes_info}
+
+Règles d'écriture des textes selon le format du mème choisi:
+{format_rules}
+
+Réponds uniquement avec un objet JSON de la forme:
+{{
+    "meme_id": "id_du_meme",
+    "texts": ["..."]
+}}
+"""
+
+    def _combined_request(self, prompt: str, snapshot: CatalogSnapshot) -> Tuple[Dict, List[Dict]]:
+        """Paramètres de chat.complete pour le mode combiné, et les mèmes proposés."""
+        meme_id = self._select_locally(prompt, snapshot)
+        candidates = [snapshot.memes[meme_id]] if meme_id is not None else self._candidates(prompt, snapshot)
+        request = {
+            "model": self.model,
+            "messages": [
                 {
                     "role": "user",
-                    "content": selection_prompt,
+                    "content": self._create_combined_prompt(prompt, candidates),
                 },
-            ]
-        )
-        
-        meme_id = response.choices[0].message.content
-        
-        # Vérifie que le mème existe
-        if meme_id not in self.memes:
+            ],
+            "response_format": {"type": "json_object"},
+        }
+        return request, candidates
+
+    def _parse_combined(self, response, candidates: List[Dict], snapshot: CatalogSnapshot) -> Tuple[str, Dict, List[str]]:
+        """Valide la réponse combinée contre le catalogue et le format du mème."""
+        try:
+            result = json.loads(response.choices[0].message.content)
+        except (TypeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Réponse JSON invalide: {str(e)}")
+        if not isinstance(result, dict):
+            raise ValueError(f"Réponse inattendue: {result!r}")
+
+        meme_id = result.get("meme_id")
+        if not isinstance(meme_id, str):
+            raise ValueError(f"Identifiant de mème invalide: {meme_id!r}")
+        if meme_id not in snapshot.memes or snapshot.memes[meme_id] not in candidates:
             raise ValueError(f"Mème {meme_id} non trouvé")
-            
-        return meme_id, self.memes[meme_id]
+        meme_info = snapshot.memes[meme_id]
+        texts = validate_captions(result.get("texts"), meme_info["format"])
+
+        return meme_id, meme_info, texts
+
+    def select_meme_with_captions(self, prompt: str, fresh: bool = False) -> Tuple[str, Dict, List[str]]:
+        """
+        Sélectionne le mème et génère ses captions en un seul appel à l'API.
+
+        Args:
+            prompt (str): Le prompt décrivant la situation
+            fresh (bool): Ignorer la réponse en cache
+
+        Returns:
+            Tuple[str, Dict, List[str]]: L'ID du mème, ses informations et ses captions
+
+        Raises:
+            ValueError: Si la réponse n'est pas un JSON valide pour le catalogue
+        """
+        snapshot = self.catalog.current
+
+        def call() -> list:
+            request, candidates = self._combined_request(prompt, snapshot)
+            response = complete(self.client, self.policy, **request)
+            meme_id, _, texts = self._parse_combined(response, candidates, snapshot)
+            return [meme_id, texts]
+
+        if self.cache is None:
+            meme_id, texts = call()
+        else:
+            meme_id, texts = self.cache.get_or_compute(self._cache_key("combined", prompt, snapshot), call, fresh=fresh)
+        return meme_id, snapshot.memes[meme_id], texts
+
+    async def select_meme_with_captions_async(self, prompt: str, fresh: bool = False) -> Tuple[str, Dict, List[str]]:
+        """
+        Version asynchrone de select_meme_with_captions.
+
+        Raises:
+            ValueError: Si la réponse n'est pas un JSON valide pour le catalogue
+        """
+        snapshot = self.catalog.current
+
+        async def call() -> list:
+            request, candidates = self._combined_request(prompt, snapshot)
+            response = await complete_async(self.client, self.policy, **request)
+            meme_id, _, texts = self._parse_combined(response, candidates, snapshot)
+            return [meme_id, texts]
+
+        if self.cache is None:
+            meme_id, texts = await call()
+        else:
+            meme_id, texts = await self.cache.get_or_compute_async(self._cache_key("combined", prompt, snapshot), call, fresh=fresh)
+        return meme_id, snapshot.memes[meme_id], texts
 
     def get_template_info(self, template_id: str) -> Dict:
         """Récupère les informations d'un template spécifique."""
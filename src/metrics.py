@@ -0,0 +1,245 @@
+"""
+Mesures du service : durée de chaque étape, compteurs et export Prometheus.
+
+Les étapes de la génération (chargement du catalogue, appels au LLM, décodage
+du template, ajustement de la police, rendu, encodage, envoi Slack) sont
+chronométrées avec `timed` dans un histogramme commun. Les compteurs suivent
+les appels et les tokens du LLM ; les caches, qui comptent déjà leurs succès,
+sont lus au moment de l'export (`register_callback`). `render_metrics` produit
+le format texte de Prometheus, servi par la route /metrics de endpoint.py.
+"""
+import abc
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Bornes des histogrammes de durée, en secondes
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Étiquettes au format Prometheus : {a="1",b="2"}."""
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Valeur au format Prometheus (+Inf, entiers sans décimales)."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        """
+        Args:
+            name (str): Le nom de la mesure
+            help (str): Sa description
+            labelnames (Sequence[str]): Les noms de ses étiquettes
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """Valeurs des étiquettes, dans l'ordre déclaré."""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: étiquettes attendues {self.labelnames}, reçues {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[Sample]:
+        """Les échantillons exportés."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """Ajoute amount au compteur."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        """Valeur courante du compteur."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Par jeu d'étiquettes : effectif de chaque intervalle, somme et nombre d'observations
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """Enregistre une observation."""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self, **labels) -> Dict[str, float]:
+        """Nombre d'observations, somme et moyenne pour un jeu d'étiquettes."""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            count, total = (series[2], series[1]) if series else (0, 0.0)
+        return {"count": count, "sum": total, "mean": total / count if count else 0.0}
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            items = [(key, (list(series[0]), series[1], series[2])) for key, series in self._series.items()]
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class CallbackMetric(_Metric):
+    """Mesure lue au moment de l'export (taille d'une file, statistiques d'un cache LRU...)."""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str], callback: Callable[[], Dict[Tuple, float]]):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self) -> Iterator[Sample]:
+        for key, value in self.callback().items():
+            yield self.name, dict(zip(self.labelnames, (str(v) for v in key))), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Ajoute une mesure (remplace celle du même nom)."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Toutes les mesures au format texte de Prometheus (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "meme_stage_seconds", "Durée de chaque étape de la génération d'un mème", ("stage",)
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "meme_stage_errors_total", "Étapes terminées par une erreur", ("stage",)
+))
+LLM_CALLS = REGISTRY.register(Counter(
+    "meme_llm_calls_total", "Tentatives d'appel au LLM par résultat (ok, retry, error)", ("outcome",)
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "meme_llm_tokens_total", "Tokens consommés par les appels au LLM", ("model", "kind")
+))
+LLM_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "meme_llm_queue_wait_seconds", "Attente d'un créneau du limiteur avant chaque appel au LLM", ("lane",)
+))
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Chronomètre une étape dans meme_stage_seconds (et compte ses erreurs).
+
+    Args:
+        stage (str): Le nom de l'étape ("select", "caption", "template_decode", ...)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_usage(response, model: Optional[str] = None) -> None:
+    """
+    Compte les tokens d'une réponse de l'API (champ usage), s'il est présent.
+
+    Args:
+        response: La réponse de chat.complete
+        model (str, optional): Le modèle interrogé
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    model = model or getattr(response, "model", None) or "unknown"
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if tokens:
+            LLM_TOKENS.inc(tokens, model=model, kind=kind)
+
+
+def register_callback(name: str, help: str, kind: str, labelnames: Sequence[str], callback: Callable[[], Dict[Tuple, float]]) -> None:
+    """
+    Déclare une mesure calculée à chaque export.
+
+    Args:
+        name (str): Le nom de la mesure
+        help (str): Sa description
+        kind (str): "gauge" ou "counter"
+        labelnames (Sequence[str]): Les noms de ses étiquettes
+        callback (Callable[[], Dict[Tuple, float]]): Valeurs par tuple d'étiquettes
+    """
+    REGISTRY.register(CallbackMetric(name, help, kind, labelnames, callback))
+
+
+def render_metrics() -> str:
+    """Export Prometheus de toutes les mesures du processus."""
+    return REGISTRY.render()
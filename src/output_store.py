@@ -0,0 +1,176 @@
+"""
+Stockage des mèmes rendus, adressé par contenu.
+
+Chaque rendu est rangé sous l'empreinte de ce qui le détermine (template,
+captions, paramètres de rendu) : un même mème demandé deux fois est relu sur
+le disque au lieu d'être redessiné et réencodé, et deux prompts qui commencent
+pareil ne s'écrasent plus. Les fichiers sont écrits de façon atomique ; un
+index SQLite donne l'emplacement, la taille et le dernier accès de chaque
+rendu, et les moins récemment utilisés sont supprimés au-delà du budget disque.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".index.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def render_key(parts: Dict[str, Any]) -> str:
+    """
+    Empreinte d'un rendu.
+
+    Args:
+        parts (Dict[str, Any]): Tout ce qui détermine l'image (sérialisable en JSON)
+
+    Returns:
+        str: 32 caractères hexadécimaux (SHA-256 tronqué)
+    """
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class OutputStore:
+    def __init__(self, root: str = "output", max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Ouvre (ou crée) un stockage.
+
+        Args:
+            root (str): Le répertoire des rendus (l'index y est rangé)
+            max_bytes (int): Budget disque des rendus ; au-delà, les moins récemment servis sont supprimés
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        # Plusieurs processus (génération en lot) peuvent partager l'index : WAL et attente des verrous
+        self._db = sqlite3.connect(os.path.join(root, INDEX_NAME), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS renders (key TEXT PRIMARY KEY, path TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS renders_accessed ON renders (accessed_at)")
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, root: str = "output") -> "OutputStore":
+        """
+        Ouvre un stockage avec le budget lu dans MEME_OUTPUT_MB (512 par défaut).
+
+        Args:
+            root (str): Le répertoire des rendus
+        """
+        max_mb = int(os.environ.get("MEME_OUTPUT_MB", DEFAULT_MAX_BYTES // (1024 * 1024)))
+        return cls(root, max_bytes=max_mb * 1024 * 1024)
+
+    def _relative_path(self, key: str, extension: str) -> str:
+        """Fichier d'un rendu, réparti en sous-répertoires par les deux premiers caractères."""
+        return os.path.join(key[:2], f"{key}.{extension}")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Cherche un rendu et note l'accès.
+
+        Args:
+            key (str): L'empreinte du rendu (voir render_key)
+
+        Returns:
+            Optional[str]: Le chemin du fichier, ou None s'il est absent
+        """
+        with self._lock:
+            row = self._db.execute("SELECT path FROM renders WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                path = os.path.join(self.root, row[0])
+                if os.path.exists(path):
+                    self._db.execute("UPDATE renders SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self.hits += 1
+                    return path
+                # Fichier supprimé à la main : l'entrée ne sert plus
+                self._db.execute("DELETE FROM renders WHERE key = ?", (key,))
+                self._db.commit()
+            self.misses += 1
+        return None
+
+    def put(self, key: str, data: Union[bytes, memoryview], extension: str = "jpg") -> str:
+        """
+        Écrit un rendu de façon atomique puis applique le budget disque.
+
+        Args:
+            key (str): L'empreinte du rendu
+            data (Union[bytes, memoryview]): Le contenu encodé
+            extension (str): L'extension du fichier
+
+        Returns:
+            str: Le chemin du fichier
+        """
+        relative = self._relative_path(key, extension)
+        path = os.path.join(self.root, relative)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Fichier temporaire dans le même répertoire : os.replace reste atomique
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO renders (key, path, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, relative, len(data), now, now),
+            )
+            self._db.commit()
+            self._evict(keep=key)
+        return path
+
+    def _evict(self, keep: str) -> None:
+        """Supprime les rendus les moins récemment servis tant que le budget est dépassé (appelé sous verrou)."""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM renders").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, path, size FROM renders WHERE key != ? ORDER BY accessed_at", (keep,)
+        ).fetchall()
+        for key, relative, size in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.root, relative))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM renders WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        self._db.commit()
+        logger.debug(f"Stockage {self.root}: {total} octets après éviction")
+
+    def stats(self) -> Dict[str, int]:
+        """Occupation et efficacité du stockage."""
+        with self._lock:
+            entries, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM renders").fetchone()
+            return {
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
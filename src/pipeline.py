@@ -0,0 +1,278 @@
+"""
+Pipeline partagé du générateur de mèmes.
+
+Le client Mistral, le catalogue, le sélecteur, le générateur de captions et le
+finaliseur sont construits une seule fois par processus puis réutilisés par
+`src.main`, l'application Streamlit et l'endpoint Slack. Le catalogue est
+surveillé en arrière-plan : un template ajouté ou modifié est pris en compte
+sans redémarrer ni vider les caches (voir src.catalog).
+
+Importer ce module ne charge ni le SDK Mistral ni le fichier .env : ils le sont
+à la construction des composants (voir src.bootstrap pour tout précharger
+avant de lancer les workers).
+"""
+import os
+import threading
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+from src.catalog import MEMES_PATH, Catalog
+from src.meme_selector import MemeSelector
+from src.template_index import INDEX_PATH
+from src.caption_generator import CaptionGenerator
+from src.response_cache import ResponseCache
+from src.meme_finalizer import DEFAULT_PROFILES, MemeFinalizer, MemeResult, ProgressCallback
+from src.metrics import register_callback
+from src.llm import load_env, mistral_client
+
+if TYPE_CHECKING:
+    from mistralai import Mistral
+
+
+class MemePipeline:
+    def __init__(self, memes_path: str = MEMES_PATH, selection_mode: Optional[str] = None):
+        """
+        Initialise le pipeline sans rien construire.
+
+        Args:
+            memes_path (str): Le chemin du catalogue de mèmes
+            selection_mode (str, optional): Mode du sélecteur ("llm", "shortlist" ou "offline"),
+                lu dans MEME_SELECTION_MODE si absent
+        """
+        load_env()
+        self.memes_path = memes_path
+        self.selection_mode = selection_mode or os.environ.get("MEME_SELECTION_MODE", "llm")
+        # L'index est rangé à côté du catalogue
+        self.index_path = os.path.join(os.path.dirname(memes_path), os.path.basename(INDEX_PATH))
+        self._lock = threading.Lock()
+        self._client: Optional["Mistral"] = None
+        self._catalog: Optional[Catalog] = None
+        self._cache: Optional[ResponseCache] = None
+        self._selector: Optional[MemeSelector] = None
+        self._caption_generator: Optional[CaptionGenerator] = None
+        self._finalizer: Optional[MemeFinalizer] = None
+
+    def _build(self) -> None:
+        """Construit les composants manquants (appelé sous verrou)."""
+        if self._client is None:
+            self._client = mistral_client()
+        if self._catalog is None:
+            self._catalog = Catalog(self.memes_path, index_path=self.index_path).start()
+        if self._cache is None:
+            # Cache partagé par le sélecteur et le générateur de captions
+            self._cache = ResponseCache.from_env()
+        if self._selector is None:
+            self._selector = MemeSelector(
+                client=self._client,
+                catalog=self._catalog,
+                selection_mode=self.selection_mode,
+                index_path=self.index_path,
+                cache=self._cache,
+            )
+        if self._caption_generator is None:
+            self._caption_generator = CaptionGenerator(client=self._client, cache=self._cache)
+        if self._finalizer is None:
+            self._finalizer = MemeFinalizer(
+                selector=self._selector,
+                caption_generator=self._caption_generator,
+            )
+            register_callback(
+                "meme_cache_requests_total", "Consultations des caches par résultat", "counter",
+                ("cache", "result"), self._cache_requests,
+            )
+            register_callback(
+                "meme_cache_entries", "Entrées présentes dans les caches", "gauge",
+                ("cache",), self._cache_entries,
+            )
+
+    @property
+    def finalizer(self) -> MemeFinalizer:
+        """Finaliseur partagé, construit au premier accès."""
+        if self._finalizer is None:
+            with self._lock:
+                self._build()
+        return self._finalizer
+
+    @property
+    def catalog(self) -> Catalog:
+        """Catalogue rechargeable partagé, construit au premier accès."""
+        self.finalizer
+        return self._catalog
+
+    @property
+    def selector(self) -> MemeSelector:
+        """Sélecteur partagé, construit au premier accès."""
+        return self.finalizer.selector
+
+    @property
+    def caption_generator(self) -> CaptionGenerator:
+        """Générateur de captions partagé, construit au premier accès."""
+        return self.finalizer.caption_generator
+
+    @property
+    def cache(self) -> Optional[ResponseCache]:
+        """Cache des réponses du LLM (None s'il est désactivé)."""
+        self.finalizer
+        return self._cache
+
+    def _caches(self) -> dict:
+        """Statistiques des caches construits (réponses du LLM, templates décodés)."""
+        caches = {"template": self._finalizer.templates.stats()}
+        if self._cache is not None:
+            caches["llm"] = self._cache.stats()
+        return caches
+
+    def _cache_requests(self) -> dict:
+        """Succès, échecs et requêtes regroupées de chaque cache, pour /metrics."""
+        results = {"hit": "hits", "miss": "misses", "coalesced": "coalesced"}
+        return {
+            (name, result): stats[field]
+            for name, stats in self._caches().items()
+            for result, field in results.items()
+            if field in stats
+        }
+
+    def _cache_entries(self) -> dict:
+        """Taille de chaque cache, pour /metrics."""
+        return {(name,): stats["entries"] for name, stats in self._caches().items()}
+
+    def warm_up(self) -> "MemePipeline":
+        """
+        Construit tous les composants et décode les templates du catalogue.
+
+        À appeler au démarrage du service pour que la première requête ne paie
+        pas le coût du démarrage à froid.
+
+        Returns:
+            MemePipeline: Le pipeline lui-même
+        """
+        finalizer = self.finalizer
+        if self.selection_mode != "llm":
+            finalizer.selector.index
+        finalizer.preload(self._catalog.current.memes.keys())
+        return self
+
+    def before_fork(self) -> None:
+        """
+        Prépare le pipeline préchauffé à être partagé par des processus forkés.
+
+        Les threads ne survivent pas au fork et une connexion SQLite ne doit pas
+        être partagée : la surveillance du catalogue s'arrête et la base du cache
+        est fermée, after_fork les relance dans chaque worker.
+        """
+        if self._catalog is not None:
+            self._catalog.stop()
+        if self._cache is not None:
+            self._cache.close()
+
+    def after_fork(self) -> None:
+        """Relance, dans un worker forké, ce que before_fork a arrêté."""
+        if self._cache is not None:
+            self._cache.reopen()
+        if self._catalog is not None:
+            self._catalog.start()
+
+    def render_meme(
+        self,
+        prompt: str,
+        mode: str = "separate",
+        working: bool = False,
+        output_dir: Optional[str] = None,
+        fresh: bool = False,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+        progress: Optional[ProgressCallback] = None,
+    ) -> MemeResult:
+        """
+        Crée un mème en mémoire avec les composants partagés.
+
+        Args:
+            prompt (str): Le prompt décrivant la situation
+            mode (str): "separate" ou "combined" (voir MemeFinalizer.create_meme)
+            working (bool): Partir de la copie réduite du template (envoi dans un chat)
+            output_dir (str, optional): Répertoire où écrire aussi le mème
+            fresh (bool): Ignorer les réponses en cache (nouvelle blague)
+            profiles (Sequence[str]): Les profils d'encodage, le principal en premier
+            progress (ProgressCallback, optional): Rappelé à chaque étape terminée
+
+        Returns:
+            MemeResult: L'image et ses encodages en mémoire
+        """
+        return self.finalizer.render_meme(
+            prompt, mode=mode, working=working, output_dir=output_dir, fresh=fresh, profiles=profiles, progress=progress
+        )
+
+    async def render_meme_async(
+        self,
+        prompt: str,
+        mode: str = "separate",
+        working: bool = False,
+        output_dir: Optional[str] = None,
+        executor: Optional[Executor] = None,
+        fresh: bool = False,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+        progress: Optional[ProgressCallback] = None,
+    ) -> MemeResult:
+        """
+        Version asynchrone de render_meme (voir MemeFinalizer.render_meme_async).
+
+        Returns:
+            MemeResult: L'image et ses encodages en mémoire
+        """
+        return await self.finalizer.render_meme_async(
+            prompt, mode=mode, working=working, output_dir=output_dir, executor=executor, fresh=fresh, profiles=profiles,
+            progress=progress,
+        )
+
+    def render_variants(
+        self,
+        prompt: str,
+        n: int = 3,
+        working: bool = False,
+        fresh: bool = False,
+        profiles: Sequence[str] = DEFAULT_PROFILES,
+        progress: Optional[ProgressCallback] = None,
+    ) -> List[MemeResult]:
+        """
+        Propose n captions pour un même template (voir MemeFinalizer.render_variants).
+
+        Returns:
+            List[MemeResult]: Les variantes
+        """
+        return self.finalizer.render_variants(
+            prompt, n=n, working=working, fresh=fresh, profiles=profiles, progress=progress
+        )
+
+    def create_meme(self, prompt: str, output_dir: str = "output", mode: str = "separate", working: bool = False, fresh: bool = False) -> str:
+        """
+        Crée un mème avec les composants partagés.
+
+        Args:
+            prompt (str): Le prompt décrivant la situation
+            output_dir (str): Le répertoire de sortie
+            mode (str): "separate" ou "combined" (voir MemeFinalizer.create_meme)
+            working (bool): Partir de la copie réduite du template (envoi dans un chat)
+            fresh (bool): Ignorer les réponses en cache (nouvelle blague)
+
+        Returns:
+            str: Le chemin du mème généré
+        """
+        return self.finalizer.create_meme(prompt, output_dir, mode=mode, working=working, fresh=fresh)
+
+
+_pipeline: Optional[MemePipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> MemePipeline:
+    """
+    Renvoie le pipeline du processus, créé au premier appel.
+
+    Returns:
+        MemePipeline: L'instance partagée
+    """
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = MemePipeline()
+    return _pipeline
@@ -0,0 +1,430 @@
+"""
+Limiteur des appels à l'API Mistral, partagé par tout le processus.
+
+Chaque requête prend un créneau avant de partir : un seau de requêtes par
+seconde, un seau de tokens par minute et un nombre maximal d'appels
+simultanés. Quand le quota est atteint, les appels attendent leur tour au lieu
+d'échouer en 429. Les demandes en attente sont servies par file de priorité :
+"interactive" (Slack, Streamlit) passe avant "batch" (génération en lot), et
+dans une même file l'ordre d'arrivée est respecté. L'attente de chaque appel
+est mesurée dans meme_llm_queue_wait_seconds pour dimensionner le quota.
+
+La file d'un appel se choisit avec `use_lane`, qui suit le contexte (tâches
+asyncio comprises) :
+
+    with use_lane("batch"):
+        ...
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from src.metrics import LLM_QUEUE_WAIT, register_callback
+
+logger = logging.getLogger(__name__)
+
+# Files, de la plus prioritaire à la moins prioritaire
+LANES = ("interactive", "batch")
+# Tokens de réponse comptés d'avance quand la requête ne précise pas max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+
+_lane: contextvars.ContextVar = contextvars.ContextVar("meme_llm_lane", default="interactive")
+
+
+def current_lane() -> str:
+    """La file des appels du contexte courant."""
+    return _lane.get()
+
+
+@contextmanager
+def use_lane(lane: str) -> Iterator[None]:
+    """
+    Place les appels faits dans le bloc dans une file.
+
+    Args:
+        lane (str): "interactive" ou "batch"
+
+    Raises:
+        ValueError: Si la file est inconnue
+    """
+    if lane not in LANES:
+        raise ValueError(f"File inconnue: {lane} (attendu: {', '.join(LANES)})")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def estimate_tokens(request: Dict[str, Any]) -> int:
+    """
+    Tokens qu'une requête consommera au plus, estimés avant l'envoi.
+
+    Environ 4 caractères par token pour le prompt, plus max_tokens pour la réponse.
+
+    Args:
+        request (Dict[str, Any]): Les paramètres de chat.complete
+
+    Returns:
+        int: L'estimation
+    """
+    prompt = sum(len(str(message.get("content", ""))) for message in request.get("messages", ()))
+    return prompt // 4 + (request.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+def usage_tokens(response: Any) -> Optional[int]:
+    """Tokens réellement consommés d'après le champ usage de la réponse, s'il est présent."""
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+class QueueTimeout(TimeoutError):
+    """Aucun créneau n'a été obtenu dans le délai."""
+
+
+@dataclass
+class RateLimits:
+    """Quota des appels : None désactive la limite correspondante."""
+    requests_per_second: Optional[float] = None
+    tokens_per_minute: Optional[int] = None
+    max_concurrency: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "RateLimits":
+        """
+        Lit le quota dans l'environnement.
+
+        MISTRAL_RPS (5 par défaut), MISTRAL_TPM (sans limite par défaut) et
+        MISTRAL_CONCURRENCY (8 par défaut) ; 0 désactive une limite.
+        """
+        rps = float(os.environ.get("MISTRAL_RPS", 5))
+        tpm = int(os.environ.get("MISTRAL_TPM", 0))
+        concurrency = int(os.environ.get("MISTRAL_CONCURRENCY", 8))
+        return cls(rps or None, tpm or None, concurrency or None)
+
+    def divided(self, workers: int) -> "RateLimits":
+        """
+        La part d'un worker quand le quota est partagé entre plusieurs processus.
+
+        Args:
+            workers (int): Le nombre de processus
+
+        Returns:
+            RateLimits: Le quota d'un processus (au moins un appel simultané)
+        """
+        return RateLimits(
+            self.requests_per_second / workers if self.requests_per_second else None,
+            max(1, self.tokens_per_minute // workers) if self.tokens_per_minute else None,
+            max(1, self.max_concurrency // workers) if self.max_concurrency else None,
+        )
+
+
+class _Bucket:
+    """Seau à jetons : se remplit à débit constant jusqu'à sa capacité."""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Attente avant que amount jetons soient disponibles (une demande plus grande que le seau attend qu'il soit plein)."""
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Corrige le niveau après coup (négatif : dette remboursée par le remplissage)."""
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Waiter:
+    __slots__ = ("lane", "tokens", "wake", "granted", "cancelled")
+
+    def __init__(self, lane: str, tokens: int, wake: Callable[[], None]):
+        self.lane = lane
+        self.tokens = tokens
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class Permit:
+    """Un créneau obtenu ; settle() donne les tokens réellement consommés."""
+
+    def __init__(self, tokens: int, waited: float):
+        self.tokens = tokens
+        self.waited = waited
+        self.used: Optional[int] = None
+
+    def settle(self, used: Optional[int]) -> None:
+        self.used = used
+
+
+class RateLimiter:
+    def __init__(self, limits: Optional[RateLimits] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialise le limiteur.
+
+        Args:
+            limits (RateLimits, optional): Le quota (aucune limite si absent)
+            clock (Callable[[], float]): L'horloge, en secondes (time.monotonic ; remplaçable pour les tests)
+        """
+        self.limits = limits or RateLimits()
+        self._clock = clock
+        rps, tpm = self.limits.requests_per_second, self.limits.tokens_per_minute
+        now = clock()
+        # Rafale d'une seconde pour les requêtes, d'une minute pour les tokens
+        self._requests = _Bucket(rps, max(1.0, rps), now) if rps else None
+        self._tokens = _Bucket(tpm / 60, tpm, now) if tpm else None
+        self._lock = threading.Lock()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._paused_until = 0.0
+
+    def _grant(self, caller: Optional[_Waiter] = None) -> Optional[float]:
+        """
+        Accorde les créneaux disponibles, par priorité puis ordre d'arrivée (appelé sous verrou).
+
+        Les demandes servies sont réveillées ; si la première en attente doit
+        patienter pour le quota, elle est réveillée pour attendre le bon délai.
+
+        Returns:
+            Optional[float]: L'attente avant que la première demande puisse partir,
+                ou None si elle attend la fin d'un appel (ou si la file est vide)
+        """
+        now = self._clock()
+        for bucket in (self._requests, self._tokens):
+            if bucket is not None:
+                bucket.refill(now)
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self.limits.max_concurrency and self._active >= self.limits.max_concurrency:
+                return None
+            delay = max(
+                self._paused_until - now,
+                self._requests.delay(1) if self._requests else 0.0,
+                self._tokens.delay(waiter.tokens) if self._tokens else 0.0,
+            )
+            if delay > 0:
+                if waiter is not caller:
+                    waiter.wake()
+                return delay
+            heapq.heappop(self._queue)
+            if self._requests:
+                self._requests.take(1)
+            if self._tokens:
+                self._tokens.take(waiter.tokens)
+            self._active += 1
+            waiter.granted = True
+            if waiter is not caller:
+                waiter.wake()
+        return None
+
+    def _enqueue(self, waiter: _Waiter) -> Optional[float]:
+        """Ajoute une demande à sa file puis tente de la servir (appelé sous verrou)."""
+        heapq.heappush(self._queue, (LANES.index(waiter.lane), next(self._sequence), waiter))
+        return self._grant(waiter)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Retire une demande abandonnée, ou rend son créneau s'il venait d'être accordé (appelé sous verrou)."""
+        if waiter.granted:
+            self._active -= 1
+        waiter.cancelled = True
+        self._grant()
+
+    def _check_lane(self, lane: Optional[str]) -> str:
+        lane = lane or current_lane()
+        if lane not in LANES:
+            raise ValueError(f"File inconnue: {lane} (attendu: {', '.join(LANES)})")
+        return lane
+
+    def acquire(self, tokens: int = 0, lane: Optional[str] = None, timeout: Optional[float] = None) -> float:
+        """
+        Attend un créneau (appel synchrone).
+
+        Args:
+            tokens (int): Les tokens que l'appel consommera (estimation)
+            lane (str, optional): La file (celle du contexte si absente)
+            timeout (float, optional): Attente maximale, en secondes
+
+        Returns:
+            float: Le temps passé à attendre, en secondes
+
+        Raises:
+            QueueTimeout: Si aucun créneau n'est obtenu dans le délai
+        """
+        lane = self._check_lane(lane)
+        start = self._clock()
+        end = start + timeout if timeout is not None else None
+        event = threading.Event()
+        waiter = _Waiter(lane, tokens, event.set)
+        with self._lock:
+            delay = self._enqueue(waiter)
+        while not waiter.granted:
+            left = end - self._clock() if end is not None else None
+            if left is not None and left <= 0:
+                with self._lock:
+                    if not waiter.granted:
+                        waiter.cancelled = True
+                        self._grant()
+                        raise QueueTimeout(f"Aucun créneau pour l'appel Mistral en {timeout:.1f}s")
+                break
+            timeouts = [value for value in (delay, left) if value is not None]
+            event.wait(min(timeouts) if timeouts else None)
+            with self._lock:
+                event.clear()
+                if not waiter.granted:
+                    delay = self._grant(waiter)
+        return self._granted(lane, start)
+
+    async def acquire_async(self, tokens: int = 0, lane: Optional[str] = None) -> float:
+        """
+        Attend un créneau sans bloquer la boucle d'événements.
+
+        Le délai se borne de l'extérieur (asyncio.wait_for) : une attente
+        annulée quitte la file proprement.
+
+        Returns:
+            float: Le temps passé à attendre, en secondes
+        """
+        lane = self._check_lane(lane)
+        start = self._clock()
+        loop = asyncio.get_running_loop()
+        signal = asyncio.Event()
+        # Les réveils peuvent venir d'autres threads (appels synchrones qui se terminent)
+        waiter = _Waiter(lane, tokens, lambda: loop.call_soon_threadsafe(signal.set))
+        with self._lock:
+            delay = self._enqueue(waiter)
+        try:
+            while not waiter.granted:
+                try:
+                    await asyncio.wait_for(signal.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    signal.clear()
+                    if not waiter.granted:
+                        delay = self._grant(waiter)
+        except BaseException:
+            with self._lock:
+                self._abandon(waiter)
+            raise
+        return self._granted(lane, start)
+
+    def _granted(self, lane: str, start: float) -> float:
+        """Mesure l'attente d'un créneau obtenu."""
+        waited = self._clock() - start
+        LLM_QUEUE_WAIT.observe(waited, lane=lane)
+        if waited >= 1.0:
+            logger.info(f"Appel Mistral ({lane}) mis en attente {waited:.1f}s par le limiteur")
+        return waited
+
+    def release(self, tokens: int = 0, used: Optional[int] = None) -> None:
+        """
+        Libère un créneau.
+
+        Args:
+            tokens (int): Les tokens comptés à l'acquisition
+            used (int, optional): Les tokens réellement consommés (corrige le seau)
+        """
+        with self._lock:
+            self._active -= 1
+            if self._tokens is not None and used is not None:
+                self._tokens.adjust(tokens - used)
+            self._grant()
+
+    @contextmanager
+    def slot(self, tokens: int = 0, lane: Optional[str] = None, timeout: Optional[float] = None) -> Iterator[Permit]:
+        """Créneau pour un appel synchrone, libéré à la sortie du bloc (voir acquire)."""
+        permit = Permit(tokens, self.acquire(tokens, lane, timeout))
+        try:
+            yield permit
+        finally:
+            self.release(tokens, permit.used)
+
+    @asynccontextmanager
+    async def slot_async(self, tokens: int = 0, lane: Optional[str] = None) -> AsyncIterator[Permit]:
+        """Créneau pour un appel asynchrone, libéré à la sortie du bloc (voir acquire_async)."""
+        permit = Permit(tokens, await self.acquire_async(tokens, lane))
+        try:
+            yield permit
+        finally:
+            self.release(tokens, permit.used)
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Suspend les départs après un 429 : l'API a demandé de ralentir.
+
+        Args:
+            seconds (float): La durée de la pause (Retry-After ou backoff)
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+            # La première demande en attente doit recalculer son délai
+            self._grant()
+        logger.warning(f"Limiteur Mistral en pause {seconds:.1f}s après un 429")
+
+    def stats(self) -> Dict[str, int]:
+        """Appels en cours et demandes en attente par file."""
+        with self._lock:
+            waiting = {lane: 0 for lane in LANES}
+            for _, _, waiter in self._queue:
+                if not waiter.cancelled:
+                    waiting[waiter.lane] += 1
+            return {"active": self._active, **{f"waiting_{lane}": count for lane, count in waiting.items()}}
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """Renvoie le limiteur du processus, construit au premier appel d'après l'environnement."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(RateLimits.from_env())
+    return _limiter
+
+
+def set_limiter(limiter: RateLimiter) -> None:
+    """Remplace le limiteur du processus (benchmarks, quota propre à un service)."""
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
+
+
+def _limiter_slots() -> Dict[tuple, float]:
+    """Appels en cours et en attente, pour l'export Prometheus."""
+    if _limiter is None:
+        return {}
+    stats = _limiter.stats()
+    slots = {("active", "all"): stats["active"]}
+    slots.update({("waiting", lane): stats[f"waiting_{lane}"] for lane in LANES})
+    return slots
+
+
+register_callback(
+    "meme_llm_limiter_slots", "Appels au LLM en cours et en attente d'un créneau", "gauge",
+    ("state", "lane"), _limiter_slots,
+)
@@ -0,0 +1,301 @@
+"""
+Cache des réponses du LLM (sélection et captions).
+
+Deux niveaux : un cache mémoire LRU avec durée de vie, et une base SQLite
+optionnelle qui survit aux redémarrages. Les requêtes identiques simultanées
+sont fusionnées (singleflight) : un seul appel part vers l'API, les autres
+attendent son résultat.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+_MISSING = object()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Forme canonique d'un prompt : Unicode NFC, minuscules, espaces réduits."""
+    return " ".join(unicodedata.normalize("NFC", prompt).lower().split())
+
+
+def make_key(kind: str, prompt: str, model: str, version: str) -> str:
+    """
+    Construit la clé d'une réponse.
+
+    Args:
+        kind (str): Le type d'appel ("select", "captions", "combined", ...)
+        prompt (str): Le prompt de l'utilisateur
+        model (str): Le modèle interrogé
+        version (str): La version du catalogue (ou de l'entrée) utilisée
+
+    Returns:
+        str: Une empreinte SHA-256
+    """
+    raw = json.dumps([kind, normalize_prompt(prompt), model, version], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def content_version(data: Any) -> str:
+    """Empreinte courte d'un contenu JSON (catalogue ou entrée du catalogue)."""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024, sqlite_path: Optional[str] = None):
+        """
+        Initialise le cache.
+
+        Args:
+            ttl (float): Durée de vie d'une réponse, en secondes
+            max_entries (int): Nombre maximal de réponses gardées en mémoire
+            sqlite_path (str, optional): Base SQLite persistante (mémoire seule si None)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        # Appels asynchrones partagés en cours, gardés jusqu'à leur fin même si leur meneur est annulé
+        self._tasks: Set[asyncio.Task] = set()
+        self.sqlite_path = sqlite_path
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            directory = os.path.dirname(sqlite_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.reopen()
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """
+        Construit le cache depuis l'environnement.
+
+        MEME_CACHE_TTL (secondes, 0 pour désactiver le cache), MEME_CACHE_SIZE
+        et MEME_CACHE_DB (chemin de la base SQLite, optionnel).
+
+        Returns:
+            Optional[ResponseCache]: Le cache, ou None s'il est désactivé
+        """
+        ttl = float(os.environ.get("MEME_CACHE_TTL", 3600))
+        if ttl <= 0:
+            return None
+        return cls(
+            ttl=ttl,
+            max_entries=int(os.environ.get("MEME_CACHE_SIZE", 1024)),
+            sqlite_path=os.environ.get("MEME_CACHE_DB") or None,
+        )
+
+    def close(self) -> None:
+        """Ferme la base SQLite (avant un fork : une connexion ne doit pas passer d'un processus à l'autre)."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def reopen(self) -> None:
+        """Ouvre la connexion à la base SQLite, s'il y en a une (dans chaque worker après un fork)."""
+        with self._lock:
+            if self.sqlite_path and self._db is None:
+                self._db = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+
+    def get(self, key: str) -> Any:
+        """
+        Lit une réponse encore valide.
+
+        Returns:
+            Any: La réponse, ou None si elle est absente ou expirée
+        """
+        value = self._get(key)
+        return None if value is _MISSING else value
+
+    def _get(self, key: str) -> Any:
+        """Lecture mémoire puis SQLite ; renvoie _MISSING si rien n'est valide."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    return entry[1]
+                del self._memory[key]
+            if self._db is None:
+                return _MISSING
+            row = self._db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= now:
+            return _MISSING
+        value = json.loads(row[0])
+        self._remember(key, value, row[1])
+        return value
+
+    def _remember(self, key: str, value: Any, expires_at: float) -> None:
+        """Range une réponse dans le cache mémoire en respectant la limite LRU."""
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Enregistre une réponse (valeur sérialisable en JSON).
+
+        Args:
+            key (str): La clé (voir make_key)
+            value (Any): La réponse
+        """
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at),
+                )
+                self._db.commit()
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Oublie une réponse (toutes si key est None)."""
+        with self._lock:
+            if key is None:
+                self._memory.clear()
+            else:
+                self._memory.pop(key, None)
+            if self._db is not None:
+                if key is None:
+                    self._db.execute("DELETE FROM responses")
+                else:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+
+    def _lookup_or_join(self, key: str, fresh: bool) -> Tuple[Any, Optional[Future], bool]:
+        """
+        Cherche la réponse, sinon rejoint ou démarre l'appel en cours.
+
+        Returns:
+            Tuple[Any, Optional[Future], bool]: La valeur en cache (ou _MISSING),
+                le Future de l'appel et True si l'appelant doit faire l'appel lui-même
+        """
+        if fresh:
+            return _MISSING, None, True
+        value = self._get(key)
+        if value is not _MISSING:
+            with self._lock:
+                self.hits += 1
+            return value, None, False
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return _MISSING, future, False
+            self.misses += 1
+            future = Future()
+            self._inflight[key] = future
+            return _MISSING, future, True
+
+    def _finish(self, key: str, future: Optional[Future], value: Any = _MISSING, error: Optional[BaseException] = None) -> None:
+        """Publie le résultat de l'appel aux requêtes fusionnées."""
+        if value is not _MISSING:
+            self.set(key, value)
+        if future is None:
+            return
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], fresh: bool = False) -> Any:
+        """
+        Renvoie la réponse en cache ou la calcule, une seule fois pour les appels simultanés.
+
+        Args:
+            key (str): La clé (voir make_key)
+            compute (Callable[[], Any]): L'appel à faire en cas d'absence
+            fresh (bool): Ignorer la réponse en cache et forcer un nouvel appel
+
+        Returns:
+            Any: La réponse
+        """
+        value, future, leader = self._lookup_or_join(key, fresh)
+        if value is not _MISSING:
+            return value
+        if not leader:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, value)
+        return value
+
+    async def get_or_compute_async(self, key: str, compute: Callable[[], Awaitable[Any]], fresh: bool = False) -> Any:
+        """
+        Version asynchrone de get_or_compute.
+
+        L'appel partagé ne s'arrête pas si l'appelant qui l'a lancé est annulé :
+        les requêtes fusionnées reçoivent quand même sa réponse.
+
+        Args:
+            key (str): La clé (voir make_key)
+            compute (Callable[[], Awaitable[Any]]): La coroutine à lancer en cas d'absence
+            fresh (bool): Ignorer la réponse en cache et forcer un nouvel appel
+
+        Returns:
+            Any: La réponse
+        """
+        value, future, leader = self._lookup_or_join(key, fresh)
+        if value is not _MISSING:
+            return value
+        if not leader:
+            # shield : l'annulation d'un appelant ne doit pas annuler l'appel partagé
+            return await asyncio.shield(asyncio.wrap_future(future))
+        # L'appel tourne dans sa propre tâche : si le meneur est annulé, il continue pour les autres
+        task = asyncio.ensure_future(compute())
+        self._tasks.add(task)
+        task.add_done_callback(lambda done: self._settle(key, future, done))
+        return await asyncio.shield(task)
+
+    def _settle(self, key: str, future: Future, task: asyncio.Task) -> None:
+        """Publie le résultat d'une tâche partagée (rappel de fin de tâche)."""
+        self._tasks.discard(task)
+        if task.cancelled():
+            self._finish(key, future, error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            self._finish(key, future, error=task.exception())
+        else:
+            self._finish(key, future, task.result())
+
+    def stats(self) -> Dict[str, int]:
+        """Efficacité du cache."""
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "inflight": len(self._inflight),
+            }
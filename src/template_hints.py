@@ -0,0 +1,227 @@
+"""
+Analyse hors ligne des templates : zone de texte recommandée pour chaque image.
+
+Chaque image de data/img est analysée une fois (saillance, détail, visages
+éventuels) pour trouver la bande du haut ou du bas où la caption masque le
+moins de choses. Le résultat est rangé dans un petit fichier JSON à côté du
+catalogue, que le finaliseur charge au démarrage : au moment de la requête, la
+position et la taille maximale du texte sont lues au lieu d'être devinées.
+
+Usage :
+    python -m src.template_hints          # analyse les images nouvelles ou modifiées
+    python -m src.template_hints --force  # tout réanalyser
+"""
+import argparse
+import json
+import logging
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utils.template_cache import index_templates
+
+logger = logging.getLogger(__name__)
+
+HINTS_PATH = "data/template_hints.json"
+HINTS_VERSION = 1
+
+# Côté le plus long de l'image analysée : largement suffisant pour placer une bande
+ANALYSIS_SIZE = 512
+BAND_WIDTH = 0.95
+BAND_HEIGHTS = (0.22, 0.28, 0.34)
+# Marges de l'ancien placement : 1/15 de la hauteur en bas, un peu moins en haut
+BOTTOM_MARGIN = 1 / 15
+TOP_MARGIN = 0.03
+# Le bas reste préféré à coût voisin (placement classique des mèmes)
+BOTTOM_BIAS = 0.85
+# Taille de police maximale : la moitié de la bande, sans dépasser l'ancienne limite (1/6 de la hauteur)
+MAX_FONT_RATIO = 1 / 6
+FACE_PENALTY = 4.0
+FACE_CASCADE = "haarcascade_frontalface_default.xml"
+
+
+def spectral_saliency(gray: np.ndarray) -> np.ndarray:
+    """
+    Carte de saillance par résidu spectral (Hou et Zhang, 2007).
+
+    Args:
+        gray (np.ndarray): L'image en niveaux de gris (float32)
+
+    Returns:
+        np.ndarray: La saillance normalisée entre 0 et 1, à la taille de l'image
+    """
+    import cv2  # OpenCV n'est chargé que pour l'analyse
+    small = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA)
+    spectrum = np.fft.fft2(small)
+    log_amplitude = np.log(np.abs(spectrum) + 1e-6)
+    residual = log_amplitude - cv2.blur(log_amplitude, (3, 3))
+    saliency = np.abs(np.fft.ifft2(np.exp(residual + 1j * np.angle(spectrum)))) ** 2
+    saliency = cv2.GaussianBlur(saliency.astype(np.float32), (9, 9), 2.5)
+    saliency = cv2.resize(saliency, (gray.shape[1], gray.shape[0]), interpolation=cv2.INTER_LINEAR)
+    return saliency / (saliency.max() or 1.0)
+
+
+def detail_map(gray: np.ndarray) -> np.ndarray:
+    """Densité de contours (gradient de Sobel lissé), normalisée entre 0 et 1."""
+    import cv2
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    magnitude = cv2.GaussianBlur(cv2.magnitude(gx, gy), (0, 0), 4)
+    return np.clip(magnitude / (np.percentile(magnitude, 99) or 1.0), 0, 1)
+
+
+_face_detector = None
+
+
+def _face_cascade_path() -> str:
+    """Chemin du modèle Haar livré avec OpenCV (vide si la version n'en fournit pas)."""
+    import cv2
+    return os.path.join(getattr(getattr(cv2, "data", None), "haarcascades", ""), FACE_CASCADE)
+
+
+def faces_available() -> bool:
+    """Indique si OpenCV fournit le détecteur Haar et son modèle (absents de certaines versions)."""
+    import cv2
+    return hasattr(cv2, "CascadeClassifier") and os.path.exists(_face_cascade_path())
+
+
+def detect_faces(gray: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """
+    Détecte les visages de face, si le détecteur Haar d'OpenCV est disponible.
+
+    Returns:
+        List[Tuple[int, int, int, int]]: Les boîtes (x, y, largeur, hauteur), vide sans modèle
+    """
+    global _face_detector
+    if _face_detector is None:
+        if not faces_available():
+            return []
+        import cv2
+        _face_detector = cv2.CascadeClassifier(_face_cascade_path())
+    faces = _face_detector.detectMultiScale(gray.astype(np.uint8), scaleFactor=1.1, minNeighbors=5, minSize=(24, 24))
+    return [tuple(int(v) for v in face) for face in faces]
+
+
+def _band(valign: str, band_height: float) -> Tuple[float, float, float, float]:
+    """Boîte (fractions) d'une bande de texte en haut ou en bas de l'image."""
+    left = (1 - BAND_WIDTH) / 2
+    if valign == "bottom":
+        return left, 1 - BOTTOM_MARGIN - band_height, 1 - left, 1 - BOTTOM_MARGIN
+    return left, TOP_MARGIN, 1 - left, TOP_MARGIN + band_height
+
+
+def analyse_template(image: Image.Image) -> Dict:
+    """
+    Cherche la bande de texte qui cache le moins de contenu.
+
+    Args:
+        image (Image.Image): Le template
+
+    Returns:
+        Dict: box (fractions), valign, max_font_ratio (fraction de la hauteur),
+            luminance moyenne sous la bande (0 à 1), visages (fractions) et coût
+    """
+    small = image.convert("L")
+    small.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+    gray = np.asarray(small, dtype=np.float32)
+    height, width = gray.shape
+
+    cost = 0.5 * spectral_saliency(gray) + 0.5 * detail_map(gray)
+    faces = detect_faces(gray)
+    for x, y, w, h in faces:
+        # Visage élargi de 15 % : le front et le menton comptent aussi
+        dx, dy = int(w * 0.15), int(h * 0.15)
+        cost[max(0, y - dy):y + h + dy, max(0, x - dx):x + w + dx] += FACE_PENALTY
+
+    best = None
+    for valign in ("bottom", "top"):
+        for band_height in BAND_HEIGHTS:
+            box = _band(valign, band_height)
+            rows = slice(int(box[1] * height), int(box[3] * height))
+            cols = slice(int(box[0] * width), int(box[2] * width))
+            score = float(cost[rows, cols].mean()) * (BOTTOM_BIAS if valign == "bottom" else 1.0)
+            # À coût égal, la bande la plus haute laisse la plus grande police
+            score /= 1 + band_height
+            if best is None or score < best[0]:
+                best = (score, valign, band_height, box, rows, cols)
+
+    score, valign, band_height, box, rows, cols = best
+    return {
+        "box": [round(v, 4) for v in box],
+        "valign": valign,
+        "max_font_ratio": round(min(band_height / 2, MAX_FONT_RATIO), 4),
+        "luminance": round(float(gray[rows, cols].mean()) / 255, 3),
+        "faces": [[round(x / width, 3), round(y / height, 3), round(w / width, 3), round(h / height, 3)]
+                  for x, y, w, h in faces],
+        "cost": round(score, 4),
+    }
+
+
+def load_hints(path: str = HINTS_PATH) -> Dict[str, Dict]:
+    """
+    Charge les recommandations calculées hors ligne.
+
+    Args:
+        path (str): Le fichier des recommandations
+
+    Returns:
+        Dict[str, Dict]: Identifiant normalisé -> recommandation (vide si le fichier
+            est absent ou d'une autre version)
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if data.get("version") != HINTS_VERSION:
+        return {}
+    return data.get("templates", {})
+
+
+def build_hints(meme_dir: str = "data/img", path: str = HINTS_PATH, force: bool = False) -> Dict[str, Dict]:
+    """
+    Analyse les templates nouveaux ou modifiés et réécrit le fichier des recommandations.
+
+    Args:
+        meme_dir (str): Le répertoire des templates
+        path (str): Le fichier des recommandations
+        force (bool): Tout réanalyser, même les images inchangées
+
+    Returns:
+        Dict[str, Dict]: Les recommandations de tous les templates présents
+    """
+    previous = {} if force else load_hints(path)
+    hints = {}
+    for template_id, image_path in sorted(index_templates(meme_dir).items()):
+        stat = os.stat(image_path)
+        source = {"file": os.path.basename(image_path), "size": stat.st_size, "mtime": int(stat.st_mtime)}
+        if previous.get(template_id, {}).get("source") == source:
+            hints[template_id] = previous[template_id]
+            continue
+        with Image.open(image_path) as image:
+            hints[template_id] = {"source": source, **analyse_template(image)}
+        logger.info(f"{template_id}: bande {hints[template_id]['valign']}, "
+                    f"{len(hints[template_id]['faces'])} visage(s)")
+
+    # Écriture atomique : le fichier lu au démarrage n'est jamais à moitié écrit
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": HINTS_VERSION, "templates": hints}, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return hints
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Précalcule les zones de texte des templates.")
+    parser.add_argument("--meme-dir", default="data/img")
+    parser.add_argument("--output", default=HINTS_PATH)
+    parser.add_argument("--force", action="store_true", help="Réanalyser toutes les images")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="   %(message)s")
+
+    if not faces_available():
+        print("Modèle de visages OpenCV introuvable : analyse sans détection de visages")
+    hints = build_hints(args.meme_dir, args.output, force=args.force)
+    print(f"Recommandations: {len(hints)} templates -> {args.output}")
@@ -0,0 +1,283 @@
+"""
+Index local de recherche des templates de mèmes.
+
+Les descriptions de `data/memes.json` sont indexées avec BM25 sous forme de
+matrices NumPy creuses (CSR pour les documents, listes inversées pour la
+recherche). L'index est sauvegardé à côté du catalogue et seules les entrées
+modifiées sont re-tokenisées lors d'une mise à jour.
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+INDEX_PATH = "data/memes_index.npz"
+
+logger = logging.getLogger(__name__)
+
+# Mots trop fréquents pour aider à départager les templates
+STOPWORDS = frozenset("""
+a au aux avec ce ces cette dans de des du elle en est et il je la le les leur lui ma mais me meme
+mes moi mon ne nous on ou par pas pour qu que quand qui sa se ses son sur ta te tes toi ton tu un une
+utilise vous y t as ai fait
+an and are as at be but by for from i if in is it me my of on or so that the this to was we when
+with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Découpe un texte en termes normalisés (minuscules, sans accents, sans mots vides).
+
+    Args:
+        text (str): Le texte à découper
+
+    Returns:
+        List[str]: Les termes du texte
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", text):
+        if len(word) < 2 or word in STOPWORDS:
+            continue
+        # Racinisation minimale : pluriels français et anglais
+        if len(word) > 3 and word[-1] in "sx":
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def _document_text(meme: Dict) -> str:
+    """Texte indexé pour un mème : son id et sa description."""
+    return f"{meme['id'].replace('_', ' ')} {meme.get('description', '')}"
+
+
+def _document_hash(meme: Dict) -> str:
+    """Empreinte d'une entrée du catalogue, pour détecter les modifications."""
+    return hashlib.sha1(_document_text(meme).encode("utf-8")).hexdigest()
+
+
+class TemplateIndex:
+    def __init__(self, index_path: str = INDEX_PATH, k1: float = 1.5, b: float = 0.75):
+        """
+        Initialise un index vide.
+
+        Args:
+            index_path (str): Le fichier .npz où l'index est sauvegardé
+            k1 (float): Saturation de la fréquence des termes (BM25)
+            b (float): Normalisation par la longueur des documents (BM25)
+        """
+        self.index_path = index_path
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self._hashes: List[str] = []
+        self._doc_terms: List[Dict[str, int]] = []
+        self._vocab: Dict[str, int] = {}
+        self._term_ptr = np.zeros(1, dtype=np.int64)
+        self._post_docs = np.zeros(0, dtype=np.int32)
+        self._post_weights = np.zeros(0, dtype=np.float32)
+
+    @classmethod
+    def load_or_build(cls, memes: Dict[str, Dict], index_path: str = INDEX_PATH) -> "TemplateIndex":
+        """
+        Charge l'index sauvegardé et le met à jour avec le catalogue courant.
+
+        Args:
+            memes (Dict[str, Dict]): Le catalogue de mèmes
+            index_path (str): Le fichier .npz de l'index
+
+        Returns:
+            TemplateIndex: L'index à jour
+        """
+        index = cls(index_path)
+        if os.path.exists(index_path):
+            try:
+                index._load()
+            except (OSError, KeyError, ValueError) as e:
+                logger.warning(f"Index illisible, reconstruction complète: {str(e)}")
+                index = cls(index_path)
+        if index.update(memes):
+            index.save()
+        return index
+
+    def update(self, memes: Dict[str, Dict]) -> bool:
+        """
+        Met à jour l'index avec le catalogue, en ne re-tokenisant que les entrées modifiées.
+
+        Args:
+            memes (Dict[str, Dict]): Le catalogue de mèmes
+
+        Returns:
+            bool: True si l'index a changé
+        """
+        known = {doc_id: (h, terms) for doc_id, h, terms in zip(self.doc_ids, self._hashes, self._doc_terms)}
+        doc_ids, hashes, doc_terms = [], [], []
+        changed = len(memes) != len(self.doc_ids)
+        for meme_id, meme in memes.items():
+            h = _document_hash(meme)
+            previous = known.get(meme_id)
+            if previous is not None and previous[0] == h:
+                terms = previous[1]
+            else:
+                changed = True
+                terms = {}
+                for term in tokenize(_document_text(meme)):
+                    terms[term] = terms.get(term, 0) + 1
+            doc_ids.append(meme_id)
+            hashes.append(h)
+            doc_terms.append(terms)
+
+        if changed or doc_ids != self.doc_ids:
+            self.doc_ids, self._hashes, self._doc_terms = doc_ids, hashes, doc_terms
+            self._reindex()
+            return True
+        return False
+
+    def updated(self, memes: Dict[str, Dict]) -> "TemplateIndex":
+        """
+        Renvoie un index à jour sans modifier celui-ci (qui peut servir à des recherches en cours).
+
+        Les fréquences des entrées inchangées sont partagées, seules les entrées
+        modifiées sont re-tokenisées.
+
+        Args:
+            memes (Dict[str, Dict]): Le nouveau catalogue
+
+        Returns:
+            TemplateIndex: Un nouvel index, ou celui-ci si rien n'a changé
+        """
+        index = copy.copy(self)
+        return index if index.update(memes) else self
+
+    def _reindex(self) -> None:
+        """Recalcule le vocabulaire et les poids BM25 à partir des fréquences des termes."""
+        vocab = sorted({term for terms in self._doc_terms for term in terms})
+        self._vocab = {term: i for i, term in enumerate(vocab)}
+
+        n_docs = len(self._doc_terms)
+        doc_idx, term_idx, counts = [], [], []
+        for d, terms in enumerate(self._doc_terms):
+            for term, count in terms.items():
+                doc_idx.append(d)
+                term_idx.append(self._vocab[term])
+                counts.append(count)
+        doc_idx = np.asarray(doc_idx, dtype=np.int32)
+        term_idx = np.asarray(term_idx, dtype=np.int64)
+        tf = np.asarray(counts, dtype=np.float32)
+
+        lengths = np.bincount(doc_idx, weights=tf, minlength=n_docs).astype(np.float32)
+        avg_length = float(lengths.mean()) if n_docs and lengths.mean() > 0 else 1.0
+        df = np.bincount(term_idx, minlength=len(vocab)).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+        norm = self.k1 * (1 - self.b + self.b * lengths[doc_idx] / avg_length)
+        weights = idf[term_idx] * tf * (self.k1 + 1) / (tf + norm)
+
+        # Listes inversées : pour chaque terme, les documents et leurs poids
+        order = np.argsort(term_idx, kind="stable")
+        self._post_docs = doc_idx[order]
+        self._post_weights = weights[order].astype(np.float32)
+        self._term_ptr = np.concatenate(([0], np.cumsum(np.bincount(term_idx, minlength=len(vocab))))).astype(np.int64)
+
+    def search(self, prompt: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Cherche les templates les plus proches d'un prompt.
+
+        Args:
+            prompt (str): Le prompt décrivant la situation
+            k (int): Le nombre maximum de résultats
+
+        Returns:
+            List[Tuple[str, float]]: Les ids des mèmes et leurs scores, du meilleur au moins bon
+        """
+        term_ids = sorted({self._vocab[t] for t in tokenize(prompt) if t in self._vocab})
+        if not term_ids or not self.doc_ids:
+            return []
+
+        docs = np.concatenate([self._post_docs[self._term_ptr[t]:self._term_ptr[t + 1]] for t in term_ids])
+        weights = np.concatenate([self._post_weights[self._term_ptr[t]:self._term_ptr[t + 1]] for t in term_ids])
+        scores = np.bincount(docs, weights=weights, minlength=len(self.doc_ids))
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.doc_ids[i], float(scores[i])) for i in top]
+
+    @staticmethod
+    def is_confident(results: List[Tuple[str, float]], margin: float = 0.5, min_score: float = 2.0) -> bool:
+        """
+        Indique si le premier résultat se détache assez pour être choisi sans LLM.
+
+        Args:
+            results (List[Tuple[str, float]]): Les résultats de search()
+            margin (float): Avance relative minimale du premier sur le second
+            min_score (float): Score minimal du premier résultat
+
+        Returns:
+            bool: True si le premier résultat peut être retenu directement
+        """
+        if not results or results[0][1] < min_score:
+            return False
+        if len(results) == 1:
+            return True
+        best, second = results[0][1], results[1][1]
+        return (best - second) / best >= margin
+
+    def save(self) -> None:
+        """Sauvegarde l'index dans son fichier .npz."""
+        indptr = np.zeros(len(self._doc_terms) + 1, dtype=np.int64)
+        indices, counts = [], []
+        for d, terms in enumerate(self._doc_terms):
+            indptr[d + 1] = indptr[d] + len(terms)
+            indices.extend(terms.keys())
+            counts.extend(terms.values())
+
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            doc_ids=np.asarray(self.doc_ids, dtype=str),
+            hashes=np.asarray(self._hashes, dtype=str),
+            indptr=indptr,
+            terms=np.asarray(indices, dtype=str),
+            counts=np.asarray(counts, dtype=np.int32),
+        )
+        os.replace(tmp_path, self.index_path)
+
+    def _load(self) -> None:
+        """Recharge les fréquences des termes sauvegardées et recalcule les poids."""
+        with np.load(self.index_path, allow_pickle=False) as data:
+            doc_ids = data["doc_ids"].tolist()
+            hashes = data["hashes"].tolist()
+            indptr = data["indptr"]
+            terms = data["terms"].tolist()
+            counts = data["counts"].tolist()
+
+        self.doc_ids = doc_ids
+        self._hashes = hashes
+        self._doc_terms = [
+            dict(zip(terms[indptr[d]:indptr[d + 1]], counts[indptr[d]:indptr[d + 1]]))
+            for d in range(len(doc_ids))
+        ]
+        self._reindex()
+
+
+if __name__ == "__main__":
+    from src.catalog import load_memes
+
+    index = TemplateIndex.load_or_build(load_memes())
+    print(f"Index construit: {len(index.doc_ids)} mèmes, {len(index._vocab)} termes -> {index.index_path}")
+    for meme_id, score in index.search("j'ai failli tout casser en prod"):
+        print(f"{score:6.2f}  {meme_id}")
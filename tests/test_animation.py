@@ -0,0 +1,109 @@
+"""Templates animés (utils.animation), sur des GIF et WebP animés générés pour le test."""
+from PIL import Image, ImageDraw
+
+import pytest
+
+from utils.animation import WEBP_MAX_FRAMES, CaptionOverlay, encode_animation, frame_durations, select_frames
+from utils.image_utils import format_available
+
+SIZE = (200, 150)
+FRAMES = 30
+DURATION = 50
+# Zone opaque du calque : les captions simulées
+CAPTION_BOX = (10, 10, 90, 40)
+
+
+def _write_animation(path, format: str) -> None:
+    """Une animation de FRAMES images unies et distinctes, de DURATION ms chacune (WebP sans perte)."""
+    frames = [Image.new("RGB", SIZE, (index * 8, 60, 240 - index * 8)) for index in range(FRAMES)]
+    frames[0].save(path, format, save_all=True, append_images=frames[1:], duration=DURATION, loop=0, lossless=True)
+
+
+@pytest.fixture
+def animated_gif(tmp_path):
+    path = tmp_path / "anim.gif"
+    _write_animation(path, "GIF")
+    return str(path)
+
+
+@pytest.fixture
+def animated_webp(tmp_path):
+    if not format_available("WEBP"):
+        pytest.skip("Pillow compilé sans WebP")
+    path = tmp_path / "anim.webp"
+    _write_animation(path, "WEBP")
+    return str(path)
+
+
+def _overlay() -> CaptionOverlay:
+    layer = Image.new("RGBA", SIZE, (0, 0, 0, 0))
+    ImageDraw.Draw(layer).rectangle(CAPTION_BOX, fill=(255, 255, 255, 255))
+    return CaptionOverlay(layer)
+
+
+def _decoded(encoded):
+    """Les images et durées d'un encodage animé."""
+    image = Image.open(encoded.buffer)
+    frames = []
+    for index in range(getattr(image, "n_frames", 1)):
+        image.seek(index)
+        frames.append((image.convert("RGB"), image.info.get("duration")))
+    return frames
+
+
+@pytest.mark.parametrize("source", ["animated_gif", "animated_webp"])
+def test_frame_durations(source, request):
+    path = request.getfixturevalue(source)
+    with Image.open(path) as image:
+        assert frame_durations(image) == [DURATION] * FRAMES
+
+
+def test_frame_durations_of_a_still_image():
+    assert frame_durations(Image.new("RGB", SIZE)) is None
+
+
+def test_select_frames_keeps_total_duration():
+    durations = [DURATION] * FRAMES
+    # 10 i/s : une image sur deux, chacune affichée deux fois plus longtemps
+    plan = select_frames(durations, max_fps=10)
+    assert [index for index, _ in plan] == list(range(0, FRAMES, 2))
+    assert {duration for _, duration in plan} == {2 * DURATION}
+    # Nombre d'images plafonné : la durée totale ne change pas
+    plan = select_frames(durations, max_frames=7)
+    assert len(plan) <= 7
+    assert sum(duration for _, duration in plan) == FRAMES * DURATION
+    assert select_frames(durations) == [(index, DURATION) for index in range(FRAMES)]
+
+
+@pytest.mark.parametrize("source", ["animated_gif", "animated_webp"])
+def test_encode_animation(source, request):
+    path = request.getfixturevalue(source)
+    profiles = ["gif", "thumbnail"] + (["webp"] if format_available("WEBP") else [])
+    encodings = encode_animation(path, [DURATION] * FRAMES, _overlay(), profiles)
+    assert list(encodings) == profiles
+
+    gif = encodings["gif"]
+    assert gif.format == "GIF" and gif.size == SIZE
+    frames = _decoded(gif)
+    # 12 i/s au plus : une image sur deux gardée, durée totale conservée
+    assert len(frames) == FRAMES // 2
+    assert sum(duration for _, duration in frames) == FRAMES * DURATION
+    for frame, _ in frames:
+        # Le calque est composé sur chaque image, le fond de chacune est gardé
+        assert frame.getpixel((50, 25)) == (255, 255, 255)
+        assert frame.getpixel((150, 120))[1] < 100
+    assert frames[0][0].getpixel((150, 120)) != frames[-1][0].getpixel((150, 120))
+
+    # max_frames=1 : une image fixe dans le format du profil
+    thumbnail = encodings["thumbnail"]
+    assert thumbnail.format == "JPEG"
+    assert getattr(Image.open(thumbnail.buffer), "n_frames", 1) == 1
+
+    if "webp" in encodings:
+        webp = encodings["webp"]
+        assert webp.format == "WEBP"
+        frames = _decoded(webp)
+        # Le WebP, encodé d'un bloc, ne garde que WEBP_MAX_FRAMES images en mémoire
+        assert 1 < len(frames) <= WEBP_MAX_FRAMES
+        assert sum(duration for _, duration in frames) == FRAMES * DURATION
+        assert all(min(frame.getpixel((50, 25))) > 230 for frame, _ in frames)
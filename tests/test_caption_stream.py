@@ -0,0 +1,109 @@
+"""Analyse incrémentale des captions en flux (src.caption_generator.CaptionStream)."""
+import json
+
+import pytest
+
+from src.caption_generator import CaptionGenerator, CaptionStream
+
+
+def feed(content, cuts):
+    """Envoie la réponse découpée aux positions données ; renvoie le parseur et les captions émises."""
+    parser, emitted = CaptionStream(), []
+    bounds = [0, *cuts, len(content)]
+    for start, end in zip(bounds, bounds[1:]):
+        emitted += parser.feed(content[start:end])
+    return parser, emitted
+
+
+def splits(content):
+    """Tous les découpages en deux morceaux, et le découpage caractère par caractère."""
+    yield from ([cut] for cut in range(1, len(content)))
+    yield list(range(1, len(content)))
+
+
+def captions(parser, meme_format):
+    return CaptionGenerator._streamed_captions(parser, meme_format)
+
+
+@pytest.mark.parametrize("content, meme_format, expected", [
+    # Échappements : guillemet, antislash, saut de ligne
+    (r'{"texts": ["When \"prod\" \\ breaks", "line\nbreak"]}', "two_panels", ['When "prod" \\ breaks', "line\nbreak"]),
+    # Séquences \uXXXX, dont une paire de substitution
+    (r'{"texts": ["caf\u00e9 \ud83d\ude00"]}', "single_caption", ["caf\u00e9 \U0001F600"]),
+    # Clés avant "texts", dont une clé "variants" et une chaîne "texts" qui n'est pas une clé
+    ('{"variants": [["no"]], "note": "texts", "texts": ["a", "b", "c"]}', "three_panels", ["a", "b", "c"]),
+    # Une clé "texts" imbriquée n'est pas la bonne
+    ('{"meta": {"texts": ["nested"]}, "texts": ["top", "bottom"]}', "top_bottom", ["top", "bottom"]),
+    # Mise en forme indentée, avec des crochets dans une caption
+    (json.dumps({"texts": ["[a], {b}", "c,d"]}, indent=2), "two_panels", ["[a], {b}", "c,d"]),
+])
+def test_captions_are_emitted_at_every_split(content, meme_format, expected):
+    for cuts in splits(content):
+        parser, emitted = feed(content, cuts)
+        assert emitted == expected, cuts
+        assert parser.closed
+        assert captions(parser, meme_format) == expected
+
+
+def test_caption_is_emitted_when_its_string_closes():
+    parser = CaptionStream()
+    assert parser.feed('{"texts": ["first') == []
+    assert parser.feed('", "sec') == ["first"]
+    assert parser.feed('ond"') == ["second"]
+    assert not parser.closed
+    assert parser.feed("]") == []
+    assert parser.closed
+    assert parser.texts == ["first", "second"]
+
+
+def test_key_split_in_the_middle():
+    parser = CaptionStream()
+    for chunk in ['{"te', 'xt', 's"', ' : [', '"a', '"]', "}"]:
+        parser.feed(chunk)
+    assert parser.texts == ["a"]
+    assert parser.closed
+
+
+def test_nothing_is_emitted_before_the_texts_key():
+    parser = CaptionStream()
+    assert parser.feed('{"variants": [["x", "y"]], "comment": "z", ') == []
+    assert parser.texts == []
+    assert parser.feed('"texts": ["ok"]}') == ["ok"]
+
+
+@pytest.mark.parametrize("content, meme_format", [
+    # Réponse tronquée : la liste ne se ferme jamais
+    ('{"texts": ["When it', "single_caption"),
+    ('{"texts": ["a", "b"', "two_panels"),
+    # JSON invalide
+    ("not json", "single_caption"),
+    # Élément qui n'est pas une chaîne
+    ('{"texts": ["a", 3]}', "two_panels"),
+    ('{"texts": [["a"], "b"]}', "two_panels"),
+    # Mauvais nombre de captions, liste vide ou caption vide
+    ('{"texts": ["a"]}', "two_panels"),
+    ('{"texts": []}', "single_caption"),
+    ('{"texts": ["  "]}', "single_caption"),
+    # Pas de liste "texts"
+    ('{"texts": "a"}', "single_caption"),
+    ('["a"]', "single_caption"),
+])
+def test_invalid_answers_are_rejected(content, meme_format):
+    for cuts in splits(content):
+        parser, _ = feed(content, cuts)
+        with pytest.raises(ValueError):
+            captions(parser, meme_format)
+
+
+def test_invalid_escape_raises():
+    with pytest.raises(ValueError):
+        feed(r'{"texts": ["bad \x escape"]}', [])
+
+
+def test_emitter_stops_at_the_first_impossible_caption():
+    reported = []
+    emit, emitted = CaptionGenerator._emitter(lambda index, text: reported.append((index, text)), "two_panels")
+    for text in ["a", "", "b", "c"]:
+        emit(text)
+    assert emitted == ["a"]
+    assert reported == [(0, "a")]
@@ -0,0 +1,79 @@
+"""Mise en page des captions dans les zones d'un template (utils.layout)."""
+from PIL import ImageFont
+
+import pytest
+
+from utils.font_cache import get_font
+from utils.layout import DEFAULT_REGIONS, Region, block_height, fit_caption, line_positions, regions_for
+
+LONG_CAPTION = "when the build finally passes after three hours of fixing a missing comma"
+
+
+@pytest.fixture(scope="module")
+def font_path(tmp_path_factory):
+    """La police intégrée à Pillow, écrite dans un fichier comme une police du catalogue."""
+    path = tmp_path_factory.mktemp("fonts") / "default.ttf"
+    path.write_bytes(ImageFont.load_default(size=10).font_bytes)
+    return str(path)
+
+
+def test_single_caption_without_regions_uses_the_bottom_of_the_image():
+    assert regions_for(None, 1) is None
+    assert regions_for({"format": "single_caption"}, 1) is None
+
+
+def test_default_regions_of_multi_caption_formats():
+    assert regions_for({"format": "top_bottom"}, 2) == list(DEFAULT_REGIONS["top_bottom"])
+    panels = regions_for({"format": "three_panels"}, 3)
+    assert len(panels) == 3
+    # Panneaux empilés, sans chevauchement, dans l'image
+    for upper, lower in zip(panels, panels[1:]):
+        assert upper.box[3] <= lower.box[1]
+    assert all(0 <= region.box[1] < region.box[3] <= 1 for region in panels)
+
+
+def test_unknown_format_is_split_into_panels():
+    assert len(regions_for({"format": "weird"}, 4)) == 4
+
+
+def test_declared_regions():
+    meme_info = {"regions": [{"box": [0, 0, 1, 0.5], "valign": "top", "max_lines": 3}, {"box": [0, 0.5, 1, 1]}]}
+    assert regions_for(meme_info, 2) == [
+        Region((0.0, 0.0, 1.0, 0.5), valign="top", max_lines=3),
+        Region((0.0, 0.5, 1.0, 1.0)),
+    ]
+    with pytest.raises(ValueError):
+        regions_for(meme_info, 3)
+    with pytest.raises(ValueError):
+        regions_for({"regions": [{"box": [0.5, 0, 0.2, 1]}]}, 1)
+
+
+@pytest.mark.parametrize("meme_info", [None, {"format": "weird"}, {"format": "two_panels"}, {"regions": [{"box": [0, 0, 1, 1]}]}])
+def test_no_caption_has_no_region(meme_info):
+    assert regions_for(meme_info, 0) == []
+    assert regions_for(meme_info, -1) == []
+
+
+@pytest.mark.parametrize("max_width, max_height, max_lines", [(400, 120, 3), (900, 90, 3), (1200, 60, 4), (300, 300, 2)])
+def test_fit_caption_block_fits_the_region(font_path, max_width, max_height, max_lines):
+    layout = fit_caption(font_path, LONG_CAPTION, max_width, max_height, 200, max_lines, min_size=8)
+    font = get_font(font_path, layout.size)
+    assert 1 <= len(layout.lines) <= max_lines
+    assert " ".join(layout.lines) == LONG_CAPTION
+    assert max(font.getlength(line) for line in layout.lines) <= max_width
+    # Le bloc de lignes entier, interlignes compris, tient dans la hauteur
+    if len(layout.lines) > 1:
+        assert block_height(font, len(layout.lines)) <= max_height
+        positions = line_positions(font, layout.lines, (0, 0, max_width, max_height), valign="bottom")
+        assert positions[0][1] >= 0
+
+
+def test_fit_caption_wraps_rather_than_shrinks(font_path):
+    one_line = fit_caption(font_path, LONG_CAPTION, 500, 200, 200, 1, min_size=8)
+    wrapped = fit_caption(font_path, LONG_CAPTION, 500, 200, 200, 3, min_size=8)
+    assert one_line.lines == (LONG_CAPTION,)
+    assert len(wrapped.lines) > 1 and wrapped.size > one_line.size
+
+
+def test_fit_caption_of_an_empty_caption(font_path):
+    assert fit_caption(font_path, "   ", 500, 200, 200, 2, min_size=8).lines == ("",)
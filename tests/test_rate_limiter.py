@@ -0,0 +1,158 @@
+"""Seaux à jetons, files de priorité et pause après un 429 du limiteur (src.rate_limiter)."""
+import asyncio
+
+import pytest
+
+from src.rate_limiter import QueueTimeout, RateLimiter, RateLimits
+
+
+class FakeClock:
+    """Horloge avancée à la main : les tests ne dépendent pas du temps réel."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def try_acquire(limiter, tokens=0, lane="interactive"):
+    """Prend un créneau sans attendre ; False si le quota impose d'attendre."""
+    try:
+        limiter.acquire(tokens, lane, timeout=0)
+    except QueueTimeout:
+        return False
+    return True
+
+
+def test_requests_bucket_refills_at_the_configured_rate():
+    clock = FakeClock()
+    limiter = RateLimiter(RateLimits(requests_per_second=2), clock=clock)
+
+    # Rafale d'une seconde : deux requêtes tout de suite, pas une troisième
+    assert try_acquire(limiter) and try_acquire(limiter)
+    assert not try_acquire(limiter)
+    assert limiter._requests.delay(1) == pytest.approx(0.5)
+
+    clock.advance(0.5)
+    assert try_acquire(limiter)
+    assert not try_acquire(limiter)
+
+    # Le seau ne dépasse pas sa capacité, même après une longue pause
+    clock.advance(60)
+    assert try_acquire(limiter) and try_acquire(limiter)
+    assert not try_acquire(limiter)
+
+
+def test_tokens_bucket_refills_per_minute():
+    clock = FakeClock()
+    limiter = RateLimiter(RateLimits(tokens_per_minute=600), clock=clock)
+
+    assert try_acquire(limiter, tokens=500)
+    assert not try_acquire(limiter, tokens=200)
+
+    # 600 tokens par minute : 10 par seconde
+    clock.advance(9)
+    assert not try_acquire(limiter, tokens=200)
+    clock.advance(1)
+    assert try_acquire(limiter, tokens=200)
+
+
+def test_release_credits_tokens_that_were_not_used():
+    clock = FakeClock()
+    limiter = RateLimiter(RateLimits(tokens_per_minute=600), clock=clock)
+
+    assert try_acquire(limiter, tokens=500)
+    assert not try_acquire(limiter, tokens=400)
+    # L'estimation était de 500, l'appel n'en a consommé que 100
+    limiter.release(500, used=100)
+    assert try_acquire(limiter, tokens=400)
+
+
+def test_concurrency_limit_holds_until_release():
+    limiter = RateLimiter(RateLimits(max_concurrency=1), clock=FakeClock())
+
+    assert try_acquire(limiter)
+    assert not try_acquire(limiter)
+    limiter.release()
+    assert try_acquire(limiter)
+
+
+def test_penalize_pauses_every_lane_until_the_delay_is_over():
+    clock = FakeClock()
+    limiter = RateLimiter(RateLimits(requests_per_second=100), clock=clock)
+
+    limiter.penalize(2.0)
+    assert not try_acquire(limiter, lane="interactive")
+    assert not try_acquire(limiter, lane="batch")
+    clock.advance(1.9)
+    assert not try_acquire(limiter)
+    clock.advance(0.2)
+    assert try_acquire(limiter)
+
+
+def test_penalize_keeps_the_longest_pause():
+    clock = FakeClock()
+    limiter = RateLimiter(RateLimits(), clock=clock)
+
+    limiter.penalize(5.0)
+    limiter.penalize(1.0)
+    clock.advance(2.0)
+    assert not try_acquire(limiter)
+    clock.advance(3.1)
+    assert try_acquire(limiter)
+
+
+def test_interactive_lane_is_served_before_batch_then_in_arrival_order():
+    limiter = RateLimiter(RateLimits(max_concurrency=1), clock=FakeClock())
+    order = []
+
+    async def call(name, lane):
+        await limiter.acquire_async(lane=lane)
+        order.append(name)
+        limiter.release()
+
+    async def main():
+        await limiter.acquire_async()
+        tasks = []
+        for name, lane in [("batch-1", "batch"), ("batch-2", "batch"), ("interactive-1", "interactive"), ("interactive-2", "interactive")]:
+            tasks.append(asyncio.ensure_future(call(name, lane)))
+            # Chaque demande entre dans la file avant la suivante
+            await asyncio.sleep(0)
+        assert limiter.stats() == {"active": 1, "waiting_interactive": 2, "waiting_batch": 2}
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["interactive-1", "interactive-2", "batch-1", "batch-2"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    limiter = RateLimiter(RateLimits(max_concurrency=1), clock=FakeClock())
+
+    async def main():
+        await limiter.acquire_async()
+        waiter = asyncio.ensure_future(limiter.acquire_async(lane="batch"))
+        await asyncio.sleep(0)
+        assert limiter.stats()["waiting_batch"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.stats()["waiting_batch"] == 0
+        limiter.release()
+        assert limiter.stats()["active"] == 0
+
+    asyncio.run(main())
+
+
+def test_unknown_lane_is_rejected():
+    with pytest.raises(ValueError):
+        RateLimiter(clock=FakeClock()).acquire(lane="urgent")
+
+
+def test_divided_limits_share_the_quota_between_workers():
+    limits = RateLimits(requests_per_second=5, tokens_per_minute=1000, max_concurrency=8).divided(4)
+    assert limits == RateLimits(requests_per_second=1.25, tokens_per_minute=250, max_concurrency=2)
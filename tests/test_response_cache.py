@@ -0,0 +1,156 @@
+"""Fusion des appels simultanés (singleflight) du cache des réponses (src.response_cache)."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.response_cache import ResponseCache
+
+
+def test_concurrent_callers_share_one_compute():
+    cache = ResponseCache(ttl=60)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["value"]
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        leader = pool.submit(cache.get_or_compute, "key", compute)
+        assert started.wait(5)
+        followers = [pool.submit(cache.get_or_compute, "key", compute) for _ in range(4)]
+        while cache.stats()["coalesced"] < 4:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [leader.result(5)] + [future.result(5) for future in followers]
+
+    assert results == [["value"]] * 5
+    assert len(calls) == 1
+    assert cache.stats()["inflight"] == 0
+    # Réponse servie depuis le cache ensuite
+    assert cache.get_or_compute("key", compute) == ["value"]
+    assert len(calls) == 1
+
+
+def test_concurrent_async_callers_share_one_compute():
+    cache = ResponseCache(ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ["value"]
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute_async("key", compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == [["value"]] * 5
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_follower_gets_the_value_when_the_leader_is_cancelled():
+    cache = ResponseCache(ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return ["value"]
+
+    async def main():
+        leader = asyncio.ensure_future(cache.get_or_compute_async("key", compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(cache.get_or_compute_async("key", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == ["value"]
+    assert len(calls) == 1
+    # L'appel mené à terme est mis en cache
+    assert cache.get("key") == ["value"]
+    assert cache.stats()["inflight"] == 0
+
+
+def test_errors_reach_every_caller_and_are_not_cached():
+    cache = ResponseCache(ttl=60)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("invalid answer")
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.get_or_compute_async("key", failing) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert cache.get("key") is None
+    assert cache.stats()["inflight"] == 0
+
+
+def test_errors_reach_every_sync_caller():
+    cache = ResponseCache(ttl=60)
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("invalid answer")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        leader = pool.submit(cache.get_or_compute, "key", failing)
+        assert started.wait(5)
+        follower = pool.submit(cache.get_or_compute, "key", failing)
+        while cache.stats()["coalesced"] < 1:
+            threading.Event().wait(0.01)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result(5)
+    assert cache.get("key") is None
+
+
+def test_fresh_skips_the_cached_answer():
+    cache = ResponseCache(ttl=60)
+    answers = iter([["first"], ["second"]])
+
+    assert cache.get_or_compute("key", lambda: next(answers)) == ["first"]
+    assert cache.get_or_compute("key", lambda: pytest.fail("cached answer expected")) == ["first"]
+    assert cache.get_or_compute("key", lambda: next(answers), fresh=True) == ["second"]
+    # La nouvelle réponse remplace l'ancienne
+    assert cache.get("key") == ["second"]
+
+
+def test_fresh_skips_the_cached_answer_async():
+    cache = ResponseCache(ttl=60)
+    answers = iter([["first"], ["second"]])
+
+    async def compute():
+        return next(answers)
+
+    async def main():
+        first = await cache.get_or_compute_async("key", compute)
+        cached = await cache.get_or_compute_async("key", compute)
+        fresh = await cache.get_or_compute_async("key", compute, fresh=True)
+        return first, cached, fresh
+
+    assert asyncio.run(main()) == (["first"], ["first"], ["second"])
+
+
+def test_answers_survive_in_sqlite(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResponseCache(ttl=60, sqlite_path=path).get_or_compute("key", lambda: ["value"])
+    reopened = ResponseCache(ttl=60, sqlite_path=path)
+    assert reopened.get_or_compute("key", lambda: pytest.fail("persisted answer expected")) == ["value"]
@@ -0,0 +1,51 @@
+"""Le rendu en une passe (utils.text_renderer) reproduit les boucles draw.text historiques."""
+import glob
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFont
+
+from benchmarks.bench_text_render import CAPTION, legacy_draw_caption
+from utils.text_renderer import draw_caption, outline_size_for, shadow_offset_for
+
+TEMPLATES = sorted(glob.glob(os.path.join("data", "img", "*")))[:3]
+# Écart maximal toléré par canal : arrondis de la composition en flottants
+MAX_PIXEL_DIFF = 3
+
+
+@pytest.mark.parametrize("path", TEMPLATES, ids=os.path.basename)
+@pytest.mark.parametrize("font_size", [24, 64])
+def test_draw_caption_matches_legacy_rendering(path, font_size):
+    # Police embarquée par Pillow : aucun fichier de police requis
+    font = ImageFont.load_default(size=font_size)
+    template = Image.open(path).convert("RGB")
+    position = (template.width // 10, template.height // 2)
+
+    reference = legacy_draw_caption(template.copy(), position, CAPTION, font, font_size)
+    rendered = draw_caption(
+        template.copy(), position, CAPTION, font,
+        outline_size=outline_size_for(font_size),
+        shadow_offset=shadow_offset_for(font_size),
+    )
+
+    diff = np.abs(np.asarray(reference, dtype=np.int16) - np.asarray(rendered, dtype=np.int16))
+    assert diff.max() <= MAX_PIXEL_DIFF
+    # Le texte a bien été dessiné
+    assert np.any(np.asarray(rendered) != np.asarray(template))
+
+
+def test_draw_caption_on_transparent_layer_matches_opaque_rendering():
+    font_size = 48
+    font = ImageFont.load_default(size=font_size)
+    template = Image.open(TEMPLATES[0]).convert("RGB")
+    position = (20, template.height // 3)
+    kwargs = dict(outline_size=outline_size_for(font_size), shadow_offset=shadow_offset_for(font_size))
+
+    direct = draw_caption(template.copy(), position, CAPTION, font, **kwargs)
+    layer = draw_caption(Image.new("RGBA", template.size, (0, 0, 0, 0)), position, CAPTION, font, **kwargs)
+    composed = template.convert("RGBA")
+    composed.alpha_composite(layer)
+
+    diff = np.abs(np.asarray(direct, dtype=np.int16) - np.asarray(composed.convert("RGB"), dtype=np.int16))
+    assert diff.max() <= MAX_PIXEL_DIFF
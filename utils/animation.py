@@ -0,0 +1,268 @@
+"""
+Templates animés (GIF, WebP animé) : images lues une à une et calque de texte unique.
+
+Les captions sont dessinées une seule fois sur un calque transparent, recadré
+sur sa zone utile, puis composé sur chaque image de l'animation au passage. Les
+images sont lues dans le fichier au fil de l'encodage : seule l'image courante
+est décodée. Le GIF est écrit image par image : c'est le format animé des
+profils JPEG et AVIF. Seul le WebP fait exception : l'encodeur de Pillow demande
+toutes les images d'un coup, un profil WebP garde donc en mémoire ses images
+retenues, déjà réduites, WEBP_MAX_FRAMES au plus. Chaque profil peut limiter le
+nombre d'images et leur fréquence (envoi dans un chat) : la durée totale de
+l'animation est conservée.
+"""
+import io
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from PIL import GifImagePlugin, Image
+
+from utils.image_utils import EncodedImage, EncodingProfile, encode_profile, format_available, get_profile, scaled_size
+
+# Durée d'une image sans durée déclarée, et plus courte durée respectée par les navigateurs (ms)
+DEFAULT_FRAME_DURATION = 100
+MIN_FRAME_DURATION = 20
+# Plafond d'images d'une animation, quel que soit le profil
+MAX_FRAMES = 240
+# Images qu'un profil WebP garde en mémoire avant l'encodage (~5 Mo chacune en 1280 px)
+WEBP_MAX_FRAMES = 12
+# Effort de l'encodeur WebP animé : 2 encode deux fois plus vite que 4 pour ~7 % d'octets en plus
+WEBP_ANIMATION_METHOD = 2
+
+# Une image retenue : son indice dans le fichier et sa durée d'affichage (ms)
+FramePlan = List[Tuple[int, int]]
+
+
+def frame_durations(image: Image.Image) -> Optional[List[int]]:
+    """
+    Relève la durée de chaque image d'une animation.
+
+    Args:
+        image (Image.Image): L'image ouverte (seule l'image courante est décodée à chaque pas)
+
+    Returns:
+        Optional[List[int]]: Les durées en millisecondes, ou None pour une image fixe
+    """
+    if not getattr(image, "is_animated", False) or getattr(image, "n_frames", 1) < 2:
+        return None
+    durations = []
+    for index in range(image.n_frames):
+        image.seek(index)
+        if image.format == "WEBP":
+            # Le WebP ne renseigne la durée d'une image qu'une fois celle-ci décodée
+            image.load()
+        durations.append(int(image.info.get("duration") or DEFAULT_FRAME_DURATION))
+    image.seek(0)
+    return durations
+
+
+def select_frames(durations: Sequence[int], max_frames: Optional[int] = None, max_fps: Optional[float] = None) -> FramePlan:
+    """
+    Choisit les images à garder pour respecter un nombre d'images et une fréquence maximale.
+
+    Une image est gardée quand son instant de début atteint le prochain créneau ;
+    elle dure jusqu'à la suivante gardée. La durée totale ne change pas.
+
+    Args:
+        durations (Sequence[int]): La durée de chaque image, en millisecondes
+        max_frames (int, optional): Le nombre maximal d'images
+        max_fps (float, optional): La fréquence maximale, en images par seconde
+
+    Returns:
+        FramePlan: Les images gardées (indice, durée)
+    """
+    total = sum(durations)
+    interval = 1000 / max_fps if max_fps else 0
+    if max_frames and len(durations) > max_frames:
+        interval = max(interval, total / max_frames)
+    interval = max(interval, MIN_FRAME_DURATION)
+
+    kept = []
+    start, next_slot = 0, 0.0
+    for index, duration in enumerate(durations):
+        if start >= next_slot and (not max_frames or len(kept) < max_frames):
+            kept.append((index, start))
+            next_slot = start + interval
+        start += duration
+    ends = [begin for _, begin in kept[1:]] + [total]
+    return [(index, max(MIN_FRAME_DURATION, end - begin)) for (index, begin), end in zip(kept, ends)]
+
+
+def iter_frames(path: str, indices: Sequence[int], size: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Lit des images d'une animation, une à la fois.
+
+    Args:
+        path (str): Le fichier du template
+        indices (Sequence[int]): Les images voulues, dans l'ordre
+        size (Tuple[int, int], optional): La taille de sortie (celle du fichier si absente)
+
+    Yields:
+        Tuple[int, Image.Image]: L'indice et l'image en RGB
+    """
+    with Image.open(path) as source:
+        for index in indices:
+            source.seek(index)
+            frame = source.convert("RGB")
+            if size is not None and frame.size != size:
+                frame = frame.resize(size, Image.Resampling.LANCZOS, reducing_gap=1.5)
+            yield index, frame
+
+
+class CaptionOverlay:
+    """Le calque des captions, recadré sur la zone dessinée, à composer sur chaque image."""
+
+    def __init__(self, layer: Image.Image):
+        """
+        Args:
+            layer (Image.Image): Le calque RGBA, à la taille des images, avec les captions dessinées
+        """
+        self.size = layer.size
+        self.box = layer.getchannel("A").getbbox()
+        self.image = layer.crop(self.box) if self.box is not None else None
+
+    def apply(self, frame: Image.Image) -> Image.Image:
+        """
+        Compose le calque sur une image (en place).
+
+        Args:
+            frame (Image.Image): L'image RGB, à la taille du calque
+
+        Returns:
+            Image.Image: L'image modifiée
+        """
+        if self.image is None:
+            return frame
+        region = frame.crop(self.box).convert("RGBA")
+        region.alpha_composite(self.image)
+        frame.paste(region.convert("RGB"), self.box[:2])
+        return frame
+
+
+class _GifWriter:
+    """Écrit un GIF animé image par image (aucune image gardée en mémoire)."""
+
+    def __init__(self, loop: int = 0):
+        self.buffer = io.BytesIO()
+        self.loop = loop
+        self.frames = 0
+
+    def add(self, frame: Image.Image, duration: int) -> None:
+        # Palette adaptative propre à chaque image, comme l'encodeur GIF de Pillow
+        frame = frame.convert("P", palette=Image.Palette.ADAPTIVE)
+        if self.frames == 0:
+            header, _ = GifImagePlugin.getheader(frame, info={"loop": self.loop})
+            self.buffer.write(b"".join(header))
+        for chunk in GifImagePlugin.getdata(frame, duration=duration, include_color_table=True):
+            self.buffer.write(chunk)
+        self.frames += 1
+
+    def close(self) -> io.BytesIO:
+        self.buffer.write(b";")
+        self.buffer.seek(0)
+        return self.buffer
+
+
+class _WebPWriter:
+    """Assemble un WebP animé : l'encodeur de Pillow reçoit toutes les images retenues à la fin."""
+
+    def __init__(self, quality: int, loop: int = 0):
+        self.quality = quality
+        self.loop = loop
+        self.images: List[Image.Image] = []
+        self.durations: List[int] = []
+
+    def add(self, frame: Image.Image, duration: int) -> None:
+        self.images.append(frame)
+        self.durations.append(duration)
+
+    def close(self) -> io.BytesIO:
+        buffer = io.BytesIO()
+        self.images[0].save(
+            buffer, "WEBP", save_all=True, append_images=self.images[1:],
+            duration=self.durations, loop=self.loop, quality=self.quality, method=WEBP_ANIMATION_METHOD,
+        )
+        self.images.clear()
+        buffer.seek(0)
+        return buffer
+
+
+def animated_format(profile: EncodingProfile) -> str:
+    """Le format animé d'un profil : WebP pour un profil WebP (si Pillow l'écrit), sinon GIF, écrit au fil de l'eau."""
+    if profile.format == "WEBP" and format_available("WEBP"):
+        return "WEBP"
+    return "GIF"
+
+
+def frame_limit(profile: EncodingProfile) -> int:
+    """
+    Le nombre d'images qu'un profil peut garder.
+
+    Args:
+        profile (EncodingProfile): Le profil
+
+    Returns:
+        int: max_frames du profil, MAX_FRAMES au plus (WEBP_MAX_FRAMES pour le WebP, gardé en mémoire)
+    """
+    limit = min(profile.max_frames or MAX_FRAMES, MAX_FRAMES)
+    if animated_format(profile) == "WEBP":
+        limit = min(limit, WEBP_MAX_FRAMES)
+    return limit
+
+
+def encode_animation(
+    path: str,
+    durations: Sequence[int],
+    overlay: CaptionOverlay,
+    profiles: Sequence[Union[str, EncodingProfile]],
+) -> Dict[str, EncodedImage]:
+    """
+    Compose le calque sur l'animation et l'encode selon plusieurs profils en un passage.
+
+    Chaque image utile est décodée une fois, reçoit le calque, puis est réduite
+    et transmise à l'encodeur de chaque profil qui la retient. Un profil qui ne
+    garde qu'une image (max_frames=1) produit une image fixe dans son format.
+
+    Args:
+        path (str): Le fichier du template animé
+        durations (Sequence[int]): La durée de chaque image du fichier (voir frame_durations)
+        overlay (CaptionOverlay): Le calque des captions, à la taille de rendu
+        profiles (Sequence[Union[str, EncodingProfile]]): Les profils, par nom ou décrits
+
+    Returns:
+        Dict[str, EncodedImage]: Les encodages, dans l'ordre demandé
+    """
+    resolved = [get_profile(profile) for profile in profiles]
+    sizes = {profile.name: scaled_size(overlay.size, profile.max_size) for profile in resolved}
+    plans = {
+        profile.name: dict(select_frames(durations, frame_limit(profile), profile.max_fps))
+        for profile in resolved
+    }
+    writers = {
+        profile.name: (_WebPWriter(profile.quality) if animated_format(profile) == "WEBP" else _GifWriter())
+        for profile in resolved if len(plans[profile.name]) > 1
+    }
+    stills: Dict[str, Image.Image] = {}
+
+    indices = sorted(set().union(*plans.values()))
+    for index, frame in iter_frames(path, indices, overlay.size):
+        frame = overlay.apply(frame)
+        for profile in resolved:
+            duration = plans[profile.name].get(index)
+            if duration is None:
+                continue
+            size = sizes[profile.name]
+            scaled = frame if size == frame.size else frame.resize(size, Image.Resampling.LANCZOS, reducing_gap=1.5)
+            if profile.name in writers:
+                writers[profile.name].add(scaled, duration)
+            else:
+                stills[profile.name] = scaled
+
+    encoded = {}
+    for profile in resolved:
+        if profile.name in stills:
+            encoded[profile.name] = encode_profile(stills[profile.name], profile)
+            continue
+        format = animated_format(profile)
+        buffer = writers[profile.name].close()
+        encoded[profile.name] = EncodedImage(profile.name, buffer, format, sizes[profile.name], profile.quality)
+    return encoded
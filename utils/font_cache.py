@@ -0,0 +1,212 @@
+"""
+Cache des polices et ajustement rapide de la taille du texte.
+
+Les FreeTypeFont sont gardées dans un cache LRU indexé par (chemin, taille).
+Pour chaque police, une table des avancées et des boîtes des glyphes est
+mesurée une fois à une taille de référence : la largeur d'un texte s'en déduit
+par une simple règle de trois, et seules O(log n) vraies mesures servent à
+confirmer la taille retenue.
+"""
+from functools import lru_cache
+from typing import Callable, Tuple
+
+import numpy as np
+from PIL import ImageFont
+
+REFERENCE_SIZE = 256
+# Glyphes mesurés à l'avance (ASCII et Latin-1) ; les autres le sont à la demande
+TABLE_SIZE = 256
+
+
+@lru_cache(maxsize=256)
+def get_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """
+    Charge une police TrueType, une seule fois par (chemin, taille).
+
+    Args:
+        path (str): Le chemin du fichier de police
+        size (int): La taille en pixels
+
+    Returns:
+        ImageFont.FreeTypeFont: La police chargée
+    """
+    return ImageFont.truetype(path, size)
+
+
+class FontMetrics:
+    def __init__(self, path: str):
+        """
+        Mesure les glyphes de la police à la taille de référence.
+
+        Args:
+            path (str): Le chemin du fichier de police
+        """
+        self.path = path
+        self.font = get_font(path, REFERENCE_SIZE)
+        self._advances = np.zeros(TABLE_SIZE, dtype=np.float32)
+        # Boîte d'encre de chaque glyphe : gauche, haut, droite, bas
+        self._boxes = np.zeros((TABLE_SIZE, 4), dtype=np.float32)
+        for code in range(32, TABLE_SIZE):
+            self._advances[code], self._boxes[code] = self._measure(chr(code))
+        self._extra = {}
+        self._words = {}
+
+    def _measure(self, char: str) -> Tuple[float, Tuple[float, float, float, float]]:
+        """Avancée et boîte d'encre d'un glyphe à la taille de référence."""
+        return self.font.getlength(char), self.font.getbbox(char)
+
+    def _glyphs(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Avancées et boîtes des glyphes du texte, à la taille de référence."""
+        codes = np.fromiter((ord(c) for c in text), dtype=np.int64, count=len(text))
+        if codes.size and codes.max() >= TABLE_SIZE:
+            advances, boxes = [], []
+            for char, code in zip(text, codes):
+                if code < TABLE_SIZE:
+                    advances.append(self._advances[code])
+                    boxes.append(self._boxes[code])
+                else:
+                    if char not in self._extra:
+                        self._extra[char] = self._measure(char)
+                    advance, box = self._extra[char]
+                    advances.append(advance)
+                    boxes.append(box)
+            return np.asarray(advances, np.float32), np.asarray(boxes, np.float32)
+        return self._advances[codes], self._boxes[codes]
+
+    def reference_size(self, text: str) -> Tuple[float, float]:
+        """
+        Estime la boîte d'encre du texte à la taille de référence.
+
+        Args:
+            text (str): Le texte (une seule ligne)
+
+        Returns:
+            Tuple[float, float]: La largeur et la hauteur estimées
+        """
+        if not text:
+            return 0.0, 0.0
+        advances, boxes = self._glyphs(text)
+        width = advances[:-1].sum() + boxes[-1, 2] - boxes[0, 0]
+        inked = boxes[(boxes[:, 2] > boxes[:, 0])]
+        if inked.size == 0:
+            return float(width), 0.0
+        height = inked[:, 3].max() - inked[:, 1].min()
+        return float(width), float(height)
+
+    def advance(self, text: str) -> float:
+        """
+        Avancée d'un mot à la taille de référence, mémorisée par mot.
+
+        Args:
+            text (str): Le mot (ou l'espace)
+
+        Returns:
+            float: L'avancée en pixels, à REFERENCE_SIZE
+        """
+        width = self._words.get(text)
+        if width is None:
+            width = float(self._glyphs(text)[0].sum()) if text else 0.0
+            self._words[text] = width
+        return width
+
+    def estimate_size(self, text: str, size: int) -> Tuple[float, float]:
+        """Estime la largeur et la hauteur du texte à une taille donnée."""
+        width, height = self.reference_size(text)
+        scale = size / REFERENCE_SIZE
+        return width * scale, height * scale
+
+
+@lru_cache(maxsize=32)
+def get_font_metrics(path: str) -> FontMetrics:
+    """
+    Renvoie la table des glyphes d'une police, construite une fois.
+
+    Args:
+        path (str): Le chemin du fichier de police
+
+    Returns:
+        FontMetrics: Les métriques de la police
+    """
+    return FontMetrics(path)
+
+
+def measure_text(path: str, size: int, text: str) -> Tuple[int, int]:
+    """
+    Mesure réellement la boîte d'encre du texte.
+
+    Args:
+        path (str): Le chemin du fichier de police
+        size (int): La taille en pixels
+        text (str): Le texte
+
+    Returns:
+        Tuple[int, int]: La largeur et la hauteur
+    """
+    left, top, right, bottom = get_font(path, size).getbbox(text)
+    return right - left, bottom - top
+
+
+def _search_grid(fits: Callable[[int], bool], sizes: list, guess: int) -> int:
+    """
+    Renvoie l'indice de la première taille qui rentre dans une grille décroissante.
+
+    L'estimation `guess` est vérifiée avec deux mesures ; si elle est fausse,
+    une recherche dichotomique est faite du bon côté.
+
+    Returns:
+        int: L'indice trouvé, ou len(sizes) si aucune taille ne rentre
+    """
+    n = len(sizes)
+    guess = min(max(guess, 0), n - 1)
+    if fits(sizes[guess]):
+        if guess == 0 or not fits(sizes[guess - 1]):
+            return guess
+        lo, hi = 0, guess - 1
+    else:
+        lo, hi = guess + 1, n
+
+    # Invariant : sizes[hi] rentre (ou hi == n), sizes[lo - 1] ne rentre pas
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if fits(sizes[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+@lru_cache(maxsize=4096)
+def fit_font_size(path: str, text: str, max_width: int, max_height: int, start_size: int, min_size: int = 20, step: int = 2) -> int:
+    """
+    Cherche la plus grande taille de la grille start_size, start_size - step, ...
+    pour laquelle le texte tient dans max_width x max_height.
+
+    Args:
+        path (str): Le chemin du fichier de police
+        text (str): Le texte (une seule ligne)
+        max_width (int): La largeur disponible
+        max_height (int): La hauteur disponible
+        start_size (int): La plus grande taille essayée
+        min_size (int): La taille minimale, renvoyée si rien ne rentre
+        step (int): Le pas de la grille
+
+    Returns:
+        int: La taille de police retenue
+    """
+    sizes = list(range(start_size, min_size, -step))
+    if not sizes:
+        return min_size
+
+    def fits(size: int) -> bool:
+        width, height = measure_text(path, size, text)
+        return width <= max_width and height <= max_height
+
+    # Taille estimée analytiquement à partir de la table des glyphes
+    ref_width, ref_height = get_font_metrics(path).reference_size(text)
+    limits = [REFERENCE_SIZE * max_width / ref_width if ref_width else float("inf"),
+              REFERENCE_SIZE * max_height / ref_height if ref_height else float("inf")]
+    estimate = min(limits)
+    guess = 0 if estimate >= start_size else int(np.ceil((start_size - estimate) / step))
+
+    index = _search_grid(fits, sizes, guess)
+    return sizes[index] if index < len(sizes) else min_size
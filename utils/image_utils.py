@@ -1,28 +1,31 @@
-from PIL import Image
+from PIL import Image, features
+import io
 import os
-from typing import Tuple
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 def ensure_meme_directory(meme_dir: str) -> None:
     """Vérifie que le répertoire des mèmes existe."""
     os.makedirs(meme_dir, exist_ok=True)
     
-def save_meme(image: Image.Image, filename: str, output_dir: str = "output") -> str:
+def encode_image(image: Image.Image, format: str = "JPEG", quality: int = 95) -> io.BytesIO:
     """
-    Sauvegarde un mème dans le répertoire de sortie.
+    Encode une image en mémoire, sans passer par le disque.
     
     Args:
-        image (Image.Image): L'image du mème
-        filename (str): Le nom du fichier (sans extension)
-        output_dir (str): Le répertoire de sortie
+        image (Image.Image): L'image à encoder
+        format (str): Le format Pillow (JPEG par défaut)
+        quality (int): La qualité de compression
         
     Returns:
-        str: Le chemin du fichier sauvegardé
+        io.BytesIO: Le tampon encodé, positionné au début
     """
-    os.makedirs(output_dir, exist_ok=True)
-    filepath = os.path.join(output_dir, f"{filename}.jpg")
-    image.save(filepath, "JPEG", quality=95)
-    return filepath
-    
+    buffer = io.BytesIO()
+    image.save(buffer, format, quality=quality)
+    buffer.seek(0)
+    return buffer
+
+
 def get_image_dimensions(image_path: str) -> Tuple[int, int]:
     """
     Récupère les dimensions d'une image.
@@ -56,3 +59,241 @@ def resize_image(image: Image.Image, max_size: Tuple[int, int]) -> Image.Image:
     new_height = int(height * ratio)
     
     return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+
+def make_contact_sheet(
+    images: List[Image.Image],
+    columns: Optional[int] = None,
+    thumb_width: int = 480,
+    padding: int = 12,
+    background: Tuple[int, int, int] = (255, 255, 255),
+) -> Image.Image:
+    """
+    Assemble plusieurs images en une planche, pour choisir une variante d'un coup d'œil.
+    
+    Args:
+        images (List[Image.Image]): Les images, dans l'ordre d'affichage
+        columns (int, optional): Le nombre de colonnes (toutes sur une ligne jusqu'à 3 images)
+        thumb_width (int): La largeur de chaque vignette
+        padding (int): L'espace entre les vignettes et autour de la planche
+        background (Tuple[int, int, int]): La couleur du fond
+        
+    Returns:
+        Image.Image: La planche en RGB
+    """
+    if not images:
+        raise ValueError("Aucune image pour la planche")
+    columns = columns or min(len(images), 3)
+    rows = (len(images) + columns - 1) // columns
+    thumbs = [resize_image(image, (thumb_width, thumb_width * 4)) for image in images]
+    cell_height = max(thumb.height for thumb in thumbs)
+    
+    sheet = Image.new(
+        "RGB",
+        (columns * (thumb_width + padding) + padding, rows * (cell_height + padding) + padding),
+        background,
+    )
+    for i, thumb in enumerate(thumbs):
+        row, column = divmod(i, columns)
+        x = padding + column * (thumb_width + padding) + (thumb_width - thumb.width) // 2
+        y = padding + row * (cell_height + padding) + (cell_height - thumb.height) // 2
+        sheet.paste(thumb, (x, y))
+    return sheet
+
+
+# Extension et type MIME de chaque format Pillow
+FORMAT_INFO = {
+    "JPEG": ("jpg", "image/jpeg"),
+    "WEBP": ("webp", "image/webp"),
+    "AVIF": ("avif", "image/avif"),
+    "GIF": ("gif", "image/gif"),
+}
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """
+    Un profil d'encodage : format, qualité, taille maximale et poids visé.
+
+    max_frames et max_fps ne concernent que les templates animés (voir
+    utils.animation) ; le poids visé ne s'applique qu'aux images fixes.
+    """
+    name: str
+    format: str = "JPEG"
+    quality: int = 95
+    max_size: Optional[Tuple[int, int]] = None
+    target_bytes: Optional[int] = None
+    min_quality: int = 50
+    progressive: bool = False
+    max_frames: Optional[int] = None
+    max_fps: Optional[float] = None
+
+    def key(self) -> Dict:
+        """Paramètres qui déterminent le fichier produit (pour les empreintes de rendu)."""
+        return asdict(self)
+
+
+PROFILES: Dict[str, EncodingProfile] = {
+    # Pleine résolution et qualité : le rendu historique
+    "archive": EncodingProfile("archive", "JPEG", quality=95),
+    # Envoi dans un chat : réduit, progressif, au plus ~250 Ko ; animations allégées
+    "chat": EncodingProfile(
+        "chat", "JPEG", quality=85, max_size=(1280, 1280), target_bytes=250_000, progressive=True,
+        max_frames=48, max_fps=12,
+    ),
+    # Une vignette reste fixe, même pour un template animé
+    "thumbnail": EncodingProfile("thumbnail", "JPEG", quality=80, max_size=(320, 320), max_frames=1),
+    "webp": EncodingProfile("webp", "WEBP", quality=82, max_size=(1280, 1280), target_bytes=200_000, max_frames=48, max_fps=15),
+    "avif": EncodingProfile("avif", "AVIF", quality=60, max_size=(1280, 1280), target_bytes=150_000, min_quality=30),
+    # GIF animé lisible partout, réduit pour les chats
+    "gif": EncodingProfile("gif", "GIF", max_size=(480, 480), max_frames=48, max_fps=12),
+}
+
+
+@dataclass
+class EncodedImage:
+    """Une image encodée selon un profil."""
+    profile: str
+    buffer: io.BytesIO
+    format: str
+    size: Tuple[int, int]
+    quality: int
+    path: Optional[str] = None
+
+    @property
+    def extension(self) -> str:
+        return FORMAT_INFO[self.format][0]
+
+    @property
+    def mime_type(self) -> str:
+        return FORMAT_INFO[self.format][1]
+
+    @property
+    def data(self) -> memoryview:
+        """Le contenu encodé, sans copie."""
+        return self.buffer.getbuffer()
+
+
+def format_available(format: str) -> bool:
+    """Indique si Pillow sait encoder ce format (WebP et AVIF dépendent de la compilation)."""
+    if format in ("JPEG", "GIF"):
+        return True
+    return bool(features.check(format.lower()))
+
+
+def get_profile(profile: Union[str, EncodingProfile]) -> EncodingProfile:
+    """
+    Renvoie un profil d'après son nom.
+
+    Un format que Pillow ne sait pas encoder retombe sur le profil "chat" (JPEG),
+    en gardant le nom demandé.
+
+    Raises:
+        ValueError: Si le profil est inconnu
+    """
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError(f"Profil d'encodage inconnu: {profile} (attendu: {', '.join(PROFILES)})")
+        profile = PROFILES[profile]
+    if not format_available(profile.format):
+        return EncodingProfile(**{**asdict(PROFILES["chat"]), "name": profile.name})
+    return profile
+
+
+def scaled_size(size: Tuple[int, int], max_size: Optional[Tuple[int, int]]) -> Tuple[int, int]:
+    """
+    La taille d'une image réduite pour tenir dans max_size, proportions gardées.
+
+    Args:
+        size (Tuple[int, int]): La taille de l'image
+        max_size (Tuple[int, int], optional): La taille maximale (aucune réduction si None)
+
+    Returns:
+        Tuple[int, int]: La taille finale (jamais agrandie)
+    """
+    width, height = size
+    if max_size is None or (width <= max_size[0] and height <= max_size[1]):
+        return size
+    ratio = min(max_size[0] / width, max_size[1] / height)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+def _save(image: Image.Image, profile: EncodingProfile, quality: int) -> io.BytesIO:
+    """Un encodage avec les options du format."""
+    options = {"quality": quality}
+    if profile.format == "JPEG":
+        options.update(optimize=profile.progressive, progressive=profile.progressive)
+    elif profile.format == "WEBP":
+        options.update(method=4)
+    buffer = io.BytesIO()
+    image.save(buffer, profile.format, **options)
+    buffer.seek(0)
+    return buffer
+
+
+def encode_profile(image: Image.Image, profile: EncodingProfile) -> EncodedImage:
+    """
+    Encode une image (déjà à la bonne taille) selon un profil.
+
+    Avec un poids visé, la qualité est cherchée par dichotomie entre min_quality
+    et la qualité du profil ; la plus haute qui tient dans le poids l'emporte
+    (la qualité minimale si aucune ne tient).
+
+    Args:
+        image (Image.Image): L'image à encoder
+        profile (EncodingProfile): Le profil
+
+    Returns:
+        EncodedImage: L'image encodée
+    """
+    buffer = _save(image, profile, profile.quality)
+    quality = profile.quality
+    if profile.target_bytes is not None and buffer.getbuffer().nbytes > profile.target_bytes:
+        low, high = profile.min_quality, profile.quality - 1
+        best = None
+        while low <= high:
+            middle = (low + high) // 2
+            candidate = _save(image, profile, middle)
+            if candidate.getbuffer().nbytes <= profile.target_bytes:
+                best, low = (middle, candidate), middle + 1
+            else:
+                high = middle - 1
+        quality, buffer = best or (profile.min_quality, _save(image, profile, profile.min_quality))
+    return EncodedImage(profile.name, buffer, profile.format, image.size, quality)
+
+
+def encode_profiles(
+    image: Image.Image, profiles: Sequence[Union[str, EncodingProfile]]
+) -> Dict[str, EncodedImage]:
+    """
+    Encode une image rendue selon plusieurs profils en un passage.
+
+    Les profils sont traités de la plus grande à la plus petite taille : chaque
+    réduction part de la précédente plutôt que de l'image complète.
+
+    Args:
+        image (Image.Image): L'image rendue (RGB)
+        profiles (Sequence[Union[str, EncodingProfile]]): Les profils, par nom ou décrits
+
+    Returns:
+        Dict[str, EncodedImage]: Les encodages, dans l'ordre demandé
+    """
+    resolved = [get_profile(profile) for profile in profiles]
+
+    def area(profile: EncodingProfile) -> int:
+        if profile.max_size is None:
+            return image.width * image.height
+        return min(image.width * image.height, profile.max_size[0] * profile.max_size[1])
+
+    encoded = {}
+    previous = image
+    for profile in sorted(resolved, key=area, reverse=True):
+        scaled = image
+        target = scaled_size(image.size, profile.max_size)
+        if target != image.size:
+            # La réduction précédente suffit si elle reste plus grande que la cible
+            source = previous if previous.width >= target[0] and previous.height >= target[1] else image
+            # reducing_gap : réduction entière rapide (box) avant le filtre Lanczos, 2 à 4 fois plus rapide
+            scaled = previous = source.resize(target, Image.Resampling.LANCZOS, reducing_gap=1.5)
+        encoded[profile.name] = encode_profile(scaled, profile)
+    return {profile.name: encoded[profile.name] for profile in resolved}
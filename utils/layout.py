@@ -0,0 +1,321 @@
+"""
+Mise en page des captions dans les zones d'un template.
+
+Chaque mème peut décrire ses zones de texte dans memes.json :
+
+    "regions": [
+        {"box": [0.03, 0.02, 0.97, 0.30], "align": "center", "valign": "top", "max_lines": 2},
+        {"box": [0.03, 0.70, 0.97, 0.98], "valign": "bottom"}
+    ]
+
+`box` donne la zone en fractions de l'image (gauche, haut, droite, bas). Sans
+zones dans le catalogue, une disposition par défaut est déduite du format.
+Toutes les captions sont ajustées puis dessinées en un passage, avec les
+polices en cache et le même rendu de contour que les captions simples.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageFont
+
+from utils.font_cache import fit_font_size, get_font, get_font_metrics
+from utils.text_renderer import draw_caption, outline_size_for, shadow_offset_for
+
+ALIGNMENTS = ("left", "center", "right")
+VERTICAL_ALIGNMENTS = ("top", "middle", "bottom")
+# Interligne, en multiple de la taille de police
+LINE_SPACING = 1.15
+MIN_FONT_SIZE = 16
+
+
+@dataclass(frozen=True)
+class Region:
+    """Une zone de texte, en fractions de l'image."""
+    box: Tuple[float, float, float, float]
+    align: str = "center"
+    valign: str = "middle"
+    max_lines: int = 2
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Region":
+        """
+        Lit une zone décrite dans memes.json.
+
+        Raises:
+            ValueError: Si la zone est mal décrite
+        """
+        box = data.get("box")
+        if not isinstance(box, (list, tuple)) or len(box) != 4:
+            raise ValueError(f"Zone invalide, box doit contenir 4 fractions: {data!r}")
+        left, top, right, bottom = (float(value) for value in box)
+        if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+            raise ValueError(f"Zone invalide, box hors de l'image ou vide: {data!r}")
+        region = cls(
+            box=(left, top, right, bottom),
+            align=data.get("align", "center"),
+            valign=data.get("valign", "middle"),
+            max_lines=int(data.get("max_lines", 2)),
+        )
+        if region.align not in ALIGNMENTS or region.valign not in VERTICAL_ALIGNMENTS or region.max_lines < 1:
+            raise ValueError(f"Zone invalide (align, valign ou max_lines): {data!r}")
+        return region
+
+    def pixels(self, width: int, height: int) -> Tuple[int, int, int, int]:
+        """La zone en pixels pour une image de cette taille."""
+        left, top, right, bottom = self.box
+        return int(left * width), int(top * height), int(right * width), int(bottom * height)
+
+
+def _panel_regions(count: int) -> Tuple[Region, ...]:
+    """Panneaux empilés verticalement, texte dans le bas de chaque panneau (aucun si count < 1)."""
+    if count < 1:
+        return ()
+    band = 1 / count
+    return tuple(
+        Region((0.03, i * band + 0.55 * band, 0.97, (i + 1) * band - 0.02 * band), valign="bottom")
+        for i in range(count)
+    )
+
+
+# Disposition par défaut des formats à plusieurs captions
+DEFAULT_REGIONS: Dict[str, Tuple[Region, ...]] = {
+    "top_bottom": (
+        Region((0.03, 0.02, 0.97, 0.30), valign="top"),
+        Region((0.03, 0.70, 0.97, 0.98), valign="bottom"),
+    ),
+    "two_panels": _panel_regions(2),
+    "three_panels": _panel_regions(3),
+}
+
+
+def regions_for(meme_info: Optional[Dict], count: int) -> Optional[List[Region]]:
+    """
+    Renvoie les zones où placer les captions d'un mème.
+
+    Args:
+        meme_info (Dict, optional): L'entrée du catalogue
+        count (int): Le nombre de captions à placer
+
+    Returns:
+        Optional[List[Region]]: Les zones, ou None pour une caption simple sans
+            zone déclarée (placée en bas de l'image comme avant) ; aucune zone
+            sans caption à placer
+
+    Raises:
+        ValueError: Si le nombre de zones ne correspond pas au nombre de captions
+    """
+    meme_info = meme_info or {}
+    if count < 1:
+        return []
+    if meme_info.get("regions"):
+        regions = [Region.from_dict(region) for region in meme_info["regions"]]
+    elif count == 1 and meme_info.get("format", "single_caption") == "single_caption":
+        return None
+    elif meme_info.get("format") in DEFAULT_REGIONS:
+        regions = list(DEFAULT_REGIONS[meme_info["format"]])
+    else:
+        regions = list(_panel_regions(count))
+    if len(regions) != count:
+        raise ValueError(
+            f"{count} captions pour {len(regions)} zones (mème {meme_info.get('id', '?')})"
+        )
+    return regions
+
+
+@dataclass(frozen=True)
+class CaptionLayout:
+    """Une caption ajustée : la taille de police et les lignes."""
+    size: int
+    lines: Tuple[str, ...]
+
+
+def balanced_breaks(widths: Sequence[float], space: float, line_count: int) -> List[Tuple[int, int]]:
+    """
+    Répartit des mots en line_count lignes en minimisant la ligne la plus large.
+
+    Programmation dynamique sur les coupures (partition min-max) : les captions
+    font quelques mots, le coût en O(lignes x mots²) est négligeable.
+
+    Args:
+        widths (Sequence[float]): L'avancée de chaque mot
+        space (float): L'avancée d'une espace
+        line_count (int): Le nombre de lignes (au plus le nombre de mots)
+
+    Returns:
+        List[Tuple[int, int]]: Les intervalles [début, fin) de mots de chaque ligne
+    """
+    n = len(widths)
+    prefix = [0.0]
+    for width in widths:
+        prefix.append(prefix[-1] + width)
+
+    def line_width(i: int, j: int) -> float:
+        return prefix[j] - prefix[i] + (j - i - 1) * space
+
+    # best[k][j] : plus petite largeur maximale pour les j premiers mots en k lignes
+    inf = float("inf")
+    best = [[inf] * (n + 1) for _ in range(line_count + 1)]
+    cut = [[0] * (n + 1) for _ in range(line_count + 1)]
+    best[0][0] = 0.0
+    for k in range(1, line_count + 1):
+        for j in range(k, n - (line_count - k) + 1):
+            for i in range(k - 1, j):
+                cost = max(best[k - 1][i], line_width(i, j))
+                if cost < best[k][j]:
+                    best[k][j], cut[k][j] = cost, i
+
+    spans, j = [], n
+    for k in range(line_count, 0, -1):
+        spans.append((cut[k][j], j))
+        j = cut[k][j]
+    return spans[::-1]
+
+
+def block_height(font: ImageFont.FreeTypeFont, line_count: int) -> int:
+    """Hauteur d'un bloc de line_count lignes, telles que les place line_positions."""
+    ascent, descent = font.getmetrics()
+    return (line_count - 1) * int(font.size * LINE_SPACING) + ascent + descent
+
+
+@lru_cache(maxsize=4096)
+def fit_caption(
+    font_path: str,
+    text: str,
+    max_width: int,
+    max_height: int,
+    start_size: int,
+    max_lines: int = 2,
+    min_size: int = MIN_FONT_SIZE,
+    step: int = 2,
+) -> CaptionLayout:
+    """
+    Choisit ensemble les coupures de ligne et la taille de police.
+
+    Pour chaque nombre de lignes, les mots sont répartis en lignes équilibrées
+    d'après leurs avancées en cache, puis la ligne la plus large est ajustée
+    (fit_font_size) sous la hauteur disponible par ligne ; la taille descend
+    ensuite jusqu'à ce que le bloc entier (block_height) tienne dans
+    max_height. Le découpage qui permet la plus grande police l'emporte, à
+    égalité celui qui a le moins de lignes. Le résultat est mémorisé : un même
+    rendu ne refait aucun calcul.
+
+    Args:
+        font_path (str): Le chemin de la police
+        text (str): La caption
+        max_width (int): La largeur disponible
+        max_height (int): La hauteur disponible
+        start_size (int): La plus grande taille essayée
+        max_lines (int): Le nombre maximal de lignes
+        min_size (int): La taille minimale
+        step (int): Le pas de la grille des tailles
+
+    Returns:
+        CaptionLayout: La taille retenue et les lignes
+    """
+    words = text.split()
+    if not words:
+        return CaptionLayout(min_size, ("",))
+
+    # Une seule ligne : même ajustement qu'avant, la hauteur est celle de l'encre
+    best = CaptionLayout(
+        fit_font_size(font_path, " ".join(words), max_width, max_height, start_size, min_size=min_size, step=step),
+        (" ".join(words),),
+    )
+    metrics = get_font_metrics(font_path)
+    widths = [metrics.advance(word) for word in words]
+    space = metrics.advance(" ")
+    for line_count in range(2, min(max_lines, len(words)) + 1):
+        line_start = min(start_size, int(max_height / (line_count * LINE_SPACING)))
+        if line_start <= best.size:
+            # Plus de lignes ne peut plus donner une police plus grande
+            break
+        lines = tuple(" ".join(words[i:j]) for i, j in balanced_breaks(widths, space, line_count))
+        widest = max(lines, key=lambda line: metrics.reference_size(line)[0])
+        size = fit_font_size(font_path, widest, max_width, line_start, line_start, min_size=min_size, step=step)
+        while size > min_size and block_height(get_font(font_path, size), line_count) > max_height:
+            size = max(min_size, size - step)
+        if size > best.size:
+            best = CaptionLayout(size, lines)
+    return best
+
+
+def line_positions(
+    font: ImageFont.FreeTypeFont,
+    lines: Sequence[str],
+    box: Tuple[int, int, int, int],
+    align: str = "center",
+    valign: str = "bottom",
+) -> List[Tuple[int, int]]:
+    """
+    Place les lignes d'une caption dans une zone.
+
+    Args:
+        font (ImageFont.FreeTypeFont): La police, à la taille retenue
+        lines (Sequence[str]): Les lignes
+        box (Tuple[int, int, int, int]): La zone en pixels (gauche, haut, droite, bas)
+        align (str): "left", "center" ou "right"
+        valign (str): "top", "middle" ou "bottom"
+
+    Returns:
+        List[Tuple[int, int]]: La position de chaque ligne, comme pour ImageDraw.text
+    """
+    left, top, right, bottom = box
+    line_height = int(font.size * LINE_SPACING)
+    height = block_height(font, len(lines))
+
+    if valign == "top":
+        y = top
+    elif valign == "bottom":
+        y = bottom - height
+    else:
+        y = top + (bottom - top - height) // 2
+
+    positions = []
+    for line in lines:
+        ink_left, _, ink_right, _ = font.getbbox(line)
+        line_width = ink_right - ink_left
+        if align == "left":
+            x = left
+        elif align == "right":
+            x = right - line_width
+        else:
+            x = left + (right - left - line_width) // 2
+        positions.append((x - ink_left, y))
+        y += line_height
+    return positions
+
+
+def render_layout(
+    image: Image.Image,
+    texts: Sequence[str],
+    regions: Sequence[Region],
+    font_path: str,
+    fill: Tuple[int, int, int] = (255, 255, 255),
+) -> Image.Image:
+    """
+    Ajuste et dessine toutes les captions dans leurs zones.
+
+    Args:
+        image (Image.Image): L'image RGB à modifier (en place)
+        texts (Sequence[str]): Les captions, une par zone
+        regions (Sequence[Region]): Les zones
+        font_path (str): Le chemin de la police
+        fill (Tuple[int, int, int]): La couleur du texte
+
+    Returns:
+        Image.Image: L'image modifiée
+    """
+    for text, region in zip(texts, regions):
+        box = region.pixels(image.width, image.height)
+        height = box[3] - box[1]
+        layout = fit_caption(font_path, text, box[2] - box[0], height, int(height / LINE_SPACING), region.max_lines)
+        font = get_font(font_path, layout.size)
+        for line, position in zip(layout.lines, line_positions(font, layout.lines, box, region.align, region.valign)):
+            draw_caption(
+                image, position, line, font,
+                outline_size=outline_size_for(layout.size),
+                shadow_offset=shadow_offset_for(layout.size),
+                fill=fill,
+            )
+    return image
@@ -0,0 +1,228 @@
+"""
+Cache des templates décodés.
+
+Les images de data/img sont indexées une fois par identifiant (nom de fichier
+sans extension, insensible à la casse), décodées en RGB à la première demande
+puis gardées dans un cache LRU limité en octets. Chaque entrée peut aussi
+porter une copie réduite (résolution de travail) pour l'envoi dans les chats.
+D'un template animé, seule la première image est gardée, avec la durée de
+chaque image : les autres sont relues dans le fichier au moment du rendu.
+"""
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from utils.animation import frame_durations
+from utils.image_utils import resize_image
+
+# Par ordre de priorité quand plusieurs fichiers portent le même nom
+TEMPLATE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_WORKING_SIZE = (1280, 1280)
+
+
+def normalize_template_id(name: str) -> str:
+    """Forme canonique d'un identifiant (Unicode NFC, minuscules)."""
+    return unicodedata.normalize("NFC", name).lower()
+
+
+def _image_bytes(image: Optional[Image.Image]) -> int:
+    """Place occupée en mémoire par une image décodée."""
+    if image is None:
+        return 0
+    return image.width * image.height * len(image.getbands())
+
+
+class _Entry:
+    __slots__ = ("image", "working", "size", "durations")
+
+    def __init__(self, image: Image.Image, working: Optional[Image.Image], durations: Optional[List[int]] = None):
+        self.image = image
+        self.working = working
+        self.size = _image_bytes(image) + _image_bytes(working)
+        # Durée de chaque image d'un template animé (None pour une image fixe)
+        self.durations = durations
+
+
+def index_templates(meme_dir: str) -> Dict[str, str]:
+    """
+    Associe chaque identifiant de template à son fichier.
+
+    Args:
+        meme_dir (str): Le répertoire des templates
+
+    Returns:
+        Dict[str, str]: Identifiant normalisé -> chemin (PNG, puis JPEG, WebP et GIF en cas de doublon)
+    """
+    paths = {}
+    if os.path.isdir(meme_dir):
+        files = sorted(
+            (name for name in os.listdir(meme_dir)
+             if os.path.splitext(name)[1].lower() in TEMPLATE_EXTENSIONS),
+            key=lambda name: TEMPLATE_EXTENSIONS.index(os.path.splitext(name)[1].lower()),
+        )
+        for name in files:
+            paths.setdefault(normalize_template_id(os.path.splitext(name)[0]), os.path.join(meme_dir, name))
+    return paths
+
+
+class TemplateCache:
+    def __init__(
+        self,
+        meme_dir: str = "data/img",
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        working_size: Optional[Tuple[int, int]] = DEFAULT_WORKING_SIZE,
+    ):
+        """
+        Initialise le cache et indexe les fichiers du répertoire.
+
+        Args:
+            meme_dir (str): Le répertoire des templates
+            max_bytes (int): Le budget mémoire des images décodées
+            working_size (Tuple[int, int], optional): La taille maximale de la copie
+                de travail (None pour ne pas en construire)
+        """
+        self.meme_dir = meme_dir
+        self.max_bytes = max_bytes
+        self.working_size = working_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._paths: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.refresh_index()
+
+    def refresh_index(self) -> None:
+        """Reconstruit l'index identifiant -> fichier à partir du répertoire."""
+        paths = index_templates(self.meme_dir)
+        with self._lock:
+            self._paths = paths
+
+    def path_for(self, meme_id: str) -> str:
+        """
+        Renvoie le fichier d'un template.
+
+        Args:
+            meme_id (str): L'identifiant du mème
+
+        Returns:
+            str: Le chemin du fichier
+
+        Raises:
+            FileNotFoundError: Si aucun fichier ne correspond
+        """
+        path = self._paths.get(normalize_template_id(meme_id))
+        if path is None:
+            raise FileNotFoundError(
+                f"Image du mème {meme_id} non trouvée ({', '.join(TEMPLATE_EXTENSIONS)})"
+            )
+        return path
+
+    def _decode(self, meme_id: str) -> _Entry:
+        """Décode un template en RGB (sa première image s'il est animé) et prépare sa copie de travail."""
+        path = self.path_for(meme_id)
+        try:
+            with Image.open(path) as source:
+                image = source.convert("RGB")
+                durations = frame_durations(source)
+        except Exception as e:
+            raise ValueError(f"Erreur lors de l'ouverture de l'image {path}: {str(e)}")
+
+        working = None
+        if self.working_size is not None and (
+            image.width > self.working_size[0] or image.height > self.working_size[1]
+        ):
+            working = resize_image(image, self.working_size)
+        return _Entry(image, working, durations)
+
+    def _entry(self, meme_id: str) -> _Entry:
+        """Renvoie l'entrée du cache, en la décodant si besoin."""
+        key = normalize_template_id(meme_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = self._decode(meme_id)
+        if entry.size > self.max_bytes:
+            return entry
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self._bytes += entry.size
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        return entry
+
+    def get(self, meme_id: str, working: bool = False) -> Image.Image:
+        """
+        Renvoie une copie modifiable du template décodé.
+
+        Args:
+            meme_id (str): L'identifiant du mème
+            working (bool): Renvoyer la copie réduite plutôt que la pleine résolution
+
+        Returns:
+            Image.Image: Une copie RGB du template
+        """
+        entry = self._entry(meme_id)
+        image = entry.working if working and entry.working is not None else entry.image
+        return image.copy()
+
+    def durations(self, meme_id: str) -> Optional[List[int]]:
+        """
+        La durée de chaque image d'un template animé.
+
+        Args:
+            meme_id (str): L'identifiant du mème
+
+        Returns:
+            Optional[List[int]]: Les durées en millisecondes, ou None pour une image fixe
+        """
+        # Lecture sans compter de succès : le template vient normalement d'être chargé par get
+        with self._lock:
+            entry = self._entries.get(normalize_template_id(meme_id))
+        return (entry or self._entry(meme_id)).durations
+
+    def warm(self, meme_id: str) -> None:
+        """Décode un template à l'avance sans le copier."""
+        self._entry(meme_id)
+
+    def invalidate(self, meme_id: Optional[str] = None) -> None:
+        """
+        Retire un template du cache (tous si meme_id est None).
+
+        Args:
+            meme_id (str, optional): L'identifiant du mème
+        """
+        with self._lock:
+            if meme_id is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            entry = self._entries.pop(normalize_template_id(meme_id), None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def stats(self) -> Dict[str, int]:
+        """Occupation et efficacité du cache."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
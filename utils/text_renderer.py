@@ -0,0 +1,150 @@
+"""
+Rendu des captions avec contour et ombre portée en une seule passe.
+
+Le texte n'est rastérisé qu'une fois dans un masque. Le contour (losange) et
+l'ombre (carré décalé) sont obtenus en convoluant ce masque, ce qui reproduit
+les anciens draw.text répétés à chaque décalage, puis les trois couches sont
+composées d'un coup sur la zone de l'image concernée. Sur une image RGBA
+transparente, la même composition produit un calque de texte réutilisable
+(voir utils.animation).
+"""
+from typing import Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+def outline_size_for(font_size: int) -> int:
+    """Épaisseur du contour, proportionnelle à la taille de police."""
+    return max(2, font_size // 25)
+
+
+def shadow_offset_for(font_size: int) -> int:
+    """Décalage de l'ombre portée, proportionnel à la taille de police."""
+    return max(2, font_size // 30)
+
+
+def _outline_kernel(outline_size: int) -> np.ndarray:
+    """Élément structurant du contour : les décalages |dx| + |dy| <= outline_size + 1."""
+    r = np.arange(-outline_size, outline_size + 1)
+    return (np.abs(r)[:, None] + np.abs(r)[None, :] <= outline_size + 1).astype(np.uint8)
+
+
+def rasterize_text(text: str, font: ImageFont.FreeTypeFont, padding: int) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Rastérise le texte une seule fois dans un masque 8 bits.
+
+    Args:
+        text (str): Le texte à rastériser
+        font (ImageFont.FreeTypeFont): La police
+        padding (int): Marge autour du texte pour le contour et l'ombre
+
+    Returns:
+        Tuple[np.ndarray, Tuple[int, int]]: Le masque et la position du texte dans ce masque
+    """
+    left, top, right, bottom = font.getbbox(text)
+    size = (right - left + 2 * padding, bottom - top + 2 * padding)
+    mask = Image.new("L", size, 0)
+    origin = (padding - left, padding - top)
+    ImageDraw.Draw(mask).text(origin, text, font=font, fill=255)
+    return np.asarray(mask), origin
+
+
+def _coverage_log(mask: np.ndarray, kernel: np.ndarray, anchor: Tuple[int, int] = (-1, -1)) -> np.ndarray:
+    """
+    Log de la transparence laissée par le masque répété à chaque décalage du noyau.
+
+    Dessiner n fois le même texte noir revient à multiplier l'image par le
+    produit des (1 - alpha) : en passant au logarithme, ce produit devient une
+    simple convolution du masque par le noyau.
+    """
+    import cv2  # chargé au premier rendu : OpenCV alourdit l'import du module
+    log_transparency = np.log1p(-np.minimum(mask.astype(np.float32) / 255, 254.5 / 255))
+    return cv2.filter2D(log_transparency, -1, kernel.astype(np.float32), anchor=anchor, borderType=cv2.BORDER_CONSTANT)
+
+
+def render_text_layers(text: str, font: ImageFont.FreeTypeFont, outline_size: int, shadow_offset: int) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+    """
+    Construit l'opacité du texte et celle de sa partie noire (contour + ombre).
+
+    Args:
+        text (str): Le texte
+        font (ImageFont.FreeTypeFont): La police
+        outline_size (int): L'épaisseur du contour
+        shadow_offset (int): Le décalage de l'ombre
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, Tuple[int, int]]: L'opacité du texte, l'opacité
+            de la partie noire (float32 entre 0 et 1) et la position du texte dans ces masques
+    """
+    padding = max(outline_size + 1, 2 * shadow_offset)
+    text_mask, origin = rasterize_text(text, font, padding)
+
+    outline = _coverage_log(text_mask, _outline_kernel(outline_size))
+
+    # Ombre : copies décalées de shadow_offset à 2 * shadow_offset - 1, calculées
+    # avec un noyau carré ancré en bas à droite puis décalées de shadow_offset
+    shadow = _coverage_log(
+        text_mask,
+        np.ones((shadow_offset, shadow_offset), np.float32),
+        anchor=(shadow_offset - 1, shadow_offset - 1),
+    )
+    shifted = np.zeros_like(shadow)
+    shifted[shadow_offset:, shadow_offset:] = shadow[:-shadow_offset, :-shadow_offset]
+
+    black_alpha = 1 - np.exp(outline + shifted)
+    text_alpha = text_mask.astype(np.float32) / 255
+    return text_alpha, black_alpha, origin
+
+
+def draw_caption(
+    image: Image.Image,
+    position: Tuple[int, int],
+    text: str,
+    font: ImageFont.FreeTypeFont,
+    outline_size: int,
+    shadow_offset: int,
+    fill: Tuple[int, int, int] = (255, 255, 255),
+) -> Image.Image:
+    """
+    Dessine un texte blanc avec contour noir et ombre portée, en une composition.
+
+    Args:
+        image (Image.Image): L'image RGB, ou le calque RGBA, à modifier (en place)
+        position (Tuple[int, int]): La position du texte, comme pour ImageDraw.text
+        text (str): Le texte
+        font (ImageFont.FreeTypeFont): La police
+        outline_size (int): L'épaisseur du contour
+        shadow_offset (int): Le décalage de l'ombre
+        fill (Tuple[int, int, int]): La couleur du texte
+
+    Returns:
+        Image.Image: L'image modifiée
+    """
+    text_alpha, black_alpha, origin = render_text_layers(text, font, outline_size, shadow_offset)
+
+    # Coin haut gauche des masques dans l'image, puis intersection avec l'image
+    x0, y0 = position[0] - origin[0], position[1] - origin[1]
+    height, width = text_alpha.shape
+    left, top = max(x0, 0), max(y0, 0)
+    right, bottom = min(x0 + width, image.width), min(y0 + height, image.height)
+    if right <= left or bottom <= top:
+        return image
+
+    mask_box = (slice(top - y0, bottom - y0), slice(left - x0, right - x0))
+    text_alpha = text_alpha[mask_box][..., None]
+    black_alpha = black_alpha[mask_box][..., None]
+
+    region = np.asarray(image.crop((left, top, right, bottom)), dtype=np.float32)
+    keep = (1 - black_alpha) * (1 - text_alpha)
+    if image.mode == "RGBA":
+        # Calque : même composition en alpha prémultiplié, puis retour en alpha droit
+        alpha = region[..., 3:] / 255
+        color = region[..., :3] * alpha * keep + np.asarray(fill, np.float32) * text_alpha
+        alpha = 1 - (1 - alpha) * keep
+        color = color / np.maximum(alpha, 1e-6)
+        out = np.concatenate([color, alpha * 255], axis=-1)
+    else:
+        out = region * keep + np.asarray(fill, np.float32) * text_alpha
+    image.paste(Image.fromarray(np.clip(out + 0.5, 0, 255).astype(np.uint8), image.mode), (left, top))
+    return image